@@ -2,13 +2,15 @@
 @author: arcra
 '''
 
-import threading, time, types, Queue
+import threading, time, types, heapq, itertools, Queue
 import SharedVariables, ParallelSenders
 from Messages import Message, Command, Response
 from ConnectionManager import ConnectionManager
 from CommandParser import CommandParser
 
 ParallelSender = ParallelSenders.ParallelSender
+WaitAll = ParallelSenders.WaitAll
+AsCompleted = ParallelSenders.AsCompleted
 
 SharedVarTypes = SharedVariables.SharedVarTypes
 SubscriptionTypes = SharedVariables.SubscriptionTypes
@@ -28,14 +30,184 @@ _subscriptionHandlers = {}
 _incomingMessages = Queue.Queue(20)
 _receivedCommands = Queue.Queue(20)
 
-_receivedResponses = {}
-_responsesLock = threading.Lock()
-
-_sentCommands = set([])
+# Commands waiting for their response, command -> list of PendingCommand in the order
+# they were sent (commands without id, like write_var, share the key and get the
+# responses in that order), and the heap of
+# (deadline, sequence, PendingCommand) watched by the timeouts thread. Entries of the
+# heap whose deadline no longer matches the one of their command are stale and skipped.
+# _commandsCondition is notified when the earliest deadline changes.
+_sentCommands = {}
+_deadlines = []
+_deadlinesSequence = itertools.count()
 _commandsLock = threading.Lock()
+_commandsCondition = threading.Condition(_commandsLock)
+
+class PendingCommand(object):
+    '''
+    Command sent with SendAsync whose response is awaited. The attempts after the
+    first one are sent by the timeouts thread, so any number of commands can be in
+    flight without a thread each.
+    
+    response is None until the response arrives, and stays None if it never does.
+    '''
+    def __init__(self, command, timeout, attempts, callback):
+        self.command = command
+        self.timeout = timeout
+        self.attempts = attempts
+        self.currentAttempt = 0
+        self.response = None
+        self.deadline = None
+        self.__done = False
+        self.__callbacks = [callback] if callback else []
+        self.__finished = threading.Event()
+    
+    @property
+    def done(self):
+        '''
+        True once the response arrived, the last attempt timed out or it was cancelled.
+        '''
+        return self.__done
+    
+    def Wait(self, timeout=None):
+        '''
+        Blocks the calling thread until the command is done, or timeout seconds pass,
+        and returns its response.
+        '''
+        self.__finished.wait(timeout)
+        return self.response
+    
+    def AddCallback(self, callback):
+        '''
+        Adds a function to be called with the PendingCommand once it is done, right away
+        if it already is.
+        '''
+        _commandsLock.acquire()
+        done = self.__done
+        if not done:
+            self.__callbacks.append(callback)
+        _commandsLock.release()
+        
+        if done:
+            callback(self)
+    
+    def StopRetrying(self):
+        '''
+        Lets the current attempt finish without sending more.
+        '''
+        _commandsLock.acquire()
+        self.attempts = max(self.currentAttempt, 1)
+        _commandsLock.release()
+    
+    def Cancel(self):
+        '''
+        Stops waiting for the response without sending more attempts.
+        '''
+        _commandsLock.acquire()
+        finished = self._Finish(None)
+        _commandsLock.release()
+        
+        if finished:
+            self._RunCallback()
+    
+    def _Finish(self, response):
+        # _commandsLock must be held. Returns False if it was already done.
+        if self.__done:
+            return False
+        self.__done = True
+        self.response = response
+        self.deadline = None
+        waiting = _sentCommands.get(self.command)
+        if waiting is not None and self in waiting:
+            waiting.remove(self)
+            if not waiting:
+                del _sentCommands[self.command]
+        self.__finished.set()
+        return True
+    
+    def _RunCallback(self):
+        # Called once after _Finish, without _commandsLock held
+        for callback in self.__callbacks:
+            try:
+                callback(self)
+            except:
+                print "Callback of command '" + self.command.name + "' crashed."
+
+def _CompleteCommand(response):
+    '''
+    Hands a response to the PendingCommand waiting for it, the oldest one if several
+    share its name and id. Returns False if no command is waiting for it.
+    '''
+    global _commandsLock, _sentCommands
+    
+    _commandsLock.acquire()
+    waiting = _sentCommands.get(response)
+    pending = waiting[0] if waiting else None
+    finished = pending is not None and pending._Finish(response)
+    _commandsLock.release()
+    
+    if finished:
+        pending._RunCallback()
+    
+    return pending is not None
+
+def _SendAttempt(pending):
+    '''
+    Sends the command of pending once more and starts watching the timeout of the attempt.
+    '''
+    global _commandsLock, _commandsCondition, _deadlines, _sentCommands
+    
+    Send(pending.command)
+    
+    _commandsLock.acquire()
+    # The response may have arrived already, then there is nothing to watch
+    if not pending.done:
+        pending.deadline = time.time() + pending.timeout
+        heapq.heappush(_deadlines, (pending.deadline, next(_deadlinesSequence), pending))
+        if _deadlines[0][2] is pending:
+            _commandsCondition.notify()
+        
+        # Drops the stale entries of the commands that got their response, so fast
+        # responses to commands with long timeouts don't pile up in the heap
+        if len(_deadlines) > 2*len(_sentCommands) + 64:
+            _deadlines[:] = [e for e in _deadlines if e[2].deadline == e[0]]
+            heapq.heapify(_deadlines)
+    _commandsLock.release()
+
+def __TimeoutsThread():
+    global _commandsCondition, _deadlines
+    
+    _commandsCondition.acquire()
+    while True:
+        now = time.time()
+        retries = []
+        finished = []
+        while _deadlines and _deadlines[0][0] <= now:
+            deadline, _, pending = heapq.heappop(_deadlines)
+            if pending.deadline != deadline:
+                continue
+            if pending.attempts == 0 or pending.currentAttempt < pending.attempts:
+                pending.currentAttempt += 1
+                pending.deadline = None
+                retries.append(pending)
+            elif pending._Finish(None):
+                finished.append(pending)
+        
+        if retries or finished:
+            _commandsCondition.release()
+            for pending in finished:
+                pending._RunCallback()
+            for pending in retries:
+                _SendAttempt(pending)
+            _commandsCondition.acquire()
+            continue
+        
+        if _deadlines:
+            _commandsCondition.wait(_deadlines[0][0] - now)
+        else:
+            _commandsCondition.wait()
 
 def Initialize(port, functionMap={}, asyncHandler = None):
-    global __executors, __connMan, __parser, __p, __initialized, __ready
+    global __executors, __connMan, __parser, __p, __timeouts, __initialized, __ready
     
     __executors = { 'busy' : (lambda x: Response('busy'), False),
                       'ready' : (__isReady, False),
@@ -55,10 +227,13 @@ def Initialize(port, functionMap={}, asyncHandler = None):
     __p = threading.Thread(target=__MainThread)
     __p.daemon = True
     
+    __timeouts = threading.Thread(target=__TimeoutsThread)
+    __timeouts.daemon = True
+    
     __initialized = True
 
 def Start():
-    global __p, __connMann, __parser, __initialized, __started, __startedLock
+    global __p, __timeouts, __connMann, __parser, __initialized, __started, __startedLock
     
     if not __initialized:
         print 'pyRobotics need to be initialized before starting.'
@@ -67,6 +242,7 @@ def Start():
     __parser.Start()
     __connMan.Start()
     __p.start()
+    __timeouts.start()
     
     __startedLock.acquire()
     __started = True
@@ -153,16 +329,17 @@ def Send(message):
     
     return False
 
-def SendAndWait(command, timeout=300000, attempts = 1):
-    global _commandsLock, _sentCommands, _responsesLock, _receivedResponses, __started, __startedLock
+def SendAsync(command, timeout=300000, attempts=1, callback=None):
+    global _commandsLock, _sentCommands, __started, __startedLock
     '''
-    Sends a command and wait for the answer. This blocks the execution of the calling thread.
+    Sends a command and returns right away a PendingCommand to wait for the answer,
+    without using a thread while the command is in flight.
     
     Params:
     command - Command to be sent, must be an instance of class Command.
-    timeout - (Default 300) How much time (in seconds) to wait for response before trying again or aborting.
-    attempts - (Default 1) How many attempts to send the command if no response is received after timeout.
-                If attempts is 0, it will keep trying indefinitely. (Not recommended)
+    timeout, attempts - As in SendAndWait.
+    callback - (Optional) Function called with the PendingCommand once it is done. It runs
+                in the thread that parsed the response or watched the timeout, so it shouldn't block.
     '''
     
     __startedLock.acquire()
@@ -177,34 +354,34 @@ def SendAndWait(command, timeout=300000, attempts = 1):
         print "Message should be an instance of class Command. Message not sent."
         return None
     
+    pending = PendingCommand(command, timeout/1000.0, attempts, callback)
+    pending.currentAttempt = 1
+    
     _commandsLock.acquire()
-    _sentCommands.add(command)
+    _sentCommands.setdefault(command, []).append(pending)
     _commandsLock.release()
     
-    currentAttempt = 0
-    
-    timeout = timeout/1000.0
+    _SendAttempt(pending)
     
-    response = None
+    return pending
+
+def SendAndWait(command, timeout=300000, attempts = 1):
+    '''
+    Sends a command and wait for the answer. This blocks the execution of the calling thread,
+    which is woken up as soon as the response is parsed.
     
-    while not response and currentAttempt < attempts:
-        Send(command)
-        newTimeout = time.time() + timeout
-        currentAttempt += 1
-        while time.time() < newTimeout:
-            _responsesLock.acquire()
-            if command in _receivedResponses:
-                response = _receivedResponses.pop(command)
-            _responsesLock.release()
-            if response:
-                break
-            time.sleep(0.3)
+    Params:
+    command - Command to be sent, must be an instance of class Command.
+    timeout - (Default 300000) How much time (in milliseconds) to wait for response before trying again or aborting.
+    attempts - (Default 1) How many attempts to send the command if no response is received after timeout.
+                If attempts is 0, it will keep trying indefinitely. (Not recommended)
+    '''
     
-    _commandsLock.acquire()
-    _sentCommands.remove(command)
-    _commandsLock.release()
+    pending = SendAsync(command, timeout, attempts)
+    if pending is None:
+        return None
     
-    return response
+    return pending.Wait()
 
 def ReadSharedVar(name):
     global __started, __startedLock
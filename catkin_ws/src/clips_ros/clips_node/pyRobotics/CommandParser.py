@@ -3,7 +3,7 @@
 '''
 
 import threading, BB
-from Messages import Command, Response
+from Messages import MessageTypes, ParseMessage
 from SharedVariables import SharedVar
 
 class CommandParser(object):
@@ -24,8 +24,23 @@ class CommandParser(object):
             
             data = BB._incomingMessages.get()
             
-            el = SharedVar.Parse(data)
-            if el and el.isNotification:
+            el = ParseMessage(data)
+            if not el:
+                print 'Invalid message received: ' + data + '_len(' + str(len(data)) + ')'
+                continue
+            
+            if el.type == MessageTypes.COMMAND:
+                BB._receivedCommands.put(el)
+                continue
+            
+            if el.name == 'read_var':
+                var = SharedVar.FromResponse(el)
+                if var:
+                    el = var
+                else:
+                    print "Something that wasn't supposed to happen happened"
+            
+            if el.isNotification:
                 handler = None
                 BB._subscriptionHandlersLock.acquire()
                 if el.varName in BB._subscriptionHandlers:
@@ -42,26 +57,10 @@ class CommandParser(object):
                     print 'Handler for shared var: "' + el.varName + '" crashed.'
                 
                 continue
-            if not el:
-                el = Response.Parse(data)
-                if el:
-                    print "Something that wasn't supposed to happen happened"
-            if el:
-                BB._commandsLock.acquire()
-                if el in BB._sentCommands:
-                    BB._responsesLock.acquire()
-                    BB._receivedResponses[el] = el
-                    BB._responsesLock.release()
-                elif self.__asyncHandler:
-                    self.__asyncHandler(el)
-                else:
-                    print 'Response without awaiting command: ' + repr(el)
-                BB._commandsLock.release()
-                continue
-            el = Command.Parse(data)
-            if el:
-                BB._receivedCommands.put(el)
-                continue
-            
-            print 'Invalid message received: ' + data + '_len(' + str(len(data)) + ')'
             
+            if BB._CompleteCommand(el):
+                pass
+            elif self.__asyncHandler:
+                self.__asyncHandler(el)
+            else:
+                print 'Response without awaiting command: ' + repr(el)
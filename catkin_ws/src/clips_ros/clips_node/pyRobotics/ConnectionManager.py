@@ -2,23 +2,90 @@
 @author: arcra
 '''
 
-import socket, threading
+import errno, select, socket, threading
 import BB
 
+class FrameDecoder(object):
+    '''
+    Splits the stream received from the blackboard into the messages it carries,
+    each one terminated by a NUL character. The bytes after the last NUL are kept
+    until the rest of their message arrives, so a message split across several
+    recv calls is delivered whole.
+    
+    Received data is appended to a single bytearray where only the new bytes are
+    searched for the last NUL; the complete messages before it are copied out and
+    split at once, so the cost is linear in the data received however it is cut.
+    
+    A message longer than maxFrameSize bytes is dropped (up to its NUL) instead of
+    growing the buffer without limit; droppedFrames counts them.
+    '''
+    def __init__(self, maxFrameSize=1048576):
+        self.maxFrameSize = maxFrameSize
+        self.droppedFrames = 0
+        self.__buffer = bytearray()
+        self.__scanned = 0
+        self.__discarding = False
+    
+    def Feed(self, data):
+        '''
+        Adds received data and returns the list of messages completed by it,
+        stripped and without the empty ones.
+        '''
+        buf = self.__buffer
+        buf.extend(data)
+        
+        frames = []
+        last = buf.rfind(b'\0', self.__scanned)
+        if last != -1:
+            items = bytes(buf[:last]).split(b'\0')
+            del buf[:last + 1]
+            if self.__discarding:
+                # The end of a message that was already too long
+                del items[0]
+                self.__discarding = False
+            for item in items:
+                if len(item) > self.maxFrameSize:
+                    self.droppedFrames += 1
+                    continue
+                item = item.strip()
+                if item:
+                    frames.append(item)
+        
+        self.__scanned = len(buf)
+        
+        if len(buf) > self.maxFrameSize:
+            if not self.__discarding:
+                self.droppedFrames += 1
+                self.__discarding = True
+            del buf[:]
+            self.__scanned = 0
+        
+        return frames
+
 class ConnectionManager(object):
     '''
     Manages socket listening (waiting for blackboard or other client to connect),
-    as well as sending messages and asynchronous receiving. It sends and receives
-    through different socket objects to avoid problems related to multiprocessing.
+    as well as sending messages and asynchronous receiving.
+    
+    The socket is non-blocking: Send writes what the socket accepts right away and
+    leaves the rest to the sending thread, which writes it when the socket is
+    writable, so a slow blackboard doesn't block the threads that send. Nothing is
+    dropped when one side is slower than the other. Received messages wait until the
+    parser takes them (the socket is not read meanwhile, so TCP flow control slows
+    the blackboard down), and Send blocks while more than maxPendingOutput bytes
+    are waiting to be written.
     '''
-    def __init__(self, port):
+    def __init__(self, port, maxPendingOutput=1048576):
         '''
         Instanciates the ConnectionManager class.
         
         Params:
         port - Is the port to which the socket will be bound to listen for incoming connections.
+        maxPendingOutput - (Default 1 MB) Bytes waiting to be written above which Send blocks.
         '''
         self.port = port
+        self.maxPendingOutput = maxPendingOutput
+        self.sock = None
         self.__clientIsConnected = False
         self.__cicLock = threading.Lock()
         
@@ -26,9 +93,20 @@ class ConnectionManager(object):
         
         self.__connEstablishedCondition = threading.Event()
         
+        self.__decoder = FrameDecoder()
+        
+        # Bytes that Send couldn't write right away. __outputCondition guards them
+        # along with sock, and is notified when bytes are added or written and when
+        # the connection changes.
+        self.__output = bytearray()
+        self.__outputCondition = threading.Condition()
+        
         self.listeningThread = threading.Thread(target=self.__receivingThread)
         self.listeningThread.daemon = True
         
+        self.sendingThread = threading.Thread(target=self.__sendingThread)
+        self.sendingThread.daemon = True
+        
     def __buildListenintSocket(self):
         self.listeningSock = socket.socket()
         self.listeningSock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -37,27 +115,39 @@ class ConnectionManager(object):
 
     def Start(self):
         
-        self.sock, self.remoteAddress = self.listeningSock.accept()
-        
-        self.clientIsConnected = True
-        print 'Blackboard connected from {}'.format(self.remoteAddress)
+        self.__accept()
         
         self.__connEstablishedCondition.clear()
         self.listeningThread.start()
+        self.sendingThread.start()
         
         self.__connEstablishedCondition.wait()
         
-        self.listeningSock.close()
-        
     def __accept(self):
         
-        self.sock, self.remoteAddress = self.listeningSock.accept()
+        sock, self.remoteAddress = self.listeningSock.accept()
+        sock.setblocking(0)
         
+        self.__outputCondition.acquire()
+        self.sock = sock
         self.clientIsConnected = True
+        self.__outputCondition.notifyAll()
+        self.__outputCondition.release()
+        
         print 'Blackboard connected from {}'.format(self.remoteAddress)
         
         self.listeningSock.close()
         
+    def __disconnect(self):
+        
+        self.__outputCondition.acquire()
+        self.clientIsConnected = False
+        self.sock.close()
+        # What was not written is lost with the connection
+        del self.__output[:]
+        self.__outputCondition.notifyAll()
+        self.__outputCondition.release()
+        
     @property
     def clientIsConnected(self):
         self.__cicLock.acquire()
@@ -79,47 +169,84 @@ class ConnectionManager(object):
             if not self.clientIsConnected:
                 self.__buildListenintSocket()
                 self.__accept()
+                # A message cut by the disconnection is not completed by the new connection
+                self.__decoder = FrameDecoder()
 
             try:
-                data = self.sock.recv(4096)
-            except:
-                self.sock.close()
+                select.select([self.sock], [], [])
+                data = self.sock.recv(65536)
+            except (socket.error, select.error), e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    continue
                 data = ''
             if data == '':
                 print 'Client disconnected.'
-                self.clientIsConnected = False
+                self.__disconnect()
                 continue
             
             #print 'rcvd: ' + data
-            while data:
+            for item in self.__decoder.Feed(data):
+                # Blocks while the parser is behind instead of dropping messages
+                BB._incomingMessages.put(item)
+    
+    def __sendingThread(self):
+        
+        while True:
+            self.__outputCondition.acquire()
+            while not self.__output:
+                self.__outputCondition.wait()
+            sock = self.sock
+            self.__outputCondition.release()
+            
+            try:
+                select.select([], [sock], [])
+            except (socket.error, select.error):
+                # The socket was closed by a disconnection, its output is gone
+                continue
+            
+            self.__outputCondition.acquire()
+            if sock is self.sock and self.__output:
                 try:
-                    pos = data.find('\0')
-                    if pos == -1:
-                        pos = len(data)
-                    item = data[:pos].strip()
-                    BB._incomingMessages.put(item, True, 5)
-                    data = data[pos+1:]
-                except:
-                    print 'Could not enqueue message: ' + data[:pos]
+                    sent = sock.send(self.__output)
+                    del self.__output[:sent]
+                except socket.error, e:
+                    if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                        print 'Something went bad while sending messages, {} bytes lost.'.format(len(self.__output))
+                        del self.__output[:]
+                self.__outputCondition.notifyAll()
+            self.__outputCondition.release()
     
     def Send(self, message):
         
+        data = repr(message) + '\0'
+        result = True
+        
+        self.__outputCondition.acquire()
+        
+        while self.clientIsConnected and len(self.__output) > self.maxPendingOutput:
+            self.__outputCondition.wait()
+        
         if not self.clientIsConnected:
             print 'Unable to send message, blackboard not connected'
-            return None
-        
-        try:
-            #print 'sending: ' + repr(message)
-            sent = self.sock.send(repr(message) + '\0')
-        except:
-            print 'Something went bad while sending a message.'
-            print '[Message:] ' + str(message)
-            print type(message)
-            return False
-        
-        if sent != len(repr(message)) + 1:
-            print 'Message was sent incomplete.'
-            return False
-        
-        return True
-            
+            result = None
+        elif self.__output:
+            # Written after what is already waiting
+            self.__output.extend(data)
+        else:
+            try:
+                #print 'sending: ' + repr(message)
+                sent = self.sock.send(data)
+            except socket.error, e:
+                sent = 0
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    print 'Something went bad while sending a message.'
+                    print '[Message:] ' + str(message)
+                    print type(message)
+                    result = False
+            if result and sent < len(data):
+                self.__output.extend(data[sent:])
+                self.__outputCondition.notifyAll()
+        
+        self.__outputCondition.release()
+        
+        return result
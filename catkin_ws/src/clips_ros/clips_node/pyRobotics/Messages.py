@@ -85,6 +85,13 @@ class Command(Message):
         if sParams:
             sParams = sParams.replace("\\\"", "\"")
         return Command(sCommand, sParams, idNum)
+    
+    @classmethod
+    def _FromGroups(cls, name, params, idNum):
+        # Same Command that Parse gives for the groups of its expression
+        if params:
+            params = params.replace("\\\"", "\"")
+        return Command(name.lower(), params, idNum)
 
 class Response(Message):
     
@@ -102,7 +109,7 @@ class Response(Message):
             return None
         
         sCommand = m.group('cmd').lower()
-        sParams = m.group('params').strip()
+        sParams = (m.group('params') or '').strip()
         sId = m.group('id')
         sResult = m.group('result')
         idNum = -1
@@ -120,6 +127,15 @@ class Response(Message):
         r._id = idNum
         return r
     
+    @classmethod
+    def _FromGroups(cls, name, params, result, idNum):
+        # Same Response that Parse gives for the groups of its expression
+        if params:
+            params = params.strip().replace("\\\"", "\"")
+        r = Response(name.lower(), int(result == '1'), params)
+        r._id = idNum
+        return r
+    
     @classmethod
     def FromCommandObject(cls, commandObj, successful = False, response = None):
         
@@ -131,4 +147,29 @@ class Response(Message):
         
         r = cls(commandObj.name, successful, response)
         r._id = commandObj._id
-        return r
\ No newline at end of file
+        return r
+
+# Command and Response in one expression, the ones with result are responses. Params
+# end at the first quote not escaped by a backslash, which is the first alternative
+# their own expressions try, so a message that matches is classified and split the
+# same as trying Response.Parse and then Command.Parse. Unlike (\\.|[^"])* the params
+# don't backtrack one character at a time; the odd messages that only match ending
+# at an escaped quote are left to those expressions.
+_messageRx = re.compile(r'^((?P<src>[A-Za-z][A-Za-z\-]*)\s+)?(?P<cmd>[A-Za-z_]+)(\s+"(?P<params>[^"\\]*(\\.[^"\\]*)*)")?(\s+(?P<result>[10]))?(\s+@(?P<id>\d+))?$')
+
+def ParseMessage(s):
+    '''
+    Parses a message received from the blackboard into a Command or a Response, or
+    None if it is neither. The message is matched once and built by the decoder of
+    its kind, instead of trying the regular expression of every kind.
+    '''
+    m = _messageRx.match(s)
+    if not m:
+        r = Response.Parse(s)
+        return r if r else Command.Parse(s)
+    
+    name, params, result, sId = m.group('cmd', 'params', 'result', 'id')
+    idNum = int(sId) if sId else -1
+    if result is None:
+        return Command._FromGroups(name, params, idNum)
+    return Response._FromGroups(name, params, result, idNum)
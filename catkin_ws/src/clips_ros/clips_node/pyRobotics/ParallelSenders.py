@@ -1,11 +1,13 @@
 '''
 @author: arcra
 '''
-import threading, BB
+import time, Queue, BB
 
 class ParallelSender(object):
     '''
-        
+    Command sent in parallel to other thread's execution, whose response can be polled
+    or awaited. It doesn't use a thread: the command is a BB.PendingCommand, retried by
+    the timeouts thread of BB, so rules can send any number of commands at once.
     '''
 
     def __init__(self, command, timeout = 300, attempts = 1):
@@ -19,71 +21,71 @@ class ParallelSender(object):
         attempts - (Default 1) How many attempts to send the command if no response is received after timeout.
                     If attempts is 0, it will keep trying indefinitely until StopSending is called.
         '''
-        self.__sendingLock = threading.Lock()
-        self.__sending = True
-        
-        self.__respLock = threading.Lock()
-        self.__response = None
-    
         self.__command = command
-        
-        self.__attemptsLock = threading.Lock()
-        self.__attempts = attempts
-        
-        self.__timeout = timeout
-        
-        self.__p = threading.Thread(target=self.__Execute)
-        self.__p.daemon = True
-        self.__p.start()
+        self.__pending = BB.SendAsync(command, timeout, attempts)
         
     @property
     def sending(self):
-        self.__sendingLock.acquire()
-        r = self.__sending
-        self.__sendingLock.release()
-        return r
-    
-    def __setSending(self, s):
-        self.__sendingLock.acquire()
-        self.__sending = s
-        self.__sendingLock.release()
+        return self.__pending is not None and not self.__pending.done
     
     @property
     def response(self):
-        if not self.__respLock.acquire(False):
+        if self.__pending is None:
             return None
-        r = self.__response
-        self.__respLock.release()
-        return r
-    
-    def __setResponse(self, R):
-        self.__respLock.acquire()
-        self.__response = R
-        self.__respLock.release()
+        return self.__pending.response
     
     def StopSending(self):
-        self.__attemptsLock.acquire()
-        self.__attempts = 1
-        self.__attemptsLock.release()
-        
-    def __Execute(self):
-        
-        response = None
-        
-        currentAttempt = 0
-        
-        self.__attemptsLock.acquire()
-        att = self.__attempts
-        self.__attemptsLock.release()
-        
-        while not response and (att == 0 or currentAttempt < att):
-            currentAttempt += 1
-            response = BB.SendAndWait(self.__command, self.__timeout)
-            
-            self.__attemptsLock.acquire()
-            att = self.__attempts
-            self.__attemptsLock.release()
-        
-        self.__setResponse(response)
-        self.__setSending(False)
-        
\ No newline at end of file
+        if self.__pending is not None:
+            self.__pending.StopRetrying()
+    
+    def Wait(self, timeout=None):
+        '''
+        Blocks until the response is received or the last attempt times out, or timeout
+        seconds pass, and returns the response (None if there isn't one yet).
+        '''
+        if self.__pending is None:
+            return None
+        return self.__pending.Wait(timeout)
+    
+    def AddCallback(self, callback):
+        '''
+        Adds a function to be called with this ParallelSender once it stops sending,
+        right away if it already did. It runs in a thread of pyRobotics, so it shouldn't block.
+        '''
+        if self.__pending is None:
+            callback(self)
+        else:
+            self.__pending.AddCallback(lambda pending: callback(self))
+
+def WaitAll(senders, timeout=None):
+    '''
+    Waits until every ParallelSender in senders stops sending, or timeout seconds pass,
+    and returns their responses in the same order (None for the ones without response).
+    '''
+    deadline = None if timeout is None else time.time() + timeout
+    for s in senders:
+        if deadline is None:
+            s.Wait()
+        else:
+            s.Wait(max(deadline - time.time(), 0))
+    return [s.response for s in senders]
+
+def AsCompleted(senders, timeout=None):
+    '''
+    Yields the ParallelSenders in senders as they stop sending, the first ones to get
+    their response first. Stops when all of them were yielded or timeout seconds pass.
+    '''
+    senders = list(senders)
+    completed = Queue.Queue()
+    for s in senders:
+        s.AddCallback(completed.put)
+    
+    deadline = None if timeout is None else time.time() + timeout
+    for _ in senders:
+        try:
+            if deadline is None:
+                yield completed.get()
+            else:
+                yield completed.get(True, max(deadline - time.time(), 0))
+        except Queue.Empty:
+            return
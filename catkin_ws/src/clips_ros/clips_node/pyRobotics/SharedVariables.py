@@ -22,6 +22,13 @@ class SharedVar(Message):
         if not (r and r.name == 'read_var'):
             return r
         
+        return SharedVar.FromResponse(r)
+    
+    @classmethod
+    def FromResponse(cls, r):
+        '''
+        Decodes the shared variable carried by a read_var Response, None if it fails.
+        '''
         var = SharedVar(r)
         
         m = SharedVar.__rx.match(var.params)
@@ -18,18 +18,27 @@ import threading
 import ttk
 import time
 import math
-from PIL import Image
-from PIL import ImageDraw
 import tkMessageBox
 import os
 import numpy as np
 import subprocess
 from aux_stats import calculate_statistics, calculate_errors
+from error_tests import HistoryBuffer, results_path, write_results
+from strip_plot import StripPlot
 from grid_manager import GridManager
+from raycasting import RayCaster
+from polar_depth import PolarDepthCache
+from bvh import PolygonBVH
+from world import load_world, load_graph
+from robot_sprite import RobotSprite, LaserPool
+from topology_overlay import OverlayCache, render_topology, render_path
 
 BEHAVIOUR_TEST_TWIST = 21
 BEHAVIOUR_TEST_ADVANCE = 20
 
+RENDER_FPS = 60             # Frames per second of the robot animation
+MAX_ANIMATION_FRAMES = 30   # Longest animation of a single rotation or advance
+
 
 def set_entry(entry, text):
     initial_state = entry['state']
@@ -120,8 +129,12 @@ class MobileRobotSimulator(threading.Thread):
 
         self.polygonMap = []
         self.nodes_image = None
+        self.overlay_cache = OverlayCache()
+        self.polar_depth = PolarDepthCache()  #Depth around the robot while it only turns
         self.light = -1
-        self.robot = -1
+        self.robot_sprite = None  #Canvas items of the robot, created in gui_init
+        self.other_sprites = {}  #Sprites of the other robots of a RobotRegistry, by name
+        self.laser_pool = None    #Canvas items of the sensor rays, created in gui_init
 
         self.flagOnce = False
 
@@ -159,18 +172,22 @@ class MobileRobotSimulator(threading.Thread):
         self.num_polygons = 0  #How many polygons exist in the field.
         self.polygons = []       #Stors polygons vertexes
         self.polygons_mm = []  #Stors 2 vertexses  for each polygon the maximum and minimum  x and y  points.
+        self.obstacles = PolygonBVH()  #AABB tree over the polygons in meters, used by every geometric query
+        self.ray_caster = RayCaster()  #Edges of the polygons in meters packed for raycasting
 
         self.objects_data = []
         self.grasp_id = False
-        self.current_object = -1;
-        self.current_object_name = -1;
+
+        # Snapshot of the widgets read by get_parameters, replaced (never
+        # modified) by refresh_parameters every time one of them changes
+        self.widget_parameters = (0.0, 0.0, 0.0, 0, 0.0, 0.0, 0.0, "NOT FOUND", False, -1, False, False, False, False, False)
+        self.parameter_vars = []
 
         self.initX = 0
         self.initY = 0
         self.initR = 0
 
         self.steps_aux = 0
-        self.posible_collision = [None] * 512;
         self.sensors_value = [None] * 512
 
         self.movement = []
@@ -192,114 +209,51 @@ class MobileRobotSimulator(threading.Thread):
 
 
     def get_parameters(self): # It returns the parameters of simulation to be publish by a ROS topic
-        parameters = []
-
-        try:
-            parameters.append(self.robotX*self.mapX / self.canvasX  )
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append( self.mapY  - (self.robotY)*self.mapX / self.canvasY )
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append(self.robot_theta)
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append(float(self.entryRadio.get()))
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append( float(self.entryAdvance.get()))
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append( float(self.entryTurnAngle.get()))
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append( int(self.entryNumSensors.get()))
-        except ValueError:
-            parameters.append(0)
-        try:
-            parameters.append( float(self.entryOrigin.get()))
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append( float(self.entryRange.get()))
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append( float(self.entryValue.get()))
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append( str(self.entryFile.get()))
-        except ValueError:
-            parameters.append("NOT FOUND")
-        try:
-            parameters.append( bool(self.varAddNoise.get() ))
-        except ValueError:
-            parameters.append(False)
-        try:
-            parameters.append( float(self.light_x))
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append( float(self.light_y))
-        except ValueError:
-            parameters.append(0.0)
-        try:
-            parameters.append( bool(self.startFlag ))
-        except ValueError:
-            parameters.append(False)
-        try:
-            parameters.append( int(self.entryBehavior.get() ))
-        except ValueError:
-            parameters.append(-1)
-        try:
-            parameters.append( bool(self.varTurtleBot.get()) )
-        except ValueError:
-            if self.varTurtleBot.get()==1:
-                parameters.append( True )
-            else:
-                parameters.append( False )
-        try:
-            parameters.append( bool(self.varLidar.get()) )
-        except ValueError:
-            if self.varLidar.get()==1:
-                parameters.append( True )
-            else:
-                parameters.append( False )
-        try:
-            parameters.append( bool(self.varSArray.get()) )
-        except ValueError:
-            if self.varSArray.get()==1:
-                parameters.append( True )
-            else:
-                parameters.append( False )
-        try:
-            parameters.append( bool(self.varLight1.get()) )
-        except ValueError:
-            if self.varLight1.get()==1:
-                parameters.append( True )
-            else:
-                parameters.append( False )
-        try:
-            parameters.append( bool(self.varLight2.get()) )
-        except ValueError:
-            if self.varLight2.get()==1:
-                parameters.append( True )
-            else:
-                parameters.append( False )
-        try:
-            parameters.append(self.movement)
-        except ValueError:
-            parameters.append([])
+        # Only attributes and the snapshot of the widgets are read, so it can
+        # be called from any thread without going through Tk
+        widgets = self.widget_parameters
+        parameters = [ self.robotX*self.mapX / self.canvasX,
+                       self.mapY  - (self.robotY)*self.mapX / self.canvasY,
+                       self.robot_theta ]
+        parameters.extend(widgets[0:9])   # Robot, laser, world and noise
+        parameters.extend([ float(self.light_x), float(self.light_y), bool(self.startFlag) ])
+        parameters.extend(widgets[9:])    # Behavior, real robot and lights
+        parameters.append(self.movement)
 
         return parameters
 
+    def watch_parameters(self): # It makes every widget read by get_parameters refresh the snapshot when it changes
+        entries = (self.entryRadio, self.entryAdvance, self.entryTurnAngle, self.entryNumSensors, self.entryOrigin,
+                   self.entryRange, self.entryValue, self.entryFile, self.entryBehavior)
+        for entry in entries:
+            # The text variable sees the changes made by code too, not only the ones typed
+            var = StringVar(value=entry.get())
+            entry.configure(textvariable=var)
+            var.trace("w", self.refresh_parameters)
+            self.parameter_vars.append(var)
+
+        for var in (self.varAddNoise, self.varTurtleBot, self.varLidar, self.varSArray, self.varLight1, self.varLight2):
+            var.trace("w", self.refresh_parameters)
+
+        self.refresh_parameters()
+
+    def refresh_parameters(self, *args): # It takes a new snapshot of the widgets read by get_parameters
+        readers = ( (self.entryRadio.get, float), (self.entryAdvance.get, float), (self.entryTurnAngle.get, float),
+                    (self.entryNumSensors.get, int), (self.entryOrigin.get, float), (self.entryRange.get, float),
+                    (self.entryValue.get, float), (self.entryFile.get, str), (self.varAddNoise.get, bool),
+                    (self.entryBehavior.get, int), (self.varTurtleBot.get, bool), (self.varLidar.get, bool),
+                    (self.varSArray.get, bool), (self.varLight1.get, bool), (self.varLight2.get, bool) )
+        values = []
+        for (read, convert), previous in zip(readers, self.widget_parameters):
+            try:
+                values.append(convert(read()))
+            except (ValueError, TclError):
+                # An entry in the middle of an edit (e.g. between delete and
+                # insert) keeps its last valid value
+                values.append(previous)
+
+        self.widget_parameters = tuple(values)
+
 
 
 ##########################################
@@ -311,53 +265,11 @@ class MobileRobotSimulator(threading.Thread):
 ##########################################
 
     def print_graph(self,*args): # Plots graphs such as Dijkstra, DFS, A* and more (The graph is passed by a ROS service from motion_planner node)
-            flagOnce=True;
-            numNode_=1
             self.w.delete(self.nodes_image)
-            nodes_coords = []
-            image = Image.new('RGBA', (self.canvasX, self.canvasY))
-            draw = ImageDraw.Draw(image)
-            map_file = open(self.rospack.get_path('simulator')+'/src/data/'+self.entryFile.get()+'/'+self.entryFile.get()+'.top','r')  #Open file
-            lines = map_file.readlines()                          #Split the file in lines
-            for line in lines:                                       #To read line by line
-                words = line.split()                              #To split  words
-                if words:                                          #To avoid empty lines
-                    if words[0] == "(":                              #To avoid coments
-                        if words[1] == "num":              #To get world dimensions
-                            numNode = float (words[3])
-                            if numNode == 0:
-                                numNode_=0
-                                map_file.close()
-                                break
-                        elif words[1] == "node":                  #to get polygons vertex
-                            #numNode = words[2]
-                            nodeXm = float (words[3]) * self.canvasX / self.mapX
-                            nodeYm = self.canvasY - ( float (words[4]) * self.canvasY) / self.mapY
-
-                            nodes_coords.append([nodeXm,nodeYm,numNode])
-
-            if numNode_ != 0:
-                secuence = 0
-                for x in self.graph_list:
-                    if x != -1:
-                        if flagOnce:
-                            c1 = nodes_coords[x][0]
-                            c2 = nodes_coords[x][1]
-                            flagOnce = False
-
-                        draw.ellipse((nodes_coords[x][0] - 3 ,nodes_coords[x][1] - 3 ,nodes_coords[x][0] + 3 ,nodes_coords[x][1] + 3), outline = '#9C4FDB', fill = '#9C4FDB')
-                        draw.text( (nodes_coords[x][0],nodes_coords[x][1] + 2) ,fill = "darkblue" ,text = str(secuence) )
-                        secuence = secuence + 1
-                            #( connection 0 1 0.121195 )
-                        draw.line( (c1,c2,nodes_coords[x][0],nodes_coords[x][1]), fill = '#9C4FDB')
-                        c1 = nodes_coords[x][0]
-                        c2 = nodes_coords[x][1]
-
-                map_file.close()
-
-                image.save(self.rospack.get_path('simulator')+'/src/gui/nodes.png')
-                self.gif1 = PhotoImage( file = self.rospack.get_path('simulator')+'/src/gui/nodes.png')
-                self.nodes_image = self.w.create_image(self.canvasX / 2, self.canvasY / 2, image = self.gif1)
+            graph = load_graph(self.rospack.get_path('simulator')+'/src/data', self.entryFile.get())
+            if len(graph) != 0:
+                path = tuple(x for x in self.graph_list if x != -1)
+                self.show_overlay(graph, path, lambda: render_path(self.topology_to_canvas(graph), path, (self.canvasX, self.canvasY)))
 
 #####################
 #####################
@@ -366,6 +278,11 @@ class MobileRobotSimulator(threading.Thread):
 #
 #####################
 #####################
+    def topology_to_canvas(self, graph): # Node positions of the topological map in canvas pixels
+        scale_x = self.canvasX / self.mapX
+        scale_y = self.canvasY / self.mapY
+        return [ [x * scale_x, self.canvasY - y * scale_y] for x, y in graph.coords.tolist() ]
+
     def print_topological_map(self): # It plots  the topological map of the current map  and  show  "please wait" message
         wait_bg=self.w.create_rectangle(self.canvasX/2-30-120 ,self.canvasY/2-50 ,self.canvasX/2-30+120 ,self.canvasY/2+50 ,fill="white")
         wait = self.w.create_text(self.canvasX/2-30,self.canvasY/2,fill="darkblue",font="Calibri 20 bold",
@@ -387,33 +304,14 @@ class MobileRobotSimulator(threading.Thread):
 
         self.clear_topological_map();
         self.varShowNodes = True
-        #self.w.delete(self.nodes_image)
-        nodes_coords = []
-        image = Image.new('RGBA', (self.canvasX, self.canvasY))
-        draw = ImageDraw.Draw(image)
-        map_file = open(self.rospack.get_path('simulator')+'/src/data/'+self.entryFile.get()+'/'+self.entryFile.get()+'.top','r')                  #Open file
-        lines = map_file.readlines()                          #Split the file in lines
-        for line in lines:                                       #To read line by line
-            words = line.split()                              #To separate  words
-            if words:                                          #To avoid empty lines
-                if words[0] == "(":                              #To avoid coments
-                    if words[1] == "num":              #To get world dimensions
-                        numNode = float (words[3])
-                    elif words[1] == "node":                  #to get polygons vertex
-                        numNode = words[2]
-                        nodeXm = float (words[3]) * self.canvasX / self.mapX
-                        nodeYm = self.canvasY - ( float (words[4]) * self.canvasY) / self.mapY
-                        nodes_coords.append([nodeXm,nodeYm])
-                        draw.ellipse((nodeXm - 3 ,nodeYm - 3 ,nodeXm + 3 ,nodeYm + 3), outline = '#9C4FDB', fill = '#9C4FDB')
-                        draw.text( (nodeXm,nodeYm + 2) ,fill = "darkblue" ,text = str(numNode) )
-                    elif words[1] == "connection":                  #to get polygons vertex
-                        c1 = int(words[2])
-                        c2 = int(words[3])
-                        draw.line( (nodes_coords[c1][0],nodes_coords[c1][1] ,nodes_coords[c2][0] ,nodes_coords[c2][1] ) , fill = '#9C4FDB')
-
-        map_file.close()
-        image.save(self.rospack.get_path('simulator')+'/src/gui/nodes.png')
-        self.gif1 = PhotoImage( file = self.rospack.get_path('simulator')+'/src/gui/nodes.png')
+        graph = load_graph(self.rospack.get_path('simulator')+'/src/data', self.entryFile.get())
+        self.show_overlay(graph, None, lambda: render_topology(self.topology_to_canvas(graph), graph.node_ids.tolist(),
+                                                               graph.edges().tolist(), (self.canvasX, self.canvasY)))
+
+    def show_overlay(self, graph, path, render): # It shows the topological map (path None) or a path over it, rendered only the first time
+        # The graph object is part of the key, so a .top modified on disk (a new graph from load_graph) isn't served from the cache
+        key = (self.entryFile.get(), graph, self.canvasX, self.canvasY, path)
+        self.gif1 = PhotoImage( data = self.overlay_cache.get(key, render) )
         self.nodes_image = self.w.create_image(self.canvasX / 2, self.canvasY / 2, image = self.gif1)
 
 ##################################
@@ -432,6 +330,7 @@ class MobileRobotSimulator(threading.Thread):
         for i in self.lasers:
             self.w.delete(i)
         self.lasers = []
+        self.laser_pool.hide()
         for trace in self.trace_route :
             self.w.delete(trace)
         self.trace_route = []
@@ -444,54 +343,36 @@ class MobileRobotSimulator(threading.Thread):
         self.polygonMap = []
         self.polygons = []
         self.polygons_mm = []
+        self.obstacles = PolygonBVH()
+        self.ray_caster = RayCaster()
         try:
-            #self.w.delete("all")
-            map_file = open(self.rospack.get_path('simulator')+'/src/data/'+self.entryFile.get()+'/'+self.entryFile.get()+'.wrl','r') #Open file
-            lines = map_file.readlines()                          #Split the file in lines
-            for line in lines:                                       #To read line by line
-                words = line.split()                              #To separate  words
-                if words:                                          #To avoid empty lines
-                    if words[0] == "(":                              #To avoid coments
-                        if words[1] == "dimensions":              #To get world dimensions
-                            self.mapX = float (words[3])
-                            self.mapY = float (words[4])
-                            self.print_grid()
-                        elif words[1] == "polygon":                  #to get polygons vertex
-
-                            vertex_x = [ ( ( self.canvasX * float(x) ) / self.mapX ) for x in words[4:len(words)-1:2]    ]
-                            vertex_y = [ ( self.canvasY -  ( self.canvasY * float(y) ) / self.mapY ) for y in words[5:len(words)-1:2]    ]
-                            vertex_y_calculus = [ (( self.canvasY * float(y) ) / self.mapY ) for y in words[5:len(words)-1:2]    ]
-
-                            vx = [ float(x)for x in words[4:len(words)-1:2] ]
-                            vy = [ float(y)for y in words[5:len(words)-1:2] ]
-
-                            vertexs = ( zip( vertex_x , vertex_y) )
-                            self.polygons.append( zip( vertex_x , vertex_y_calculus))
-                            self.polygonMap.append(self.w.create_polygon(vertexs, outline=self.obstaclesOutlineColor, fill=self.obstacleInnerColor, width=1))
-                            #self.w.create_text( self.canvasX * float(words[4]) / self.mapX,  self.canvasY -  ( self.canvasY * float(words[5]) ) / self.mapY, text=str(pp))
-                            max_x = 0;
-                            max_y = 0;
-                            min_x = 999;
-                            min_y = 999;
-
-                            for i in vertexs:
-                                if max_x < i[0]:
-                                    max_x = i[0]
-                                if min_x > i[0]:
-                                    min_x = i[0]
-
-                            for i in vertexs:
-                                if max_y < i[1]:
-                                    max_y = i[1]
-                                if max_y > i[1]:
-                                    min_y = i[1]
-                            self.polygons_mm.append( [[max_x,max_y],[min_x,min_y] ] )
-
-                            self.num_polygons = self.num_polygons+1
-            for p in self.polygons:
-                p.append(p[0])
-        except IOError:
+            # The parsed world is cached in meters, only a map never read
+            # before (or modified since) is parsed again
+            world = load_world(self.rospack.get_path('simulator')+'/src/data', self.entryFile.get())
+        except (IOError, OSError):
             tkMessageBox.showerror("World erros ", "World  '"+self.entryFile.get()+"' doesn' t exist \n Provide another file name ")
+            return
+
+        self.mapX = world.width
+        self.mapY = world.height
+        self.print_grid()
+
+        scale_x, scale_y = world.scale(self.canvasX, self.canvasY)
+        self.polygons = world.to_canvas(self.canvasX, self.canvasY)
+        for polygon in self.polygons:
+            vertexs = zip( polygon[:-1, 0], self.canvasY - polygon[:-1, 1] )
+            self.polygonMap.append(self.w.create_polygon(vertexs, outline=self.obstaclesOutlineColor, fill=self.obstacleInnerColor, width=1, tags='obstacle'))
+
+        for min_x, min_y, max_x, max_y in world.boxes.tolist():
+            self.polygons_mm.append( [[max_x*scale_x, self.canvasY - min_y*scale_y], [min_x*scale_x, self.canvasY - max_y*scale_y]] )
+
+        self.num_polygons = len(world)
+        self.obstacles = world.obstacles    # Geometry queries are done in meters
+        self.ray_caster = world.ray_caster
+
+        # Keep the map below whatever was already drawn on the canvas
+        self.w.tag_lower('obstacle')
+        self.w.tag_lower('grid')
 
 
 
@@ -567,6 +448,10 @@ class MobileRobotSimulator(threading.Thread):
                     x=(self.robotX*self.mapX)/self.canvasX + (( (float(self.entryRadio.get()))*math.cos(float(self.entryAngle.get()))))
                     y=((self.canvasY -self.robotY)*self.mapY)/self.canvasY + (((float(self.entryRadio.get()))*math.sin(   float(self.entryAngle.get()) )))
 
+                    if self.obstacles.contains_point(x, y) >= 0:
+                        print("Object "+obj[0]+" can not be released inside an obstacle")
+                        return False
+
                     obj[1]= x
                     obj[2]= y
 
@@ -596,7 +481,7 @@ class MobileRobotSimulator(threading.Thread):
         if star_stop :
             self.w.delete(self.nodes_image)
             self.denable('disabled')
-            if not self.varTurtleBot.get:
+            if not self.varTurtleBot.get():
                 self.read_map()
             self.clear_topological_map() # To clear topological map
             self.startFlag=True
@@ -653,7 +538,7 @@ class MobileRobotSimulator(threading.Thread):
 
     def set_robot_position(self, x, y):
         if not self.varTurtleBot.get():
-            if self.robot > 0:
+            if self.robot_sprite.exists():
                 self.delete_robot()
             self.robotX = x
             self.robotY = y
@@ -673,7 +558,9 @@ class MobileRobotSimulator(threading.Thread):
 
     def left_click(self,event): # It plot the robot in the field
         if not self.varTurtleBot.get():
-            if self.robot > 0:
+            if self.obstacles.contains_point(event.x*self.mapX/self.canvasX, (self.canvasY - event.y)*self.mapY/self.canvasY) >= 0:
+                return # Clicked on an obstacle
+            if self.robot_sprite.exists():
                 self.delete_robot()
             self.robotX = event.x
             self.robotY = event.y
@@ -775,7 +662,6 @@ class MobileRobotSimulator(threading.Thread):
 
 
     def print_real(self,*args):
-        self.delete_robot()
         self.plot_robot2()
 
     def print_hokuyo_values(self,*args):
@@ -907,6 +793,7 @@ class MobileRobotSimulator(threading.Thread):
 
             for i in self.lasers:
                 self.w.delete(i)
+            self.laser_pool.hide()
             self.clear_topological_map() # To clear topological map
             self.steps_ = 0 ;
             self.steps_aux = int(self.entrySteps.get()) ;
@@ -922,6 +809,8 @@ class MobileRobotSimulator(threading.Thread):
             self.polygonMap = []
             self.polygons = []
             self.polygons_mm = []
+            self.obstacles = PolygonBVH()
+            self.ray_caster = RayCaster()
             self.mapX=5
             self.mapY=5
             self.entryRadio
@@ -963,6 +852,7 @@ class MobileRobotSimulator(threading.Thread):
             for i in self.lasers:
                 self.w.delete(i)
             self.lasers = []
+            self.laser_pool.hide()
 
             self.delete_robot()
 
@@ -1014,116 +904,28 @@ class MobileRobotSimulator(threading.Thread):
 
     ###lidar utilities
 
-    def rotate_point(self,theta,ox,oy, x, y):
-
-        # It rotates a point (x,y) from another point (ox,oy)
-        rotate = -theta
-        nx = ( x - ox ) * math.cos( rotate ) - ( y - oy ) * math.sin(rotate) + ox
-        ny = ( x - ox ) * math.sin( rotate ) + ( y - oy ) * math.cos(rotate) + oy
-        return nx,ny
-
-
-    def line_intersection(self, p1, p2, p3 , p4, laser_value):
-
-        #this function calculates the intersection  point between two segments of lines.
-        # p1,p2 are the points of the first segment
-        # p1,p2 are the points of the second segment
-
-        denominadorTa = (p4[0]-p3[0])*(p1[1]-p2[1]) - (p1[0]-p2[0])*(p4[1]-p3[1])
-        denominadorTb = (p4[0]-p3[0])*(p1[1]-p2[1]) - (p1[0]-p2[0])*(p4[1]-p3[1])
-
-        if denominadorTa == 0 or denominadorTb ==0 :
-            return laser_value
-
-        ta = ( (p3[1]-p4[1])*(p1[0]-p3[0]) + (p4[0]-p3[0])*(p1[1]-p3[1]) ) / float( denominadorTa )
-        tb = ( (p1[1]-p2[1])*(p1[0]-p3[0]) + (p2[0]-p1[0])*(p1[1]-p3[1]) ) / float( denominadorTb )
-
-        if  0 <= ta  and ta <= 1 and 0 <= tb and tb <= 1  :
-            xi = p1[0]  + ta * ( p2[0] - p1[0] )
-            yi = p1[1]  + ta * ( p2[1] - p1[1] )
-            return math.sqrt( (p1[0] - xi)**2 + (p1[1] - yi)**2 )
-        else:
-            return laser_value;
-
 
     def calculate_ray_traicing(self):
 
-        #It Calculates laser values Raycasting
-        j=0;
-        ffl = False
-        p1 = [None] * 2
-        p2 = [None] * 2
-
-        p3 = [None] * 2
-        p4 = [None] * 2
-
-        r_max = [None] * 2
-        r_min = [None] * 2
-
-        four_lines = [None] * 4
-
-        p1[0] = self.robotX;
-        p1[1] = (self.canvasY-self.robotY);
-
+        # It Calculates laser values Raycasting, every sensor ray is
+        # intersected in one vectorized pass against the edges of the
+        # obstacles whose boxes it crosses (see raycasting.RayCaster)
         value = float(self.entryValue.get() ) * self.canvasX / self.mapX
 
-        r_max[0] = p1[0] + float(value);
-        r_max[1] = p1[1] + float(value);
-        r_min[0] = p1[0] - float(value);
-        r_min[1] = p1[1] - float(value);
-
-        #self.w.create_line( r_max[0], r_max[1], r_max[0], r_min[1], fill = 'red')
-        #self.w.create_line( r_max[0], r_min[1], r_min[0], r_min[1], fill = 'red')
-        #self.w.create_line( r_min[0], r_min[1], r_min[0], r_max[1], fill = 'red')
-        #self.w.create_line( r_min[0], r_max[1], r_max[0], r_max[1], fill = 'red')
-        #self.w.create_oval( r_max[0]+1, r_max[1]+1, r_max[0]-1, r_max[1]-1 ,outline='green', fill='green', width=1)
-        #self.w.create_oval( r_min[0]+1, r_min[1]+1, r_min[0]-1, r_min[1]-1 ,outline='black', fill='black', width=1)
-
-        four_lines[0] = [r_max[0], r_max[1], r_max[0], r_min[1]]
-        four_lines[1] = [r_max[0], r_min[1], r_min[0], r_min[1]]
-        four_lines[2] = [r_min[0], r_min[1], r_min[0], r_max[1]]
-        four_lines[3] = [r_min[0], r_max[1], r_max[0], r_max[1]]
-
-
         for h in range(0,len(self.sensors_value)):
             self.sensors_value[h] = value
 
-
-        for p in range(0,4):
-            self.posible_collision[p] = p
-            j = j + 1
-        for i in range(0, self.num_polygons):
-            ffl = False
-            for k in four_lines:
-                for m in range(0, len(self.polygons[i] ) ):
-                    if ffl == True:
-                        continue
-                    else:
-                        if self.polygons[i][m][0] <= r_max[0] and self.polygons[i][m][0] >= r_min[0] and self.polygons[i][m][1] <= r_max[1] and self.polygons[i][m][1] >= r_min[1] :
-
-                        #if self.line_intersection([k[0],k[1]],[k[2],k[3]],self.polygons[i][m],self.polygons[i][m+1],value) != value:
-                            self.posible_collision[j] = i
-                            j = j + 1
-                            ffl = True
-
-        #print(str(j))
-        #print(str(self.num_polygons))
-
+        num_sensors = int(self.entryNumSensors.get())
         f = self.robot_theta + float(self.entryOrigin.get())
-
         step = float(self.entryRange.get()) / ( float(self.entryNumSensors.get()) - 1 )
+        angles = f + step * np.arange(num_sensors)
 
-        for k in range(0,int(self.entryNumSensors.get())):
-            for i in range(0,j):
-                for m in range(0, len(self.polygons[self.posible_collision[i]] )-1 ):
-                    p2[0] = float(value) * math.cos( f ) + float(p1[0]);
-                    p2[1] = float(value) * math.sin( f ) + float(p1[1]);
-
-                    if True:#self.ccw(p1,self.polygons[self.posible_collision[i]][m],self.polygons[self.posible_collision[i]][m+1]) != self.ccw(p2,self.polygons[ self.posible_collision[i] ][m],self.polygons[ self.posible_collision[i] ][m+1]) and self.ccw(p1,p2,self.polygons[ self.posible_collision[i] ][m]) != self.ccw(p1,p2,self.polygons[ self.posible_collision[i] ][m+1]):
-                        aux = self.line_intersection(p1,p2,self.polygons[self.posible_collision[i]][m],self.polygons[ self.posible_collision[i] ][m+1],value);
-                        if self.sensors_value[k] > aux*self.mapX/ self.canvasX:
-                            self.sensors_value[k] = aux*self.mapX    / self.canvasX
-            f = f + step
+        # While the robot turns in place the readings come from the depth
+        # profile around its position (see polar_depth.PolarDepthCache)
+        distances = self.polar_depth.cast(self.ray_caster, self.robotX, self.canvasY - self.robotY,
+                                          angles, value,
+                                          scale=(self.mapX / self.canvasX, self.mapY / self.canvasY))
+        self.sensors_value[:num_sensors] = ( distances * self.mapX / self.canvasX ).tolist()
 
     def ccw(self,A,B,C):
         return (C[1]-A[1]) * (B[0]-A[0]) > (B[1]-A[1]) * (C[0]-A[0])
@@ -1151,47 +953,14 @@ class MobileRobotSimulator(threading.Thread):
         except ValueError:
             pass
 
-        if self.flagOnce :
-            self.delete_robot()
         self.flagOnce=True
 
         if self.varShowSensors.get():
             self.plot_sensors(angle,x,y,color)
+        else:
+            self.laser_pool.hide()
 
-        radio = ( float(self.entryRadio.get() ) * self.canvasX ) / self.mapX
-        self.robot=self.w.create_oval(x-radio,y-radio, x+radio,y+radio   , outline=self.robotColor, fill=self.robotColor, width=1)
-        self.hokuyo=self.w.create_oval(x-radio/5,y-radio/5, x+radio/5,y+radio/5 ,outline=self.hokuyoColor, fill=self.hokuyoColor, width=1)
-
-        wheel1x1 = x - ( radio / 2 )
-        wheel1y1 = y - ( 5 * radio /6 )
-        wheel1x2 = x + radio / 2
-        wheel1y2 = y - ( 3 * radio / 6 )
-        wheel2y1 = y + ( 3 * radio / 6 )
-        wheel2y2 = y + ( 5 * radio / 6 )
-        wh1= []
-        wh2= []
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel1y1))
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel1y1))
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel1y2))
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel1y2))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel2y1))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel2y1))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel2y2))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel2y2))
-        self.wheelL=self.w.create_polygon( wh1 ,outline = self.wheelColor, fill = self.wheelColor, width=1)
-        self.wheelR=self.w.create_polygon( wh2 ,outline = self.wheelColor, fill = self.wheelColor, width=1)
-        head = []
-        head.append( self.rotate_point( angle ,x ,y ,x + ( 2 * radio / 3 ) ,y - ( radio / 3 ) ) )
-        head.append( self.rotate_point( angle ,x ,y ,x + ( 2 * radio / 3 ) ,y + ( radio / 3 ) ) )
-        head.append( self.rotate_point( angle ,x ,y ,x + ( 5 * radio / 6 ) ,y ))
-        self.arrow=self.w.create_polygon( head , outline = self.arrowColor , fill = self.arrowColor , width = 1 )
-        if self.grasp_id != False:
-            self.current_object = self.w.create_rectangle(x-10, y -10 , x +10, y +10  ,fill="#9FFF3D",outline="#9FFF3D")
-            self.current_object_name = self.w.create_text(x ,y , fill="#9E4124",font="Calibri 10 bold",text=self.grasp_id)
-            for obj in self.objects_data:
-                if self.grasp_id == obj[0]:
-                    obj[1]= (self.robotX*self.mapX)/self.canvasX + (( (float(self.entryRadio.get()))*math.cos(float(self.entryAngle.get()))))
-                    obj[2]= ((self.canvasY -self.robotY)*self.mapY)/self.canvasY + (((float(self.entryRadio.get()))*math.sin(   float(self.entryAngle.get()) )))
+        self.draw_robot(x, y, angle)
         self.w.update()
 
     def plot_robot2(self):
@@ -1200,40 +969,7 @@ class MobileRobotSimulator(threading.Thread):
         y = self.robotY
         angle=self.robot_theta
 
-        radio = ( float(self.entryRadio.get() ) * self.canvasX ) / self.mapX
-        self.robot=self.w.create_oval(x-radio,y-radio, x+radio,y+radio   , outline=self.robotColor, fill=self.robotColor, width=1)
-        self.hokuyo=self.w.create_oval(x-radio/5,y-radio/5, x+radio/5,y+radio/5 ,outline=self.hokuyoColor, fill=self.hokuyoColor, width=1)
-
-        wheel1x1 = x - ( radio / 2 )
-        wheel1y1 = y - ( 5 * radio /6 )
-        wheel1x2 = x + radio / 2
-        wheel1y2 = y - ( 3 * radio / 6 )
-        wheel2y1 = y + ( 3 * radio / 6 )
-        wheel2y2 = y + ( 5 * radio / 6 )
-        wh1= []
-        wh2= []
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel1y1))
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel1y1))
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel1y2))
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel1y2))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel2y1))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel2y1))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel2y2))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel2y2))
-        self.wheelL=self.w.create_polygon( wh1 ,outline = self.wheelColor, fill = self.wheelColor, width=1)
-        self.wheelR=self.w.create_polygon( wh2 ,outline = self.wheelColor, fill = self.wheelColor, width=1)
-        head = []
-        head.append( self.rotate_point( angle ,x ,y ,x + ( 2 * radio / 3 ) ,y - ( radio / 3 ) ) )
-        head.append( self.rotate_point( angle ,x ,y ,x + ( 2 * radio / 3 ) ,y + ( radio / 3 ) ) )
-        head.append( self.rotate_point( angle ,x ,y ,x + ( 5 * radio / 6 ) ,y ))
-        self.arrow=self.w.create_polygon( head , outline = self.arrowColor ,fill = self.arrowColor, width = 1 )
-        if self.grasp_id != False:
-            self.current_object = self.w.create_rectangle(x-10, y -10 , x +10, y +10  ,fill="#9FFF3D",outline="#9FFF3D")
-            self.current_object_name = self.w.create_text(x ,y , fill="#9E4124",font="Calibri 10 bold",text=self.grasp_id)
-            for obj in self.objects_data:
-                if self.grasp_id == obj[0]:
-                    obj[1]= (self.robotX*self.mapX)/self.canvasX + (( (float(self.entryRadio.get()))*math.cos(float(self.entryAngle.get()))))
-                    obj[2]= ((self.canvasY -self.robotY)*self.mapY)/self.canvasY + (((float(self.entryRadio.get()))*math.sin(   float(self.entryAngle.get()) )))
+        self.draw_robot(x, y, angle)
         self.w.update()
         time.sleep(.1)
         #self.laserColor = aux_color
@@ -1264,53 +1000,21 @@ class MobileRobotSimulator(threading.Thread):
         except ValueError:
             pass
 
-        if self.flagOnce :
-            self.delete_robot()
         self.flagOnce=True
 
         for i in self.lasers:
                 self.w.delete(i)
+        self.lasers = []
 
         if self.varShowSensors.get():
             if  bool(self.varAddNoise.get() ) == True :
                 self.plot_sensors(angle,x,y,"#1dff0d")
             else:
                 self.plot_sensors(angle,x,y)
+        else:
+            self.laser_pool.hide()
 
-        radio = ( float(self.entryRadio.get() ) * self.canvasX ) / self.mapX
-        self.robot=self.w.create_oval(x-radio,y-radio, x+radio,y+radio   , outline=self.robotColor, fill=self.robotColor, width=1)
-        self.hokuyo=self.w.create_oval(x-radio/5,y-radio/5, x+radio/5,y+radio/5 ,outline=self.hokuyoColor, fill=self.hokuyoColor, width=1)
-
-        wheel1x1 = x - ( radio / 2 )
-        wheel1y1 = y - ( 5 * radio /6 )
-        wheel1x2 = x + radio / 2
-        wheel1y2 = y - ( 3 * radio / 6 )
-        wheel2y1 = y + ( 3 * radio / 6 )
-        wheel2y2 = y + ( 5 * radio / 6 )
-        wh1= []
-        wh2= []
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel1y1))
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel1y1))
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel1y2))
-        wh1.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel1y2))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel2y1))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel2y1))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x2 ,wheel2y2))
-        wh2.append(self.rotate_point (angle ,x ,y ,wheel1x1 ,wheel2y2))
-        self.wheelL=self.w.create_polygon( wh1 ,outline = self.wheelColor, fill = self.wheelColor, width=1)
-        self.wheelR=self.w.create_polygon( wh2 ,outline = self.wheelColor, fill = self.wheelColor, width=1)
-        head = []
-        head.append( self.rotate_point( angle ,x ,y ,x + ( 2 * radio / 3 ) ,y - ( radio / 3 ) ) )
-        head.append( self.rotate_point( angle ,x ,y ,x + ( 2 * radio / 3 ) ,y + ( radio / 3 ) ) )
-        head.append( self.rotate_point( angle ,x ,y ,x + ( 5 * radio / 6 ) ,y ))
-        if self.grasp_id != False:
-            self.current_object = self.w.create_rectangle(x-10, y -10 , x +10, y +10  ,fill="#9FFF3D",outline="#9FFF3D")
-            self.current_object_name = self.w.create_text(x ,y , fill="#9E4124",font="Calibri 10 bold",text=self.grasp_id)
-            for obj in self.objects_data:
-                if self.grasp_id == obj[0]:
-                    obj[1]= (self.robotX*self.mapX)/self.canvasX + (( (float(self.entryRadio.get()))*math.cos(float(self.entryAngle.get()))))
-                    obj[2]= ((self.canvasY -self.robotY)*self.mapY)/self.canvasY + (((float(self.entryRadio.get()))*math.sin(   float(self.entryAngle.get()) )))
-        self.arrow=self.w.create_polygon( head , outline = self.arrowColor , fill = self.arrowColor , width = 1 )
+        self.draw_robot(x, y, angle)
         self.w.update()
 
 
@@ -1328,29 +1032,31 @@ class MobileRobotSimulator(threading.Thread):
         y = ry
         f = angle + originSensor
         step = float( float( rangeSensor ) / float( numSensor - 1 ) )
+        value = float(self.entryValue.get())
 
-        for i in self.lasers:
-            self.w.delete(i)
-        self.lasers = []
-
+        ends = []
+        hits = []
         for i in range(0, numSensor):
-            q,w =self.get_ray(f ,rx ,ry ,(self.sensors_value[i] * self.canvasX ) / self.mapX)
-            self.lasers.append(self.w.create_line(rx ,ry ,q ,w ,fill = color) )
+            ends.append(self.get_ray(f ,rx ,ry ,(self.sensors_value[i] * self.canvasX ) / self.mapX))
+            hits.append(float(self.sensors_value[i]) < value)
+            f = f + step
 
-            if float(self.sensors_value[i]) < float(self.entryValue.get()) :
+        # The rays reuse the same canvas items every frame
+        self.laser_pool.draw(rx, ry, ends, hits, color)
 
-                self.lasers.append(self.w.create_oval(q-1 ,w-1,q+1 ,w+1 ,fill = color, outline =color  ) )
-            f = f + step
+    def draw_robot(self, x, y, angle): # It places the robot sprite, its canvas items are created only once
+        radio = ( float(self.entryRadio.get() ) * self.canvasX ) / self.mapX
+        colors = {'body': self.robotColor, 'hokuyo': self.hokuyoColor, 'wheel_left': self.wheelColor,
+                  'wheel_right': self.wheelColor, 'arrow': self.arrowColor}
+        self.robot_sprite.draw(x, y, angle, radio, colors, self.grasp_id or None)
+        if self.grasp_id != False:
+            for obj in self.objects_data:
+                if self.grasp_id == obj[0]:
+                    obj[1]= (self.robotX*self.mapX)/self.canvasX + (( (float(self.entryRadio.get()))*math.cos(float(self.entryAngle.get()))))
+                    obj[2]= ((self.canvasY -self.robotY)*self.mapY)/self.canvasY + (((float(self.entryRadio.get()))*math.sin(   float(self.entryAngle.get()) )))
 
     def delete_robot(self):
-
-        self.w.delete(self.robot)
-        self.w.delete(self.wheelL)
-        self.w.delete(self.wheelR)
-        self.w.delete(self.arrow)
-        self.w.delete(self.hokuyo)
-        self.w.delete(self.current_object)
-        self.w.delete(self.current_object_name)
+        self.robot_sprite.delete()
 
     def move_robot(self,*args):
 
@@ -1360,7 +1066,6 @@ class MobileRobotSimulator(threading.Thread):
         init_robotX = self.robotX
         init_robotY = self.robotY
         init_robotAngle = self.robot_theta
-        i = self.robot_theta
 
         if self.varFaster.get() or self.varTurtleBot.get():
             self.plot_robot();
@@ -1372,103 +1077,55 @@ class MobileRobotSimulator(threading.Thread):
 
         else:
             self.plot_robot();
+            velocity = float(self.sliderVelocity.get())
 
-            if theta ==0:
-                pass
-            else:
-                if theta > 0 :
-                    while i < init_robotAngle + theta:
-                        i = i + (0.0174533*2)*self.sliderVelocity.get()
-                        self.robot_theta = i
-                        self.plot_robot()
-
-                else:
-                    while i > init_robotAngle + theta:
-                        i = i - (0.0174533*2)*self.sliderVelocity.get()
-                        self.robot_theta = i
-                        self.plot_robot()
-
-                self.robot_theta = init_robotAngle + theta
-                self.plot_robot()
-
-            xf = distance * math.cos(self.robot_theta) + self.robotX
+            # Rotation, 2 degrees per frame times the velocity slider
+            if theta != 0:
+                self.animate_motion( abs(theta) / ( (0.0174533*2) * velocity ),
+                                     (init_robotX, init_robotY, init_robotAngle),
+                                     (init_robotX, init_robotY, init_robotAngle + theta) )
 
-            yf = -( distance * math.sin(self.robot_theta) )+ self.robotY
+            # Advance, one pixel per frame times the velocity slider
+            xf = distance * math.cos(init_robotAngle + theta) + init_robotX
+            yf = -( distance * math.sin(init_robotAngle + theta) )+ init_robotY
+            if distance != 0:
+                self.animate_motion( abs(distance) / velocity,
+                                     (init_robotX, init_robotY, init_robotAngle + theta),
+                                     (xf, yf, init_robotAngle + theta) )
 
 
-            x = auxX = init_robotX
-            y = auxY = init_robotY
-            m = -math.tan(self.robot_theta)
-
-            if xf==auxX :
-                if yf <= auxY:
-                    while y < yf:
-                        y = y - self.sliderVelocity.get()
-                        if(y > yf):
-                            break
-                        self.robotY=y
-                        self.plot_robot()
-                else:
-                    while y > yf:
-                        y = y + self.sliderVelocity.get()
-                        if(y < yf):
-                            break
-                        self.robotY=y
-                        self.plot_robot()
-                self.robotY = yf
-                self.plot_robot()
-            else:    # Calculos con punto pendiente  y2 -y1= m ( x2 - x1)
-                if  m < -1 or  m > 1 : # Si los angulos caen en este rango en vez de evaluar y  evaluaremos x
-
-                    if yf > auxY:
-                        while y < yf:
-                            x = -( (y - auxY) / math.tan(self.robot_theta) -auxX    )
-                            y = y + self.sliderVelocity.get()
-                            if(y > yf):
-                                break
-                            self.robotX=x
-                            self.robotY=y
-                            self.plot_robot()
-                    else:
-                        while y > yf:
-                            x = -( (y - auxY) / math.tan(self.robot_theta) -auxX)
-                            y = y - self.sliderVelocity.get()
-                            if(y < yf):
-                                break
-                            self.robotX=x
-                            self.robotY=y
-                            self.plot_robot()
-                else:
-
-                    if xf > auxX:
-                        while x < xf:
-                            y = -math.tan(self.robot_theta) * (x - auxX) + auxY
-                            #print(y)
-                            x = x + self.sliderVelocity.get()
-                            if(x > xf):
-                                break
-                            self.robotX=x
-                            self.robotY=y
-                            self.plot_robot()
-
-                    else:
-                        while x > xf:
-                            y = -math.tan(self.robot_theta) * (x - auxX) + auxY
-                            x = x - self.sliderVelocity.get()
-                            if(x < xf):
-                                break
-                            self.robotX=x
-                            self.robotY=y
-                            self.plot_robot()
-                self.robotX = xf
-                self.robotY = yf
-
-                self.plot_robot()
 
+        self.trace_route.append(self.w.create_line(init_robotX ,init_robotY ,xf,yf,dash=(4, 4),   fill="#AB1111"))
 
 
-        self.trace_route.append(self.w.create_line(init_robotX ,init_robotY ,xf,yf,dash=(4, 4),   fill="#AB1111"))
+    def animate_motion(self, steps, start, end):
+        # It shows the robot going from the pose start to the pose end,
+        # both (x, y, theta) in canvas pixels. The pose is interpolated on
+        # the wall clock: at most RENDER_FPS frames per second are drawn (and
+        # raycast), the animation lasts at most MAX_ANIMATION_FRAMES frames
+        # however long the motion is, and the last frame is always the exact
+        # end pose. steps is how many frames the motion needs at the speed of
+        # the velocity slider.
+        duration = min(max(steps, 1), MAX_ANIMATION_FRAMES) / float(RENDER_FPS)
+        begin = time.time()
+        frame = 0
+        while True:
+            frame = frame + 1
+            delay = begin + frame / float(RENDER_FPS) - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            # Frames that can't be drawn in time are skipped, not delayed
+            fraction = (time.time() - begin) / duration
+            if fraction >= 1:
+                break
+            self.robotX = start[0] + ( end[0] - start[0] ) * fraction
+            self.robotY = start[1] + ( end[1] - start[1] ) * fraction
+            self.robot_theta = start[2] + ( end[2] - start[2] ) * fraction
+            self.plot_robot()
 
+        self.robotX, self.robotY, self.robot_theta = end
+        self.plot_robot()
 
     def print_grid(self,line_per_m = 10):
         for i in self.grid :
@@ -1476,9 +1133,9 @@ class MobileRobotSimulator(threading.Thread):
         self.grid =[]
 
         for i in range(0, int(self.mapX)*line_per_m):
-            self.grid.append(self.w.create_line( i * self.canvasX/(self.mapX*line_per_m),0, i*self.canvasX/(self.mapX*line_per_m), self.canvasY,  dash=(4, 4), fill=self.gridColor))
+            self.grid.append(self.w.create_line( i * self.canvasX/(self.mapX*line_per_m),0, i*self.canvasX/(self.mapX*line_per_m), self.canvasY,  dash=(4, 4), fill=self.gridColor, tags='grid'))
         for i in range(0, int(self.mapY)*line_per_m):
-            self.grid.append(self.w.create_line( 0, i*self.canvasY/(self.mapY*line_per_m),self.canvasX, i*self.canvasY/(self.mapY*line_per_m),   dash=(4, 4), fill=self.gridColor))
+            self.grid.append(self.w.create_line( 0, i*self.canvasY/(self.mapY*line_per_m),self.canvasX, i*self.canvasY/(self.mapY*line_per_m),   dash=(4, 4), fill=self.gridColor, tags='grid'))
 
     def behavioLess(self): #Button behavior <
         try:
@@ -1530,6 +1187,39 @@ class MobileRobotSimulator(threading.Thread):
 
         self.plot_robot()
 
+    def follow_engine(self, engine): # The GUI only shows a SimulationEngine that runs somewhere else (e.g. headless)
+        engine.observers.append(self.show_engine)
+
+    def show_engine(self, engine):
+        if self.robot_sprite is None:
+            return # The window isn't ready yet
+        if engine.world_name != self.entryFile.get():
+            self.entryFile.delete ( 0, END )
+            self.entryFile.insert ( 0, engine.world_name )
+            self.read_map()
+        self.robotX = engine.x * self.canvasX / self.mapX
+        self.robotY = self.canvasY - engine.y * self.canvasY / self.mapY
+        self.robot_theta = engine.theta
+        self.plot_robot()
+
+    def follow_registry(self, registry): # The GUI shows every robot of a RobotRegistry, the first one is the robot of the widgets
+        for engine in registry:
+            engine.observers.append(lambda engine: self.show_registry(registry))
+
+    def show_registry(self, registry):
+        if self.robot_sprite is None:
+            return # The window isn't ready yet
+        engines = list(registry)
+        self.show_engine(engines[0])
+        colors = {'body': self.robotColor, 'hokuyo': self.hokuyoColor, 'wheel_left': self.wheelColor,
+                  'wheel_right': self.wheelColor, 'arrow': self.arrowColor}
+        for name, engine in zip(registry.names()[1:], engines[1:]):
+            if name not in self.other_sprites:
+                self.other_sprites[name] = RobotSprite(self.w)
+            self.other_sprites[name].draw(engine.x * self.canvasX / self.mapX,
+                                          self.canvasY - engine.y * self.canvasY / self.mapY,
+                                          engine.theta, engine.radio * self.canvasX / self.mapX, colors, None)
+
     def denable(self,state): # It disables some widgets when  a simulation is running
         self.buttonPlotTopological.configure(state=state)
         self.entryFile          .configure(state=state)
@@ -1691,6 +1381,8 @@ class MobileRobotSimulator(threading.Thread):
         self.rightMenu = Frame(self.content, borderwidth = 5, relief = "flat", width = 300, height = 900 ,background = self.backgroundColor)
 
         self.w = Canvas(self.frame, width = self.canvasX, height = self.canvasY, bg=self.canvasColor)
+        self.robot_sprite = RobotSprite(self.w)
+        self.laser_pool = LaserPool(self.w)
         self.w.pack()
 
         self.headLineFont = Font( family = 'Helvetica' ,size = 12, weight = 'bold')
@@ -1962,6 +1654,8 @@ class MobileRobotSimulator(threading.Thread):
 
         self.labelBattAdvertise.grid_forget()
 
+        self.watch_parameters()
+
         # Error gui
         self.errors_subwindow = self.create_errors_subwindow(parent=self.root)
 
@@ -2077,8 +1771,11 @@ class MobileRobotSimulator(threading.Thread):
             # Expected result
             self.expected_angle = self.start_angle + turn_angle
 
-            # Reset history with size 0 x 4 (expected x and y and real x and y)
-            test_win.test_value_history = np.zeros((0, 4))
+            # Reset history with 4 columns (expected degrees and radians and
+            # real degrees and radians) and the plots
+            test_win.test_value_history = HistoryBuffer(4, pairs=((1, 3),))
+            test_win.plotFunction.reset(int(test_win.entryNumTests.get()))
+            test_win.plotError.reset(int(test_win.entryNumTests.get()))
         else:
             # Starting pose
             poseX = float(self.entryPoseX.get())
@@ -2106,8 +1803,8 @@ class MobileRobotSimulator(threading.Thread):
             self.expectedX = poseX + advance * math.cos(angle)
             self.expectedY = poseY + advance * math.sin(angle)
 
-            # Reset history with size 0 x 2 (expected angle and real angle)
-            test_win.test_value_history = np.zeros((0, 2))
+            # Reset history with 2 columns (expected and real distance)
+            test_win.test_value_history = HistoryBuffer(2, pairs=((0, 1),))
 
         # Save some state before putting error-related stuff in the GUI
         self.saved_behaviour = self.entryBehavior.get()
@@ -2151,12 +1848,12 @@ class MobileRobotSimulator(threading.Thread):
 
             new_data_row = (expected_dist, real_dist)
 
-        test_win.test_value_history = \
-            np.vstack((test_win.test_value_history, new_data_row))
+        test_win.test_value_history.append(new_data_row)
 
-        self.fill_table(test_win.errorTableCells, test_win.test_value_history)
+        # Only the new sample is drawn, the statistics are kept by the history
+        self.fill_table(test_win.errorTableCells, test_win.test_value_history.data)
         self.set_error_labels(test_win, test_type, test_win.test_value_history)
-        self.plot_function_and_error(test_win.test_value_history)
+        self.plot_function_and_error(new_data_row)
 
         # Return to the initial state
         if test_type == 'angle':
@@ -2202,48 +1899,31 @@ class MobileRobotSimulator(threading.Thread):
 
 
     def save_test_results(self, test_type, test_win):
-        base = self.rospack.get_path('simulator')
-        # In order to prevent having dots in the filename, we'll trunc values
-        # that will go into such name to integers
+        # Same files error_tests.py writes from the command line. The values
+        # in the names are rounded, 0.29 m is advance_29.dat, older versions
+        # truncated them and saved it as advance_28.dat
+        tests_dir = os.path.join(self.rospack.get_path('simulator'), 'src', 'data', 'tests')
         if test_type == 'angle':
-            filename_start = 'rotation'
-            filename_value = int(float(test_win.entryTestAngle.get()))
+            value = float(test_win.entryTestAngle.get())
         else:
-            filename_start = 'advance'
-            # The amount of advance is multiplied by 100 to get centimeters
-            # instead of meters
-            filename_value = int(float(test_win.entryTestAdvance.get()) * 100)
+            value = float(test_win.entryTestAdvance.get())
 
         suffix = test_win.entryErrorFileSuffix.get().strip()
-
-        filename = ('{base}/src/data/tests/'
-                    '{filename_start}_'
-                    '{filename_value}{suffix}.dat').format(
-                        base = base,
-                        filename_start=filename_start,
-                        filename_value=filename_value,
-                        suffix = suffix)
-
-        with open(filename, 'w') as f:
-
-            for line in test_win.test_value_history:
-                first, rest = line[0], line[1:]
-                print(format_real(first), end='', file=f)
-
-                for n in rest:
-                    print(' ', format_real(n), sep='', end='', file=f)
-
-                print(file=f)
+        filename = results_path(tests_dir, test_type, value, suffix)
+        write_results(filename, test_win.test_value_history)
 
         tkMessageBox.showinfo(title='Saved tests',
                               message='Test data saved to {}'.format(filename))
 
 
 
-    def set_error_labels(self, test_win, test_type, data):
+    def set_error_labels(self, test_win, test_type, history):
+        # history is a HistoryBuffer, its statistics are those of
+        # calculate_statistics and calculate_errors for the real radians and
+        # the expected and real radians
         if test_type == 'angle':
-            mean, var = calculate_statistics(data[:,1])
-            err_mean, err_var = calculate_errors(data)
+            mean, var = history.statistics(3)
+            err_mean, err_var = history.errors()
 
             test_win.labelMeanVal.config(text = format_real(mean))
             test_win.labelVarianceVal.config(text = format_real(var))
@@ -2272,21 +1952,12 @@ class MobileRobotSimulator(threading.Thread):
             """
 
 
-    def plot_function_and_error(self, data):
+    def plot_function_and_error(self, row):
         test_win = self.test_win
 
         if self.currently_testing == 'angle':
-            self.resetCanvas(test_win.canvasFunction)
-            _, _, diff = self.plot_in_canvas(test_win.canvasFunction,
-                                             colors=('red', 'blue'),
-                                             functions=(data[:, 0], data[:, 2]))
-
-            self.resetCanvas(test_win.canvasError)
-            err = data[:, 0] - data[:, 2]
-            self.plot_in_canvas(test_win.canvasError,
-                                colors=('red',),
-                                functions=(err,),
-                                diff=diff)
+            test_win.plotFunction.append(row[0], row[2])
+            test_win.plotError.append(row[0] - row[2])
         else:
             """
             TODO: Update this to match the only hypotenuse error testing
@@ -2307,64 +1978,6 @@ class MobileRobotSimulator(threading.Thread):
             """
 
 
-    def plot_in_canvas(self, canvas, functions, colors, diff=None):
-        canvas_size = 300
-        min_val = float('inf')
-        max_val = float('-inf')
-        for f in functions:
-            min_val = min(min_val, np.min(f))
-            max_val = max(max_val, np.max(f))
-
-        center = (min_val + max_val) / 2
-
-        # Ensure that the X axis is always shown
-        if min_val > 0:
-            min_val = 0
-
-        if max_val < 0:
-            max_val = 0
-
-        # Managing scale
-        if diff is None:
-            diff = abs(min_val - max_val)
-        else:
-            # Already receive diff, Recalculate min and max
-            max_value = center + diff / 2
-            min_value = center - diff // 2
-
-        # Add padding above and below
-        pad_percent = 10.0
-
-        pad = diff * pad_percent / 100.0
-
-        # Set a min pad value
-        if pad < 0.01:
-            pad = 0.01
-
-        min_val -= pad
-        max_val += pad
-
-        # Reference Axis
-        y0 = canvas_size - (0 - min_val) * canvas_size / (max_val - min_val)
-        canvas.create_line(0, y0, canvas_size, y0)
-
-
-        for f, color in zip(functions, colors):
-            length = len(f)
-
-            # Values
-            for (i, val1), val2 in zip(enumerate(f), f[1:]):
-                x1 = i * canvas_size / (length - 1)
-                x2 = (i + 1) * canvas_size / (length - 1)
-
-                y1 = canvas_size - (val1 - min_val) * canvas_size / (max_val - min_val)
-                y2 = canvas_size - (val2 - min_val) * canvas_size / (max_val - min_val)
-
-                canvas.create_line(x1, y1, x2, y2, fill=color)
-
-        return min_val, max_val, diff
-
-
     def plot_in_canvas_xy(self, canvas, functions, colors, diff=None):
         canvas_size = 300
         min_x = float('inf')
@@ -2544,6 +2157,8 @@ class MobileRobotSimulator(threading.Thread):
                                                     text = "Plot errors")
         angMenu.canvasFunction = self.Canvas(angMenu, width=300, height=300)
         angMenu.canvasError    = self.Canvas(angMenu, width=300, height=300)
+        angMenu.plotFunction   = StripPlot(angMenu.canvasFunction, colors=('red', 'blue'))
+        angMenu.plotError      = StripPlot(angMenu.canvasError, colors=('red',))
 
         angMenu.entryNumTests  .insert ( 0, '100')
         angMenu.entryTestAngle .insert ( 0, '10')
@@ -2576,9 +2191,9 @@ class MobileRobotSimulator(threading.Thread):
              [0.0, 0.0, 0.0, 0.0]]
         )
 
-        angMenu.test_value_history = np.zeros((0, 4))
+        angMenu.test_value_history = HistoryBuffer(4, pairs=((1, 3),))
 
-        self.set_error_labels(angMenu, 'angle', ang_table_default_data)
+        self.set_error_labels(angMenu, 'angle', angMenu.test_value_history)
 
         ang_elabel_col = 0
         ang_elabel_row = 0
@@ -2719,9 +2334,9 @@ class MobileRobotSimulator(threading.Thread):
              [0.0, 0.0, 0.0, 0.0]]
         )
 
-        advMenu.test_value_history = np.zeros((0, 2))
+        advMenu.test_value_history = HistoryBuffer(2, pairs=((0, 1),))
 
-        self.set_error_labels(advMenu, 'advance', adv_table_default_data)
+        self.set_error_labels(advMenu, 'advance', advMenu.test_value_history)
 
         adv_elabel_col = 0
         adv_elabel_row = 0
@@ -1,3 +1,4 @@
+from __future__ import division
 import numpy as np
 
 def calculate_statistics(data):
@@ -16,12 +17,13 @@ def calculate_statistics(data):
         ...
         n [yn]
     """
+    data = np.asarray(data, dtype=np.float64)
     mean = 0
     var = 0
     n = data.shape[0]
     if n != 0:
-        mean = sum(data) / n
-        var = sum((data - mean) ** 2) / n
+        mean = np.sum(data, axis=0) / n
+        var = np.var(data, axis=0)
 
     return mean, var
 
@@ -43,6 +45,7 @@ def calculate_errors(data):
         ...
         n [yn, y'n]
     """
+    data = np.asarray(data, dtype=np.float64)
     n = data.shape[0]
     diff = data[:, 0] - data[:, 1]
 
@@ -50,15 +53,123 @@ def calculate_errors(data):
     err_var = 0
 
     if n != 0:
-        err_mean = sum(np.abs(diff)) / n
+        err_mean = np.sum(np.abs(diff)) / n
 
     if n > 2:
-        err_var = sum(diff * diff) / (n - 2)
+        err_var = np.sum(diff * diff) / (n - 2)
 
     return err_mean, err_var
 
 
+class RunningStatistics(object):
+    """
+    Mean and variance of values that arrive one at a time (or in batches),
+    the same ones calculate_statistics gives for all of them, with Welford's
+    updates: no value is kept and the result doesn't lose precision over
+    long runs the way sum of squares minus squared sum does.
+
+    Values can be scalars or arrays of any shape (e.g. one per column of a
+    test), the statistics are kept element by element. Two accumulators of
+    different workers are combined with merge().
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, value):
+        value = np.asarray(value, dtype=np.float64)
+        self.n = self.n + 1
+        delta = value - self.mean
+        self.mean = self.mean + delta / self.n
+        self.m2 = self.m2 + delta * (value - self.mean)
+
+    def update_batch(self, values):
+        """
+        Adds every value of values along its first axis at once.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape[0]:
+            batch = RunningStatistics()
+            batch.n = values.shape[0]
+            batch.mean = values.mean(axis=0)
+            batch.m2 = ((values - batch.mean) ** 2).sum(axis=0)
+            self.merge(batch)
+
+    def merge(self, other):
+        """
+        Adds the values of the accumulator other (Chan's parallel update).
+        """
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.n / n
+        self.m2 = self.m2 + other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+
+    def statistics(self):
+        """
+        Same (mean, var) as calculate_statistics.
+        """
+        if self.n == 0:
+            return 0, 0
+        return self.mean, self.m2 / self.n
+
+
+class RunningErrors(object):
+    """
+    Error mean and variance of (expected, real) pairs that arrive one at a
+    time (or in batches), the same ones calculate_errors gives for all of
+    them. Both are means over the pairs (of the absolute difference and of
+    the squared difference) updated incrementally, so they are mergeable
+    like RunningStatistics.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.abs_mean = 0.0
+        self.square_mean = 0.0
+
+    def update(self, expected, real):
+        diff = np.asarray(expected, dtype=np.float64) - real
+        self.n = self.n + 1
+        self.abs_mean = self.abs_mean + (np.abs(diff) - self.abs_mean) / self.n
+        self.square_mean = self.square_mean + (diff * diff - self.square_mean) / self.n
+
+    def update_batch(self, data):
+        """
+        Adds every row [y, y'] of the array n x 2 data at once.
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if data.shape[0]:
+            diff = data[:, 0] - data[:, 1]
+            batch = RunningErrors()
+            batch.n = data.shape[0]
+            batch.abs_mean = np.abs(diff).mean(axis=0)
+            batch.square_mean = (diff * diff).mean(axis=0)
+            self.merge(batch)
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        self.abs_mean = self.abs_mean + (other.abs_mean - self.abs_mean) * other.n / n
+        self.square_mean = self.square_mean + (other.square_mean - self.square_mean) * other.n / n
+        self.n = n
+
+    def errors(self):
+        """
+        Same (error mean, error var) as calculate_errors.
+        """
+        err_mean = self.abs_mean if self.n != 0 else 0
+        err_var = self.square_mean * self.n / (self.n - 2) if self.n > 2 else 0
+        return err_mean, err_var
+
+
 if __name__ == '__main__':
+    import time
     try:
         from math import isclose
     except:
@@ -82,4 +193,59 @@ if __name__ == '__main__':
     assert isclose(err_mean, .1)
     assert isclose(err_var, .02)
 
+    stats = RunningStatistics()
+    errors = RunningErrors()
+    for row in data:
+        stats.update(row[0])
+        errors.update(row[0], row[1])
+    assert isclose(stats.statistics()[0], 2.5) and isclose(stats.statistics()[1], 1.25)
+    assert isclose(errors.errors()[0], .1) and isclose(errors.errors()[1], .02)
+
+    # Four workers with a part of the trials each give the same result as
+    # one pass over all of them, also for values with a big offset where
+    # the sum of squares loses every significant digit
+    rng = np.random.RandomState(0)
+    data = rng.normal(1e8, 0.05, (100000, 2))
+    parts = np.array_split(data, 4)
+    workers = []
+    for part in parts:
+        worker = (RunningStatistics(), RunningErrors())
+        for row in part[:100].tolist():
+            worker[0].update(row[0])
+            worker[1].update(row[0], row[1])
+        worker[0].update_batch(part[100:, 0])
+        worker[1].update_batch(part[100:])
+        workers.append(worker)
+    stats, errors = workers[0]
+    for other_stats, other_errors in workers[1:]:
+        stats.merge(other_stats)
+        errors.merge(other_errors)
 
+    diff = data[:, 0] - data[:, 1]
+    exact_var = np.mean((data[:, 0] - np.mean(data[:, 0])) ** 2)
+    assert abs(stats.statistics()[0] - np.mean(data[:, 0])) < 1e-6
+    naive_var = np.sum(data[:, 0] ** 2) / len(data) - np.mean(data[:, 0]) ** 2
+    assert abs(stats.statistics()[1] - exact_var) < 1e-6 * exact_var
+    assert abs(naive_var - exact_var) > exact_var
+    assert abs(errors.errors()[0] - np.mean(np.abs(diff))) < 1e-9
+    assert abs(errors.errors()[1] - np.sum(diff * diff) / (len(diff) - 2)) < 1e-9
+
+    # Cost of keeping the statistics of a test of 2000 samples up to date
+    # after every sample
+    samples = data[:2000]
+    start = time.time()
+    for n in range(1, len(samples) + 1):
+        calculate_statistics(samples[:n, 0])
+        calculate_errors(samples[:n])
+    batch_ms = (time.time() - start) * 1e3
+    start = time.time()
+    stats = RunningStatistics()
+    errors = RunningErrors()
+    for row in samples.tolist():
+        stats.update(row[0])
+        errors.update(row[0], row[1])
+        stats.statistics()
+        errors.errors()
+    running_ms = (time.time() - start) * 1e3
+    print('{} samples: recomputed {:.1f} ms, running {:.1f} ms'.format(
+        len(samples), batch_ms, running_ms))
@@ -0,0 +1,414 @@
+from __future__ import division, print_function
+import heapq
+import numpy as np
+from raycasting import polygons_to_edges, segment_hit_params
+
+
+def point_in_polygon(x, y, polygon):
+    """
+    Even-odd test of the point (x, y) against a closed polygon given as an
+    array of shape k x 2 whose last vertex repeats the first one.
+    """
+    x1 = polygon[:-1, 0]
+    y1 = polygon[:-1, 1]
+    x2 = polygon[1:, 0]
+    y2 = polygon[1:, 1]
+
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+
+    return bool(np.count_nonzero(crosses & (x < x_cross)) % 2)
+
+
+def point_segments_distance(x, y, edges):
+    """
+    Distance from the point (x, y) to each one of the edges (array n x 4).
+    """
+    x1 = edges[:, 0]
+    y1 = edges[:, 1]
+    dx = edges[:, 2] - x1
+    dy = edges[:, 3] - y1
+    length2 = dx * dx + dy * dy
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = ((x - x1) * dx + (y - y1) * dy) / length2
+    t = np.clip(np.where(length2 > 0, t, 0.0), 0.0, 1.0)
+
+    return np.hypot(x1 + t * dx - x, y1 + t * dy - y)
+
+
+class PolygonBVH(object):
+    """
+    Bounding volume hierarchy (AABB tree) over the obstacle polygons of a
+    map. It answers the geometric queries of the simulator:
+
+        - ray casting (candidate_pairs, so it can be used as the index of a
+          RayCaster, and ray_cast)
+        - point inside an obstacle (contains_point)
+        - nearest obstacle to a point (nearest_obstacle)
+
+    The tree is stored in flat arrays. Node 0 is the root, internal nodes
+    have two children and leaves hold up to leaf_size polygons. The edges of
+    the polygons are stored in the same order as polygons_to_edges returns
+    them, so edge ids are shared with any RayCaster over the same polygons.
+    """
+
+    def __init__(self, polygons=(), leaf_size=4):
+        self.polygons = [np.asarray(p, dtype=np.float64).reshape(-1, 2)
+                         for p in polygons]
+        self.edges = polygons_to_edges(polygons)
+
+        n = len(self.polygons)
+        edge_counts = np.array([max(len(p) - 1, 0) for p in self.polygons],
+                               dtype=np.int64)
+        self.polygon_edge_start = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(edge_counts, out=self.polygon_edge_start[1:])
+
+        boxes = np.zeros((n, 4))
+        for i, p in enumerate(self.polygons):
+            boxes[i, 0:2] = p.min(axis=0)
+            boxes[i, 2:4] = p.max(axis=0)
+        self.polygon_boxes = boxes
+        centers = (boxes[:, 0:2] + boxes[:, 2:4]) / 2
+
+        node_boxes = []
+        node_left = []
+        node_right = []
+        node_start = []
+        node_count = []
+        order = np.arange(n)
+
+        # Top-down build splitting the polygons at the median of their
+        # centers along the longest axis of the node box
+        stack = [(0, n, -1, False)]
+        while stack:
+            start, end, parent, is_right = stack.pop()
+            node = len(node_boxes)
+            if parent >= 0:
+                if is_right:
+                    node_right[parent] = node
+                else:
+                    node_left[parent] = node
+
+            ids = order[start:end]
+            if end > start:
+                box = np.concatenate((boxes[ids, 0:2].min(axis=0),
+                                      boxes[ids, 2:4].max(axis=0)))
+            else:
+                box = np.array([np.inf, np.inf, -np.inf, -np.inf])
+            node_boxes.append(box)
+            node_left.append(-1)
+            node_right.append(-1)
+
+            if end - start <= leaf_size:
+                node_start.append(start)
+                node_count.append(end - start)
+                continue
+
+            node_start.append(start)
+            node_count.append(0)
+
+            axis = 0 if box[2] - box[0] >= box[3] - box[1] else 1
+            mid = (end - start) // 2
+            part = np.argpartition(centers[ids, axis], mid)
+            order[start:end] = ids[part]
+
+            stack.append((start + mid, end, node, True))
+            stack.append((start, start + mid, node, False))
+
+        self.order = order
+        self.node_boxes = np.array(node_boxes).reshape(-1, 4)
+        self.node_left = np.array(node_left, dtype=np.int64)
+        self.node_right = np.array(node_right, dtype=np.int64)
+        self.node_start = np.array(node_start, dtype=np.int64)
+        self.node_count = np.array(node_count, dtype=np.int64)
+
+        # Edge ids of every leaf stored contiguously (CSR), so the leaves hit
+        # by a ray expand to edges without any python loop
+        leaf_edges = []
+        self.node_edge_start = np.zeros(len(node_boxes), dtype=np.int64)
+        self.node_edge_count = np.zeros(len(node_boxes), dtype=np.int64)
+        for node in range(len(node_boxes)):
+            if self.node_left[node] != -1:
+                continue
+            self.node_edge_start[node] = len(leaf_edges)
+            for pid in order[self.node_start[node]:
+                             self.node_start[node] + self.node_count[node]]:
+                leaf_edges.extend(range(self.polygon_edge_start[pid],
+                                        self.polygon_edge_start[pid + 1]))
+            self.node_edge_count[node] = (len(leaf_edges)
+                                          - self.node_edge_start[node])
+        self.leaf_edges = np.array(leaf_edges, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def _leaf_polygons(self, node):
+        start = self.node_start[node]
+        return self.order[start:start + self.node_count[node]]
+
+    @staticmethod
+    def _segment_hits_boxes(segments, boxes):
+        # Vectorized slab test between segments (m x 4) and boxes (m x 4)
+        t_min = np.zeros(segments.shape[0])
+        t_max = np.ones(segments.shape[0])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for axis in (0, 1):
+                s = segments[:, axis]
+                d = segments[:, axis + 2] - s
+                t1 = (boxes[:, axis] - s) / d
+                t2 = (boxes[:, axis + 2] - s) / d
+                parallel = d == 0
+                inside = (s >= boxes[:, axis]) & (s <= boxes[:, axis + 2])
+                near = np.where(parallel, np.where(inside, -np.inf, np.inf),
+                                np.minimum(t1, t2))
+                far = np.where(parallel, np.where(inside, np.inf, -np.inf),
+                               np.maximum(t1, t2))
+                t_min = np.maximum(t_min, near)
+                t_max = np.minimum(t_max, far)
+
+        return t_min <= t_max
+
+    def candidate_pairs(self, segments):
+        """
+        Builds the (segment, edge) pairs worth testing for a batch of
+        segments. The tree is walked one level at a time for all the
+        segments together, keeping only the (segment, node) pairs whose
+        boxes overlap.
+
+        Returns:
+            Two arrays of the same length, segment ids and edge ids
+        """
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        empty = np.zeros(0, dtype=np.int64)
+        if not len(self.polygons) or not segments.shape[0]:
+            return empty, empty
+
+        seg = np.arange(segments.shape[0])
+        node = np.zeros(segments.shape[0], dtype=np.int64)
+        leaf_seg = []
+        leaf_node = []
+
+        while seg.shape[0]:
+            keep = self._segment_hits_boxes(segments[seg], self.node_boxes[node])
+            seg = seg[keep]
+            node = node[keep]
+
+            leaf = self.node_left[node] == -1
+            leaf_seg.append(seg[leaf])
+            leaf_node.append(node[leaf])
+
+            seg = np.repeat(seg[~leaf], 2)
+            children = np.empty(seg.shape[0], dtype=np.int64)
+            children[0::2] = self.node_left[node[~leaf]]
+            children[1::2] = self.node_right[node[~leaf]]
+            node = children
+
+        leaf_seg = np.concatenate(leaf_seg)
+        leaf_node = np.concatenate(leaf_node)
+
+        starts = self.node_edge_start[leaf_node]
+        counts = self.node_edge_count[leaf_node]
+        total = int(counts.sum())
+        seg_ids = np.repeat(leaf_seg, counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        edge_ids = self.leaf_edges[np.repeat(starts, counts) + offsets]
+
+        return seg_ids, edge_ids
+
+    def ray_cast(self, x1, y1, x2, y2):
+        """
+        Returns the parameter t in [0, 1] of the nearest obstacle hit along
+        the segment (x1, y1) -> (x2, y2), 1.0 when nothing is hit.
+        """
+        if not len(self.polygons):
+            return 1.0
+
+        dx = x2 - x1
+        dy = y2 - y1
+        inv_dx = 1.0 / dx if dx != 0 else float('inf')
+        inv_dy = 1.0 / dy if dy != 0 else float('inf')
+
+        def entry(box, best):
+            # Slab test, returns the parameter where the segment enters the
+            # box or None when it misses it before reaching t = best
+            t_min = 0.0
+            t_max = best
+            for s, inv, lo, hi in ((x1, inv_dx, box[0], box[2]),
+                                   (y1, inv_dy, box[1], box[3])):
+                if inv == float('inf'):
+                    if s < lo or s > hi:
+                        return None
+                    continue
+                t1 = (lo - s) * inv
+                t2 = (hi - s) * inv
+                if t1 > t2:
+                    t1, t2 = t2, t1
+                t_min = max(t_min, t1)
+                t_max = min(t_max, t2)
+                if t_min > t_max:
+                    return None
+            return t_min
+
+        best = 1.0
+        heap = [(0.0, 0)]
+
+        # Nearest box first, boxes entered after the best hit are skipped
+        while heap:
+            t_enter, node = heapq.heappop(heap)
+            if t_enter > best:
+                break
+            if entry(self.node_boxes[node], best) is None:
+                continue
+
+            if self.node_left[node] != -1:
+                for child in (self.node_left[node], self.node_right[node]):
+                    t_child = entry(self.node_boxes[child], best)
+                    if t_child is not None:
+                        heapq.heappush(heap, (t_child, child))
+                continue
+
+            start = self.node_edge_start[node]
+            e = self.edges[self.leaf_edges[start:start + self.node_edge_count[node]]]
+            if e.shape[0]:
+                t = segment_hit_params(x1, y1, x2, y2, e[:, 0], e[:, 1],
+                                       e[:, 2] - e[:, 0], e[:, 3] - e[:, 1])
+                best = min(best, float(t.min()))
+
+        return best
+
+    def contains_point(self, x, y):
+        """
+        Returns the index of the polygon that contains the point (x, y), or
+        -1 if the point is free.
+        """
+        if not len(self.polygons):
+            return -1
+
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            box = self.node_boxes[node]
+            if x < box[0] or x > box[2] or y < box[1] or y > box[3]:
+                continue
+
+            if self.node_left[node] != -1:
+                stack.append(self.node_right[node])
+                stack.append(self.node_left[node])
+                continue
+
+            for pid in self._leaf_polygons(node):
+                b = self.polygon_boxes[pid]
+                if (b[0] <= x <= b[2] and b[1] <= y <= b[3]
+                        and point_in_polygon(x, y, self.polygons[pid])):
+                    return int(pid)
+
+        return -1
+
+    def nearest_obstacle(self, x, y):
+        """
+        Returns a tuple (polygon index, distance) with the obstacle closest
+        to the point (x, y). The distance is 0.0 if the point is inside an
+        obstacle and the index is -1 when there are no obstacles at all.
+        """
+        if not len(self.polygons):
+            return -1, float('inf')
+
+        def box_distance(box):
+            dx = max(box[0] - x, 0.0, x - box[2])
+            dy = max(box[1] - y, 0.0, y - box[3])
+            return (dx * dx + dy * dy) ** .5
+
+        best_id = -1
+        best = float('inf')
+        heap = [(box_distance(self.node_boxes[0]), 0)]
+
+        # Best first search, nodes farther than the best obstacle found so far
+        # are never opened
+        while heap:
+            dist, node = heapq.heappop(heap)
+            if dist >= best:
+                break
+
+            if self.node_left[node] != -1:
+                for child in (self.node_left[node], self.node_right[node]):
+                    heapq.heappush(heap, (box_distance(self.node_boxes[child]), child))
+                continue
+
+            for pid in self._leaf_polygons(node):
+                if box_distance(self.polygon_boxes[pid]) >= best:
+                    continue
+                if point_in_polygon(x, y, self.polygons[pid]):
+                    return int(pid), 0.0
+                edges = self.edges[self.polygon_edge_start[pid]:
+                                   self.polygon_edge_start[pid + 1]]
+                d = float(point_segments_distance(x, y, edges).min())
+                if d < best:
+                    best_id = int(pid)
+                    best = d
+
+        return best_id, best
+
+
+if __name__ == '__main__':
+    # Microbenchmark: query time must grow logarithmically with the number of
+    # polygons, scale up a synthetic world and time every kind of query
+    import math
+    import time
+    from raycasting import RayCaster
+
+    square = [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]
+    triangle = [(3, 0), (4, 0), (3.5, 1), (3, 0)]
+    bvh = PolygonBVH([square, triangle])
+    assert bvh.contains_point(.5, .5) == 0
+    assert bvh.contains_point(3.5, .2) == 1
+    assert bvh.contains_point(2, .5) == -1
+    assert bvh.nearest_obstacle(2, .5) == (0, 1.0)
+    assert abs(bvh.ray_cast(-1, .5, 5, .5) - 1 / 6) < 1e-12
+    assert bvh.ray_cast(-1, 2, 5, 2) == 1.0
+    assert PolygonBVH().contains_point(0, 0) == -1
+
+    rng = np.random.RandomState(0)
+    queries = 200
+    print('polygons   ray_cast  contains  nearest   (us/query)')
+    for count in (1000, 2000, 4000, 8000, 16000):
+        side = math.sqrt(count) * 2
+        polygons = []
+        for cx, cy in rng.uniform(0, side, (count, 2)):
+            k = rng.randint(3, 7)
+            angles = np.sort(rng.uniform(0, 2 * math.pi, k))
+            poly = [(cx + .4 * math.cos(a), cy + .4 * math.sin(a)) for a in angles]
+            polygons.append(poly + poly[:1])
+
+        bvh = PolygonBVH(polygons)
+        points = rng.uniform(0, side, (queries, 2))
+        angles = rng.uniform(0, 2 * math.pi, queries)
+        segments = np.column_stack((points, points + 2 * np.column_stack(
+            (np.cos(angles), np.sin(angles)))))
+
+        # The batched ray queries must agree with the brute force engine
+        brute = RayCaster(polygons, index=None)
+        indexed = RayCaster(polygons, index=bvh)
+        expected = brute.cast_segments(segments)
+        assert np.allclose(expected, indexed.cast_segments(segments))
+        assert np.allclose(expected, [bvh.ray_cast(*s) for s in segments])
+
+        start = time.time()
+        for s in segments:
+            bvh.ray_cast(*s)
+        ray_time = (time.time() - start) * 1e6 / queries
+
+        start = time.time()
+        for x, y in points:
+            bvh.contains_point(x, y)
+        contains_time = (time.time() - start) * 1e6 / queries
+
+        start = time.time()
+        for x, y in points:
+            bvh.nearest_obstacle(x, y)
+        nearest_time = (time.time() - start) * 1e6 / queries
+
+        print('{:8d} {:10.1f} {:9.1f} {:8.1f}'.format(
+            count, ray_time, contains_time, nearest_time))
@@ -0,0 +1,175 @@
+from __future__ import division, print_function
+import math
+import os
+import numpy as np
+from world import World, load_world
+from polar_depth import PolarDepthCache
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class SimulationEngine(object):
+    """
+    Simulation state with no Tk widget behind it. Everything the GUI keeps
+    in entries and canvas pixels is a plain attribute here, in meters and
+    radians:
+
+        x, y, theta                 -> Pose of the robot
+        radio, advance, turn_angle  -> Robot parameters
+        num_sensors, origin, range,
+        value, noise                -> Laser parameters
+        world_name, world           -> Map and its cached World
+        light_x, light_y, behavior  -> Goal and behavior of the simulation
+        max_steps, steps, running   -> Simulation progress
+
+    step() has the same semantics as the simulator_robot_step service of
+    the GUI. Anything that wants to follow the simulation (the Tk GUI, a
+    logger...) appends a callable to observers, it is called with the engine
+    after every change of the pose or the map.
+    """
+
+    def __init__(self, world_name='arena', data_dir=DATA_DIR):
+        self.data_dir = data_dir
+
+        self.x = 0.5
+        self.y = 0.5
+        self.theta = 0.0
+        self.radio = 0.06
+        self.advance = 0.04
+        self.turn_angle = 0.7857
+
+        self.num_sensors = 20
+        self.origin = -1.5707
+        self.range = 3.1415
+        self.value = 0.05
+        self.noise = False
+
+        self.light_x = 0.0
+        self.light_y = 0.0
+        self.behavior = 4
+        self.max_steps = 100
+        self.steps = 0
+        self.running = False
+
+        self.observers = []
+        self.polar_depth = PolarDepthCache()
+        self.world_name = world_name
+        self.world = World()
+        if world_name:
+            self.load_world(world_name)
+
+    def notify(self):
+        for observer in self.observers:
+            observer(self)
+
+    def load_world(self, name):
+        """
+        Switches to the map src/data/<name>/<name>.wrl, raises IOError or
+        OSError when it doesn't exist.
+        """
+        self.world = load_world(self.data_dir, name)
+        self.world_name = name
+        self.notify()
+
+    def set_pose(self, x, y, theta=None):
+        self.x = float(x)
+        self.y = float(y)
+        if theta is not None:
+            self.theta = float(theta) % (math.pi * 2)
+        self.notify()
+
+    def start(self, light_x=None, light_y=None):
+        # Same as the run simulation button
+        if light_x is not None:
+            self.light_x = float(light_x)
+        if light_y is not None:
+            self.light_y = float(light_y)
+        self.steps = 0
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def step(self, theta, distance):
+        """
+        Turns theta radians and then advances distance meters, just like a
+        simulator_robot_step request. The step that reaches max_steps stops
+        the simulation instead of moving the robot.
+
+        Returns:
+            The new pose (x, y, theta)
+        """
+        self.steps = self.steps + 1
+        if self.steps == self.max_steps:
+            self.stop()
+        else:
+            self.theta = (self.theta + theta) % (math.pi * 2)
+            self.x = self.x + distance * math.cos(self.theta)
+            self.y = self.y + distance * math.sin(self.theta)
+            self.notify()
+
+        return self.x, self.y, self.theta
+
+    def sensor_angles(self):
+        step = self.range / (self.num_sensors - 1)
+        return self.theta + self.origin + step * np.arange(self.num_sensors)
+
+    def laser_values(self):
+        """
+        Distance in meters to the nearest obstacle along each laser ray,
+        value when the ray doesn't hit anything. Taken from the depth profile
+        around the robot while it only turns.
+        """
+        return self.polar_depth.cast(self.world.ray_caster, self.x, self.y,
+                                     self.sensor_angles(), self.value)
+
+    def inside_obstacle(self):
+        return self.world.obstacles.contains_point(self.x, self.y) >= 0
+
+    def parameters(self):
+        """
+        Simulation parameters in the order MobileRobotSimulator.get_parameters
+        returns them, so the same code can publish them.
+        """
+        return [self.x, self.y, self.theta, self.radio, self.advance,
+                self.turn_angle, self.num_sensors, self.origin, self.range,
+                self.value, self.world_name, self.noise, self.light_x,
+                self.light_y, self.running, self.behavior,
+                False, False, False, False, False, []]
+
+
+if __name__ == '__main__':
+    # Runs many short behavior trials as fast as the CPU allows: the robot
+    # advances until a laser reading is short and then turns away from it
+    import time
+
+    engine = SimulationEngine('random_1')
+    engine.max_steps = 200
+    rng = np.random.RandomState(0)
+    trials = 200
+    steps = 0
+    collisions = 0
+
+    start = time.time()
+    for _ in range(trials):
+        while True:
+            x, y = rng.uniform(0.05, 0.95, 2)
+            engine.set_pose(x, y, rng.uniform(0, 2 * math.pi))
+            if not engine.inside_obstacle():
+                break
+        engine.start()
+
+        while engine.running:
+            readings = engine.laser_values()
+            if readings.min() < engine.value:
+                side = 1 if readings.argmin() < engine.num_sensors / 2 else -1
+                engine.step(side * engine.turn_angle, 0.0)
+            else:
+                engine.step(0.0, engine.advance / 4)
+            steps = steps + 1
+        collisions = collisions + engine.inside_obstacle()
+
+    elapsed = time.time() - start
+    assert steps == trials * engine.max_steps
+    print('{} trials, {} steps in {:.2f} s ({:.0f} steps/s), {} ended inside an '
+          'obstacle'.format(trials, steps, elapsed, steps / elapsed, collisions))
@@ -0,0 +1,240 @@
+from __future__ import division, print_function
+import math
+import os
+import numpy as np
+from aux_stats import RunningStatistics, RunningErrors
+
+# Standard deviations of the noise simulator_base (base_node.cpp) adds to
+# every step when the noise of the simulation is on
+STDDEV_DISTANCE = 0.005
+STDDEV_THETA = 0.05
+
+# check_path of base_node walks the advance in steps of this length along x
+# or y, whichever the heading is closer to
+COLLISION_STEP = 0.005
+
+
+def wrap_angle(angle):
+    # Same normalization MobileRobotSimulator.plot_robot_values applies to
+    # the angle shown in the GUI
+    angle = np.asarray(angle, dtype=np.float64)
+    two_pi = math.pi * 2
+    angle = np.where(angle > two_pi, np.mod(angle, two_pi), angle)
+    return np.where(angle < 0, two_pi - np.mod(-angle, two_pi), angle)
+
+
+def test_values(start, end=None, increment=None):
+    """
+    Values of a test, the single one start or, like the multiple tests of
+    the GUI, from start while they are not greater than end.
+    """
+    if end is None or not increment:
+        return [start]
+    count = int(math.floor((end - start) / increment + 1e-9)) + 1
+    # Rounded so the accumulated floating point error of the increments
+    # doesn't leak into the values, 0.1 + 0.3 * 3 is 1.0 and not 0.99999...
+    return [round(start + increment * i, 10) for i in range(max(count, 0))]
+
+
+def rotation_trials(turn_angles, trials, start_angle=0.0, noise=True, rng=np.random,
+                    stddev_theta=STDDEV_THETA):
+    """
+    Runs trials turns of each one of turn_angles (degrees) from start_angle
+    (radians), the BEHAVIOUR_TEST_TWIST test of the GUI.
+
+    Returns:
+        Array m x trials x 4 with the rows the GUI saves for each turn
+        angle: expected degrees, expected radians, real degrees and real
+        radians
+    """
+    turn = np.radians(np.asarray(turn_angles, dtype=np.float64).reshape(-1, 1))
+    expected = np.broadcast_to(start_angle + turn, (turn.shape[0], trials))
+    real = expected
+    if noise:
+        real = expected + rng.normal(0.0, stddev_theta, expected.shape)
+    real = wrap_angle(real)
+    return np.stack((np.degrees(expected), expected, np.degrees(real), real), axis=-1)
+
+
+def advance_trials(advances, trials, x=0.5, y=0.5, angle=0.0, noise=True, rng=np.random,
+                   grid=None, radio=0.06, stddev_distance=STDDEV_DISTANCE,
+                   stddev_theta=STDDEV_THETA):
+    """
+    Runs trials advances of each one of advances (meters) from the pose
+    (x, y, angle), the BEHAVIOUR_TEST_ADVANCE test of the GUI.
+
+    The path is walked like check_path of base_node.cpp: COLLISION_STEP at a
+    time along x, or along y when the slope of the heading is steeper than
+    1, until it passes the advance or the robot of radius radio touches an
+    obstacle of the OccupancyGrid grid. It then goes back one step, so the
+    real distance is always a whole number of steps. The start pose must be
+    free.
+
+    Returns:
+        Array m x trials x 2 with the rows the GUI saves for each advance:
+        expected distance and real distance, both as lengths
+    """
+    advance = np.asarray(advances, dtype=np.float64).reshape(-1, 1)
+    expected = np.broadcast_to(advance, (advance.shape[0], trials))
+    real = np.array(expected)
+    heading = np.full(expected.shape, float(angle))
+    if noise:
+        heading = heading + rng.normal(0.0, stddev_theta, expected.shape)
+        real = real + rng.normal(0.0, stddev_distance, expected.shape)
+
+    if grid is not None and not grid.is_free(x, y):
+        raise ValueError('The start pose ({}, {}) is inside an obstacle'.format(x, y))
+
+    # Length of the path in each step along the axis it is walked on, and
+    # the last whole step before passing the advance
+    cos, sin = np.cos(heading), np.sin(heading)
+    step = COLLISION_STEP / np.maximum(np.abs(cos), np.abs(sin))
+    last = np.floor(np.abs(real) / step + 1e-9).astype(int)
+    if grid is not None:
+        # Every step of every path in one call to the distance field
+        steps = np.sign(real)[..., None] * step[..., None] * np.arange(last.max() + 1)
+        touching = grid.clearance(x + steps * cos[..., None], y + steps * sin[..., None]) <= radio
+        touching &= np.arange(last.max() + 1) <= last[..., None]
+        last = np.where(touching.any(axis=-1), np.maximum(touching.argmax(axis=-1) - 1, 0), last)
+    real = np.sign(real) * last * step
+
+    return np.stack((np.abs(expected), np.abs(real)), axis=-1)
+
+
+class HistoryBuffer(object):
+    """
+    Rows of an error test as they arrive. The rows live in a preallocated
+    array that doubles its capacity when it is full, so appending is
+    amortized O(1) instead of copying the whole history with np.vstack on
+    every sample.
+
+    The statistics of every column and the errors of the (expected, real)
+    column pairs given are kept by running accumulators of aux_stats as
+    rows are appended, so the statistics of a long test cost the same after
+    every sample.
+    """
+
+    def __init__(self, columns, pairs=(), capacity=64):
+        self.rows = np.empty((max(capacity, 1), columns))
+        self.size = 0
+        self.pairs = tuple(pairs)
+        self.columns = RunningStatistics()
+        self.pair_errors = [RunningErrors() for _ in self.pairs]
+
+    def __len__(self):
+        return self.size
+
+    def __array__(self, dtype=None):
+        return self.data if dtype is None else self.data.astype(dtype)
+
+    @property
+    def data(self):
+        # View of the rows appended so far, valid until the next append
+        return self.rows[:self.size]
+
+    def append(self, row):
+        if self.size == self.rows.shape[0]:
+            rows = np.empty((self.rows.shape[0] * 2, self.rows.shape[1]))
+            rows[:self.size] = self.rows
+            self.rows = rows
+        row = np.asarray(row, dtype=np.float64)
+        self.rows[self.size] = row
+        self.size = self.size + 1
+
+        self.columns.update(row)
+        for errors, (expected, real) in zip(self.pair_errors, self.pairs):
+            errors.update(row[expected], row[real])
+
+    def statistics(self, column):
+        """
+        Same (mean, var) as calculate_statistics(data[:, column]).
+        """
+        if self.size == 0:
+            return 0, 0
+        mean, var = self.columns.statistics()
+        return mean[column], var[column]
+
+    def errors(self, pair=0):
+        """
+        Same (error mean, error var) as calculate_errors over the columns of
+        pairs[pair].
+        """
+        return self.pair_errors[pair].errors()
+
+
+def results_path(tests_dir, test_type, value, suffix=''):
+    """
+    File of the results of a test with the GUI naming: rotation_<degrees>
+    or advance_<centimeters>, rounded to integers so there are no dots in
+    the name.
+    """
+    if test_type == 'angle':
+        name = 'rotation_{}{}.dat'.format(int(round(value)), suffix)
+    else:
+        name = 'advance_{}{}.dat'.format(int(round(value * 100)), suffix)
+    return os.path.join(tests_dir, name)
+
+
+def write_results(path, history):
+    with open(path, 'w') as f:
+        for row in np.asarray(history).tolist():
+            f.write(' '.join('{:.4f}'.format(n) for n in row) + '\n')
+
+
+if __name__ == '__main__':
+    # Runs a sweep of rotation or advance tests from the command line and
+    # writes the same files the error test windows of the GUI save
+    import argparse
+    import time
+    from aux_stats import calculate_statistics, calculate_errors
+    from world import load_world
+
+    base = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    parser = argparse.ArgumentParser(description='Batch advance and twist error tests')
+    parser.add_argument('test', choices=('rotation', 'advance'))
+    parser.add_argument('start', type=float,
+                        help='turn angle in degrees or advance in meters')
+    parser.add_argument('--end', type=float, help='last value of a multiple test')
+    parser.add_argument('--inc', type=float, help='increment of a multiple test')
+    parser.add_argument('-n', '--trials', type=int, default=100)
+    parser.add_argument('--suffix', default='', help='appended to the file names')
+    parser.add_argument('--pose', type=float, nargs=3, default=(0.5, 0.5, 0.0),
+                        metavar=('X', 'Y', 'THETA'), help='start pose in meters and radians')
+    parser.add_argument('--world', help='map whose obstacles stop the advance')
+    parser.add_argument('--radio', type=float, default=0.06, help='robot radius in meters')
+    parser.add_argument('--no-noise', dest='noise', action='store_false')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--tests-dir', default=os.path.join(base, 'data', 'tests'))
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    values = test_values(args.start, args.end, args.inc)
+    x, y, theta = args.pose
+
+    start = time.time()
+    if args.test == 'rotation':
+        test_type = 'angle'
+        results = rotation_trials(values, args.trials, theta, args.noise, rng)
+        real = results[..., 3]
+        pairs = results[..., (1, 3)]
+    else:
+        test_type = 'advance'
+        grid = load_world(os.path.join(base, 'data'), args.world).grid() if args.world else None
+        if grid is not None and not grid.is_free(x, y):
+            parser.error('the start pose ({}, {}) is inside an obstacle of {}'.format(x, y, args.world))
+        results = advance_trials(values, args.trials, x, y, theta, args.noise, rng, grid, args.radio)
+        real = results[..., 1]
+        pairs = results
+    elapsed = time.time() - start
+
+    if not os.path.isdir(args.tests_dir):
+        os.makedirs(args.tests_dir)
+    for i, value in enumerate(values):
+        path = results_path(args.tests_dir, test_type, value, args.suffix)
+        write_results(path, results[i])
+        mean, var = calculate_statistics(real[i])
+        err_mean, err_var = calculate_errors(pairs[i])
+        print('{:10.4f}  mean {:.4f} variance {:.6f}  error mean {:.4f} variance {:.6f}  {}'.format(
+            value, mean, var, err_mean, err_var, path))
+
+    print('{} trials x {} values in {:.3f} s'.format(args.trials, len(values), elapsed))
@@ -0,0 +1,294 @@
+from __future__ import division, print_function
+import math
+import numpy as np
+from raycasting import polygons_to_edges, intersect_pairs, MAX_BATCH_ELEMENTS
+
+
+class OccupancyGrid(object):
+    """
+    Raster of a map with square cells of side resolution (meters). Row r and
+    column c is the cell centered at ((c + 0.5) * resolution,
+    (r + 0.5) * resolution), so rows grow with y like the map coordinates.
+
+        occupied -> Boolean array rows x cols, cells whose center is inside
+                    an obstacle
+        distance -> Array rows x cols with the distance from each cell
+                    center to the nearest obstacle edge, 0 in occupied cells
+        blocked  -> Boolean array rows x cols, the occupied cells and the
+                    ones an obstacle edge passes through or next to
+
+    The distances are exact at the cell centers (computed against the
+    polygon edges, not from the raster) and interpolated bilinearly between
+    them by clearance(), which is off by a fraction of a cell except next to
+    walls thinner than a few cells, where it can overestimate. cast() only
+    steps by lower bounds of the distance, and in the blocked cells tests
+    the edges that pass next to them, so its rays neither go through thin
+    walls nor stop at obstacles they pass close by.
+    """
+
+    # Length, in cells, of the steps cast() takes next to obstacles
+    MARCH = 1.0
+
+    def __init__(self, width, height, polygons, resolution=0.01):
+        self.width = float(width)
+        self.height = float(height)
+        self.resolution = float(resolution)
+        cols = max(1, int(np.ceil(self.width / self.resolution)))
+        rows = max(1, int(np.ceil(self.height / self.resolution)))
+        self.shape = (rows, cols)
+
+        xs = (np.arange(cols) + 0.5) * self.resolution
+        ys = (np.arange(rows) + 0.5) * self.resolution
+
+        occupied = np.zeros(self.shape, dtype=bool)
+        for polygon in polygons:
+            polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+            if polygon.shape[0] < 3:
+                continue
+            c0, c1 = np.searchsorted(xs, [polygon[:, 0].min(), polygon[:, 0].max()])
+            r0, r1 = np.searchsorted(ys, [polygon[:, 1].min(), polygon[:, 1].max()])
+            if c0 == c1 or r0 == r1:
+                continue
+            occupied[r0:r1, c0:c1] |= _inside(xs[c0:c1], ys[r0:r1], polygon)
+        self.occupied = occupied
+
+        # A point closer than MARCH cells to an edge is in a cell whose
+        # center is closer than half the diagonal plus MARCH to it. Those
+        # edges are kept for every cell, in the order of the cells.
+        reach = self.resolution * (math.sqrt(2) / 2 + self.MARCH)
+        cell_ids = [np.zeros(0, dtype=np.int64)]
+        edge_ids = [np.zeros(0, dtype=np.int64)]
+
+        distance = np.full(rows * cols, np.inf)
+        edges = polygons_to_edges(polygons)
+        self.edges = edges
+        if edges.shape[0]:
+            px = np.tile(xs, rows)
+            py = np.repeat(ys, cols)
+            x1, y1 = edges[:, 0], edges[:, 1]
+            dx, dy = edges[:, 2] - x1, edges[:, 3] - y1
+            length2 = dx * dx + dy * dy
+            length2[length2 == 0] = 1.0
+            step = max(1, MAX_BATCH_ELEMENTS // edges.shape[0])
+            for start in range(0, rows * cols, step):
+                qx = px[start:start + step, None]
+                qy = py[start:start + step, None]
+                t = np.clip(((qx - x1) * dx + (qy - y1) * dy) / length2, 0.0, 1.0)
+                d = np.hypot(x1 + t * dx - qx, y1 + t * dy - qy)
+                distance[start:start + step] = d.min(axis=1)
+                cells, near = np.nonzero(d <= reach)
+                cell_ids.append(cells + start)
+                edge_ids.append(near)
+        cell_ids = np.concatenate(cell_ids)
+        self.cell_edges = np.concatenate(edge_ids)
+        self.cell_starts = np.searchsorted(cell_ids, np.arange(rows * cols + 1))
+
+        distance = distance.reshape(self.shape)
+        distance[occupied] = 0.0
+        self.distance = distance
+        near_edges = (np.diff(self.cell_starts) > 0).reshape(self.shape)
+        self.blocked = occupied | near_edges
+        self.interior = occupied & ~near_edges
+
+    def _cells(self, x, y):
+        col = np.clip((np.asarray(x) / self.resolution).astype(np.int64), 0, self.shape[1] - 1)
+        row = np.clip((np.asarray(y) / self.resolution).astype(np.int64), 0, self.shape[0] - 1)
+        return row, col
+
+    def _corners(self, x, y):
+        # The four cell centers around (x, y) and its position between them
+        rows, cols = self.shape
+        fx = np.clip(np.asarray(x) / self.resolution - 0.5, 0, max(cols - 1, 0))
+        fy = np.clip(np.asarray(y) / self.resolution - 0.5, 0, max(rows - 1, 0))
+        c = np.minimum(fx.astype(np.int64), max(cols - 2, 0))
+        r = np.minimum(fy.astype(np.int64), max(rows - 2, 0))
+        c1 = np.minimum(c + 1, cols - 1)
+        r1 = np.minimum(r + 1, rows - 1)
+        return r, c, r1, c1, fx - c, fy - r
+
+    def clearance(self, x, y):
+        """
+        Distance from (x, y) (scalars or arrays, meters) to the nearest
+        obstacle, 0 inside obstacles.
+        """
+        # Bilinear interpolation between the four nearest cell centers
+        r, c, r1, c1, ax, ay = self._corners(x, y)
+        d = self.distance
+        return ((d[r, c] * (1 - ax) + d[r, c1] * ax) * (1 - ay) +
+                (d[r1, c] * (1 - ax) + d[r1, c1] * ax) * ay)
+
+    def clearance_bound(self, x, y):
+        """
+        Lower bound of the distance from (x, y) to the nearest obstacle edge:
+        the distance is exact at the cell centers and changes at most as much
+        as the point moves, and the nearest of the four centers around the
+        point is at most half a diagonal away.
+        """
+        r, c, r1, c1, _, _ = self._corners(x, y)
+        d = self.distance
+        nearest = np.minimum(np.minimum(d[r, c], d[r, c1]), np.minimum(d[r1, c], d[r1, c1]))
+        return nearest - self.resolution * math.sqrt(2) / 2
+
+    def is_free(self, x, y):
+        row, col = self._cells(x, y)
+        return ~self.occupied[row, col]
+
+    def cast(self, x, y, angles, max_range, max_steps=1024):
+        """
+        Same as RayCaster.cast in meters, by sphere tracing the distance
+        field: every ray advances by clearance_bound() at its current point,
+        which can't cross an edge, or by MARCH cells when that is shorter.
+        In a blocked cell that step is tested against the edges next to the
+        cell, which include every edge it can cross, and the ray stops where
+        it hits one, or when it reaches an occupied cell or max_range.
+        """
+        angles = np.asarray(angles, dtype=np.float64)
+        cos, sin = np.cos(angles), np.sin(angles)
+        t = np.zeros(angles.shape)
+        active = np.ones(angles.shape, dtype=bool)
+        march = self.resolution * self.MARCH
+
+        for _ in range(max_steps):
+            if not active.any():
+                break
+            ids = np.flatnonzero(active)
+            px = x + t[ids] * cos[ids]
+            py = y + t[ids] * sin[ids]
+            row, col = self._cells(px, py)
+            step = np.maximum(self.clearance_bound(px, py), march)
+
+            # Occupied cells without edges next to them are inside obstacles
+            edges_next = self.blocked[row, col] & ~self.interior[row, col]
+            hit = self.interior[row, col]
+            near = np.flatnonzero(edges_next)
+            if near.shape[0]:
+                cell = row[near] * self.shape[1] + col[near]
+                first = self.cell_starts[cell]
+                counts = self.cell_starts[cell + 1] - first
+                pair_rays = np.repeat(np.arange(near.shape[0]), counts)
+                offsets = np.arange(pair_rays.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+                segments = np.column_stack((px[near], py[near],
+                                            px[near] + step[near] * cos[ids[near]],
+                                            py[near] + step[near] * sin[ids[near]]))
+                ta = intersect_pairs(segments, self.edges, pair_rays,
+                                     self.cell_edges[np.repeat(first, counts) + offsets])
+                crossed = ta < 1.0
+                step[near[crossed]] = step[near[crossed]] * ta[crossed]
+                hit[near[crossed]] = True
+                t[ids[near[crossed]]] += step[near[crossed]]
+
+            t[ids[~hit]] += step[~hit]
+            done = hit | (t[ids] >= max_range)
+            active[ids[done]] = False
+
+        return np.minimum(t, max_range)
+
+
+def _inside(xs, ys, polygon):
+    # Even-odd test of every (x, y) of the grid xs by ys against a closed
+    # polygon, vectorized over the columns of each row
+    inside = np.zeros((ys.shape[0], xs.shape[0]), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(polygon[:-1].tolist(), polygon[1:].tolist()):
+        if y1 == y2:
+            continue
+        rows = (ys > min(y1, y2)) & (ys <= max(y1, y2))
+        x_cross = x1 + (ys[rows] - y1) * (x2 - x1) / (y2 - y1)
+        inside[rows] ^= xs[None, :] < x_cross[:, None]
+    return inside
+
+
+if __name__ == '__main__':
+    # Accuracy and speed of the grid against the exact geometry on random_1:
+    # line_intersection (the per-segment code), the vectorized RayCaster and
+    # PolygonBVH.nearest_obstacle for the clearance
+    import math
+    import os
+    import time
+    from raycasting import line_intersection
+    from world import load_world
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+    world = load_world(data_dir, 'random_1')
+    rng = np.random.RandomState(0)
+    poses = []
+    while len(poses) < 200:
+        x, y = rng.uniform(0.05, 1.95, 2)
+        if world.obstacles.contains_point(x, y) < 0:
+            poses.append((x, y, rng.uniform(0, 2 * math.pi)))
+    num_sensors = 20
+    max_range = 0.5
+    edges = polygons_to_edges(world.polygons)
+
+    def angles(theta):
+        return theta - 1.5707 + 3.1415 / (num_sensors - 1) * np.arange(num_sensors)
+
+    start = time.time()
+    exact = []
+    for x, y, theta in poses:
+        for a in angles(theta).tolist():
+            end = (x + max_range * math.cos(a), y + max_range * math.sin(a))
+            exact.append(min([max_range] + [line_intersection((x, y), end, e[0:2], e[2:4], max_range)
+                                            for e in edges.tolist()]))
+    exact = np.array(exact)
+    scalar_ms = (time.time() - start) * 1e3 / len(poses)
+
+    start = time.time()
+    for x, y, theta in poses:
+        world.ray_caster.cast(x, y, angles(theta), max_range)
+    caster_ms = (time.time() - start) * 1e3 / len(poses)
+
+    points = rng.uniform(0, 2, (2000, 2))
+    start = time.time()
+    nearest = np.array([world.obstacles.nearest_obstacle(x, y)[1] for x, y in points.tolist()])
+    nearest_us = (time.time() - start) * 1e6 / len(points)
+
+    # Cast times are per pose (20 rays), clearance times per point. Errors
+    # are the mean and 99th percentile, "off" the rays wrong by more than
+    # two cells
+    print('{:>10s} {:>9s} {:>10s} {:>20s} {:>6s} {:>10s} {:>20s}'.format(
+        'resolution', 'build', 'cast', 'cast error', 'off', 'clearance', 'clearance error'))
+    print('{:>10s} {:>9s} {:7.3f} ms {:>20s} {:>6s} {:7.2f} us {:>20s}  line_intersection, nearest_obstacle'.format(
+        'exact', '', scalar_ms, '', '', nearest_us, ''))
+    print('{:>10s} {:>9s} {:7.3f} ms'.format('', '', caster_ms) + ' ' * 50 + 'RayCaster')
+
+    for resolution in (0.02, 0.01, 0.005):
+        start = time.time()
+        grid = load_world(data_dir, 'random_1', resolution).grid(resolution)
+        build_ms = (time.time() - start) * 1e3
+        assert grid is world.grid(resolution)
+
+        start = time.time()
+        traced = np.concatenate([grid.cast(x, y, angles(theta), max_range) for x, y, theta in poses])
+        cast_ms = (time.time() - start) * 1e3 / len(poses)
+
+        start = time.time()
+        clearance = grid.clearance(points[:, 0], points[:, 1])
+        clearance_us = (time.time() - start) * 1e6 / len(points)
+
+        cast_error = np.abs(traced - exact)
+        clearance_error = np.abs(clearance - nearest)
+        off = (cast_error > 2 * resolution).mean()
+        assert cast_error.mean() < resolution / 2 and off < 0.02
+        assert clearance_error.max() < resolution
+
+        print('{:10.3f} {:6.1f} ms {:7.3f} ms {:8.4f} m {:8.4f} m {:5.1f}% {:7.2f} us {:8.4f} m {:8.4f} m'.format(
+            resolution, build_ms, cast_ms, cast_error.mean(), np.percentile(cast_error, 99),
+            off * 100, clearance_us, clearance_error.mean(), np.percentile(clearance_error, 99)))
+
+    # Rays of 1 m all around poses 0.1 to 0.2 m from the obstacles, where
+    # they pass next to thin walls and corners: none may go through a wall
+    # (overshoot) or stop at an obstacle it passes by (early)
+    grid = world.grid(0.01)
+    near_poses = []
+    while len(near_poses) < 600:
+        x, y = rng.uniform(0.05, 1.95, 2)
+        if world.obstacles.contains_point(x, y) < 0 and 0.1 <= world.obstacles.nearest_obstacle(x, y)[1] <= 0.2:
+            near_poses.append((x, y))
+    around = np.linspace(0, 2 * math.pi, 38, endpoint=False)
+    exact = np.concatenate([world.ray_caster.cast(x, y, around, 1.0) for x, y in near_poses])
+    traced = np.concatenate([grid.cast(x, y, around, 1.0) for x, y in near_poses])
+    overshoot = (traced - exact > 0.05).sum()
+    early = (exact - traced > 0.05).sum()
+    assert overshoot == 0 and early == 0
+    print('{} rays of 1 m next to obstacles: {} through a wall, {} stopped early by more than 5 cm, '
+          'max error {:.2e} m'.format(exact.shape[0], overshoot, early, np.abs(traced - exact).max()))
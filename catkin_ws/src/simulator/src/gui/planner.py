@@ -0,0 +1,245 @@
+from __future__ import division, print_function
+import heapq
+import math
+import numpy as np
+from world import load_graph
+
+ALGORITHMS = ('table', 'dijkstra', 'astar')
+
+# Planners of the maps used so far, map name -> (TopologicalGraph, PathPlanner)
+_planners = {}
+
+
+class PathPlanner(object):
+    """
+    Shortest paths over a TopologicalGraph. Every search returns the list of
+    nodes from start to goal (empty when goal can't be reached) and the cost
+    of that path:
+
+        dijkstra -> Heap based Dijkstra
+        astar    -> A* with the Euclidean distance to the goal as heuristic,
+                    it gives optimal paths as long as no connection costs less
+                    than the distance between its nodes (true for the .top
+                    files, their costs are those distances)
+        table    -> Lookup in the all-pairs table, computed on first use
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        # Plain lists are much faster than arrays for the element by element
+        # access of the searches
+        self.indptr = graph.indptr.tolist()
+        self.indices = graph.indices.tolist()
+        self.costs = graph.costs.tolist()
+        self.coords = graph.coords.tolist()
+        self.distances = None
+        self.next_hop = None
+
+    def dijkstra(self, start, goal):
+        return self._search(start, goal, None)
+
+    def astar(self, start, goal):
+        gx, gy = self.coords[goal]
+        coords = self.coords
+        return self._search(start, goal,
+                            lambda node: math.hypot(coords[node][0] - gx, coords[node][1] - gy))
+
+    def _search(self, start, goal, heuristic):
+        indptr, indices, costs = self.indptr, self.indices, self.costs
+        best = {start: 0.0}
+        parent = {start: -1}
+        done = set()
+        heap = [(heuristic(start) if heuristic else 0.0, start)]
+        while heap:
+            _, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            if node == goal:
+                return self._unwind(parent, goal), best[goal]
+            done.add(node)
+
+            cost = best[node]
+            for i in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[i]
+                new_cost = cost + costs[i]
+                if new_cost < best.get(neighbor, float('inf')):
+                    best[neighbor] = new_cost
+                    parent[neighbor] = node
+                    priority = new_cost + heuristic(neighbor) if heuristic else new_cost
+                    heapq.heappush(heap, (priority, neighbor))
+
+        return [], float('inf')
+
+    @staticmethod
+    def _unwind(parent, goal):
+        path = []
+        node = goal
+        while node != -1:
+            path.append(node)
+            node = parent[node]
+        path.reverse()
+        return path
+
+    def all_pairs(self):
+        """
+        Computes (once) the tables of the cost of the shortest path between
+        every pair of nodes and of the node that follows the first one in
+        that path, with the Floyd-Warshall algorithm.
+        """
+        if self.distances is not None:
+            return self.distances
+
+        n = len(self.graph)
+        distances = np.full((n, n), np.inf)
+        edges = self.graph.edges()
+        np.minimum.at(distances, (edges[:, 0], edges[:, 1]), self.graph.costs)
+        np.fill_diagonal(distances, 0.0)
+        next_hop = np.where(np.isfinite(distances), np.arange(n), -1)
+
+        for k in range(n):
+            through_k = distances[:, k:k + 1] + distances[k:k + 1, :]
+            shorter = through_k < distances
+            distances[shorter] = through_k[shorter]
+            next_hop[shorter] = np.broadcast_to(next_hop[:, k:k + 1], (n, n))[shorter]
+
+        self.distances = distances
+        self.next_hop = next_hop.tolist()
+        return distances
+
+    def table(self, start, goal):
+        self.all_pairs()
+        cost = float(self.distances[start, goal])
+        if math.isinf(cost):
+            return [], cost
+        path = [start]
+        node = start
+        while node != goal:
+            node = self.next_hop[node][goal]
+            path.append(node)
+        return path, cost
+
+    def shortest_path(self, start, goal, algorithm='table'):
+        """
+        Path between the nodes start and goal with one of ALGORITHMS, raises
+        ValueError for any other algorithm.
+        """
+        if algorithm not in ALGORITHMS:
+            raise ValueError('unknown algorithm {!r}, expected one of {}'.format(
+                algorithm, ', '.join(ALGORITHMS)))
+        return getattr(self, algorithm)(start, goal)
+
+    def plan(self, x1, y1, x2, y2, algorithm='table'):
+        """
+        Path from the node nearest to (x1, y1) to the node nearest to
+        (x2, y2), the way motion_planner_node picks them.
+        """
+        if not len(self.graph):
+            return [], float('inf')
+        return self.shortest_path(self.graph.nearest_node(x1, y1),
+                                  self.graph.nearest_node(x2, y2), algorithm)
+
+
+def load_planner(data_dir, name):
+    """
+    Returns the PathPlanner of the map, kept (with its all-pairs table) as
+    long as load_graph returns the same graph.
+    """
+    graph = load_graph(data_dir, name)
+
+    cached = _planners.get(name)
+    if cached is not None and cached[0] is graph:
+        return cached[1]
+
+    planner = PathPlanner(graph)
+    _planners[name] = (graph, planner)
+    return planner
+
+
+if __name__ == '__main__':
+    # Compares the planners with dijkstra() of state_machines/dijkstra.h,
+    # used by motion_planner_node. It can't be called outside of the node,
+    # cpp_dijkstra is a line by line port of it: every call reads the .top
+    # file and looks for the next node to expand with a linear scan.
+    import os
+    import time
+    import world
+
+    def cpp_dijkstra(path, rx, ry, lx, ly):
+        nodes = []
+        with open(path) as top:
+            for words in (line.split() for line in top):
+                if len(words) > 1 and words[1] == 'node':
+                    nodes.append({'x': float(words[3]), 'y': float(words[4]),
+                                  'conections': [], 'flag': 'N', 'parent': -1,
+                                  'acumulado': 0.0})
+                elif len(words) > 1 and words[1] == 'connection':
+                    nodes[int(words[2])]['conections'].append((int(words[3]), float(words[4])))
+
+        start = goal = 0
+        for i in range(1, len(nodes)):
+            if math.hypot(nodes[i]['x'] - rx, nodes[i]['y'] - ry) < math.hypot(nodes[start]['x'] - rx, nodes[start]['y'] - ry):
+                start = i
+            if math.hypot(nodes[i]['x'] - lx, nodes[i]['y'] - ly) < math.hypot(nodes[goal]['x'] - lx, nodes[goal]['y'] - ly):
+                goal = i
+
+        D = goal
+        nodes[D]['acumulado'] = 0.0
+        while nodes[start]['flag'] != 'Y':
+            for node, cost in nodes[D]['conections']:
+                if nodes[node]['flag'] == 'N':
+                    nodes[node].update(acumulado=nodes[D]['acumulado'] + cost, parent=D, flag='P')
+                elif nodes[node]['flag'] == 'P' and nodes[node]['acumulado'] > nodes[D]['acumulado'] + cost:
+                    nodes[node].update(acumulado=nodes[D]['acumulado'] + cost, parent=D)
+            nodes[D]['flag'] = 'Y'
+            menor = None
+            for j in range(len(nodes)):
+                if nodes[j]['flag'] == 'P' and (menor is None or nodes[menor]['acumulado'] > nodes[j]['acumulado']):
+                    menor = j
+            if menor is None and nodes[start]['flag'] != 'Y':
+                # The C++ code keeps expanding node 0 forever here
+                return [], float('inf')
+            D = menor
+
+        steps = []
+        padre = start
+        while padre != -1:
+            steps.append(padre)
+            padre = nodes[padre]['parent']
+        return steps, nodes[start]['acumulado']
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+    names = sorted(n for n in os.listdir(data_dir)
+                   if n.startswith('random_') and os.path.isfile(world.top_path(data_dir, n)))
+    rng = np.random.RandomState(0)
+    queries = 50
+
+    print('{:10s} {:>5s} {:>12s} {:>12s} {:>12s} {:>12s} {:>10s}'.format(
+        'map', 'nodes', 'dijkstra.h', 'dijkstra', 'astar', 'table', 'all-pairs'))
+    for name in names:
+        planner = load_planner(data_dir, name)
+        width, height = world.read_wrl(world.wrl_path(data_dir, name))[0:2]
+        points = rng.uniform(0, 1, (queries, 4)) * (width, height, width, height)
+
+        start = time.time()
+        planner.all_pairs()
+        table_ms = (time.time() - start) * 1e3
+
+        timings = {}
+        results = {}
+        for algorithm in ('cpp', 'dijkstra', 'astar', 'table'):
+            start = time.time()
+            if algorithm == 'cpp':
+                path = world.top_path(data_dir, name)
+                results[algorithm] = [cpp_dijkstra(path, *p) for p in points.tolist()]
+            else:
+                results[algorithm] = [planner.plan(*(p + [algorithm])) for p in points.tolist()]
+            timings[algorithm] = (time.time() - start) * 1e6 / queries
+
+        for algorithm in ('dijkstra', 'astar', 'table'):
+            for (path, cost), (cpp_path, cpp_cost) in zip(results[algorithm], results['cpp']):
+                assert cost == cpp_cost or abs(cost - cpp_cost) < 1e-6, (name, algorithm)
+                assert path[0:1] == cpp_path[0:1] and path[-1:] == cpp_path[-1:]
+
+        print('{:10s} {:5d} {:9.1f} us {:9.1f} us {:9.1f} us {:9.1f} us {:7.1f} ms'.format(
+            name, len(planner.graph), timings['cpp'], timings['dijkstra'],
+            timings['astar'], timings['table'], table_ms))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+# Shortest paths over the topological map (.top file) of a world, served by
+# simulator_plan_path. The request gives the start and goal in meters, the
+# nodes nearest to them are used. An empty world_name plans on the world the
+# simulator is showing and an empty algorithm uses the all-pairs table
+# (see planner.ALGORITHMS).
+
+import os
+import rospy
+from simulator.srv import *
+from simulator.msg import Parameters
+from planner import load_planner
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+current_world = ['']
+
+def handle_parameters(msg):
+	current_world[0] = msg.world_name
+
+def handle_plan_path(req):
+
+	resp = simulator_plan_pathResponse()
+	world_name = req.world_name or current_world[0]
+	try:
+		planner = load_planner(DATA_DIR, world_name)
+		path, cost = planner.plan(req.start_x, req.start_y, req.goal_x, req.goal_y,
+		                          req.algorithm or 'table')
+	except (IOError, OSError, ValueError) as e:
+		rospy.logwarn('simulator_plan_path on world %r: %s', world_name, e)
+		return resp
+
+	resp.success = bool(path)
+	resp.nodes = planner.graph.node_ids[path].tolist()
+	resp.x = planner.graph.coords[path, 0].tolist()
+	resp.y = planner.graph.coords[path, 1].tolist()
+	resp.cost = cost if path else 0.0
+	return resp
+
+def ros():
+	rospy.init_node('simulator_planner_node')
+	rospy.Subscriber('simulator_parameters_pub', Parameters, handle_parameters, queue_size=1)
+	a = rospy.Service('simulator_plan_path', simulator_plan_path, handle_plan_path)
+	rospy.spin()
+
+
+if __name__ == "__main__":
+	ros()
@@ -0,0 +1,279 @@
+from __future__ import division, print_function
+import math
+import numpy as np
+from spatial_index import EdgeGrid
+
+# Upper bound for the (rays x edges) intermediate arrays, so huge worlds are
+# processed in chunks instead of allocating everything at once
+MAX_BATCH_ELEMENTS = 1 << 20
+
+
+def polygons_to_edges(polygons):
+    """
+    Packs every edge of every polygon into a single contiguous float array.
+
+    Args:
+        polygons -> List of polygons, each one a list of (x, y) vertexes in
+                    which the last vertex repeats the first one (just like
+                    MobileRobotSimulator.read_map stores them)
+
+    Returns:
+        Array of shape n x 4, one row per edge
+
+        0 [x1, y1, x2, y2]
+        1 [x1, y1, x2, y2]
+        ...
+        n [x1, y1, x2, y2]
+    """
+    rows = []
+    for polygon in polygons:
+        for p, q in zip(polygon, polygon[1:]):
+            rows.append((p[0], p[1], q[0], q[1]))
+
+    return np.ascontiguousarray(np.array(rows, dtype=np.float64).reshape(-1, 4))
+
+
+def line_intersection(p1, p2, p3, p4, laser_value):
+    """
+    Scalar version of the intersection between the ray p1 -> p2 and the
+    segment p3 -> p4. It returns the distance from p1 to the intersection
+    point, or laser_value if they don't intersect.
+
+    This is the per-segment code the simulator used before RayCaster, it is
+    kept as the reference the vectorized engine is checked against.
+    """
+    denominadorTa = (p4[0]-p3[0])*(p1[1]-p2[1]) - (p1[0]-p2[0])*(p4[1]-p3[1])
+    denominadorTb = (p4[0]-p3[0])*(p1[1]-p2[1]) - (p1[0]-p2[0])*(p4[1]-p3[1])
+
+    if denominadorTa == 0 or denominadorTb == 0:
+        return laser_value
+
+    ta = ( (p3[1]-p4[1])*(p1[0]-p3[0]) + (p4[0]-p3[0])*(p1[1]-p3[1]) ) / float( denominadorTa )
+    tb = ( (p1[1]-p2[1])*(p1[0]-p3[0]) + (p2[0]-p1[0])*(p1[1]-p3[1]) ) / float( denominadorTb )
+
+    if 0 <= ta and ta <= 1 and 0 <= tb and tb <= 1:
+        xi = p1[0] + ta * ( p2[0] - p1[0] )
+        yi = p1[1] + ta * ( p2[1] - p1[1] )
+        return math.sqrt( (p1[0] - xi)**2 + (p1[1] - yi)**2 )
+    else:
+        return laser_value
+
+
+def segment_hit_params(sx, sy, ex, ey, edges_x1, edges_y1, edx, edy):
+    """
+    Parameter ta along the segments of their intersection with the edges,
+    1.0 where they don't intersect. Every argument is an array (or scalar)
+    and they are broadcast against each other. sx, sy are the segment starts,
+    ex, ey their ends, and edx, edy the edge directions.
+
+    Same sign conventions as line_intersection, so the results match the
+    scalar version as far as possible.
+    """
+    dx = sx - ex
+    dy = sy - ey
+
+    den = edx * dy - dx * edy
+    ox = sx - edges_x1
+    oy = sy - edges_y1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ta = (-edy * ox + edx * oy) / den
+        tb = (dy * ox - dx * oy) / den
+
+    hit = (den != 0) & (ta >= 0) & (ta <= 1) & (tb >= 0) & (tb <= 1)
+    return np.where(hit, ta, 1.0)
+
+
+def intersect_segments(segments, edges):
+    """
+    Intersects every segment against every edge in a single vectorized pass.
+
+    Args:
+        segments -> Array of shape m x 4 with the rays [x1, y1, x2, y2]
+        edges    -> Array of shape n x 4 with the obstacle edges
+
+    Returns:
+        Array of shape m with the parameter t in [0, 1] of the nearest hit
+        along each segment (1.0 when the segment hits nothing), so the hit
+        point is (x1, y1) + t * ((x2, y2) - (x1, y1))
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+    edges = np.asarray(edges, dtype=np.float64).reshape(-1, 4)
+
+    t = np.ones(segments.shape[0])
+    if segments.shape[0] == 0 or edges.shape[0] == 0:
+        return t
+
+    ex1 = edges[:, 0]
+    ey1 = edges[:, 1]
+    edx = edges[:, 2] - ex1
+    edy = edges[:, 3] - ey1
+
+    rows = max(1, MAX_BATCH_ELEMENTS // edges.shape[0])
+    for start in range(0, segments.shape[0], rows):
+        s = segments[start:start + rows]
+        ta = segment_hit_params(s[:, 0:1], s[:, 1:2], s[:, 2:3], s[:, 3:4],
+                                ex1, ey1, edx, edy)
+        t[start:start + rows] = ta.min(axis=1)
+
+    return t
+
+
+def intersect_pairs(segments, edges, seg_ids, edge_ids):
+    """
+    Same as intersect_segments but only the given (segment, edge) pairs are
+    tested, as returned by a spatial index.
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+
+    t = np.ones(segments.shape[0])
+    if seg_ids.shape[0] == 0:
+        return t
+
+    s = segments[seg_ids]
+    e = edges[edge_ids]
+    ta = segment_hit_params(s[:, 0], s[:, 1], s[:, 2], s[:, 3], e[:, 0], e[:, 1],
+                            e[:, 2] - e[:, 0], e[:, 3] - e[:, 1])
+    np.minimum.at(t, seg_ids, ta)
+
+    return t
+
+
+class RayCaster(object):
+    """
+    Raycasting engine over a static set of polygons. All the edges are kept
+    in one contiguous array so every sensor ray is intersected against its
+    candidate edges at once instead of one segment at a time.
+
+    The candidate edges of each ray come from a spatial index, so the cost of
+    a ray follows the part of the map it crosses and not the size of the map.
+    index can be:
+
+        - a class, built over the packed edges when the caster is created
+          (a uniform EdgeGrid by default)
+        - an index already built over the same polygons, like a PolygonBVH
+        - None, to test every ray against every edge
+    """
+
+    def __init__(self, polygons=(), index=EdgeGrid):
+        self.edges = polygons_to_edges(polygons)
+        self.index = index(self.edges) if callable(index) else index
+
+    def cast_segments(self, segments):
+        """
+        Returns the parameter of the nearest hit along each segment, see
+        intersect_segments.
+        """
+        if self.index is None:
+            return intersect_segments(segments, self.edges)
+
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        seg_ids, edge_ids = self.index.candidate_pairs(segments)
+        return intersect_pairs(segments, self.edges, seg_ids, edge_ids)
+
+    def cast(self, x, y, angles, max_range, scale=None):
+        """
+        Casts one ray per angle from (x, y) with length max_range and returns
+        an array with the distance to the nearest obstacle along each one
+        (max_range when nothing is hit).
+
+        scale -> Optional (sx, sy) factors from the frame of the rays to the
+                 frame of the polygons. The hit parameter along a segment
+                 doesn't change under scaling, so the distances are still
+                 returned in the frame of the rays.
+        """
+        angles = np.asarray(angles, dtype=np.float64).reshape(-1)
+        segments = np.empty((angles.shape[0], 4))
+        segments[:, 0] = x
+        segments[:, 1] = y
+        segments[:, 2] = max_range * np.cos(angles) + x
+        segments[:, 3] = max_range * np.sin(angles) + y
+
+        if scale is not None:
+            segments[:, 0::2] *= scale[0]
+            segments[:, 1::2] *= scale[1]
+
+        return self.cast_segments(segments) * max_range
+
+
+if __name__ == '__main__':
+    # Regression test: the vectorized engine must give the same sensor values
+    # as the per-segment code on every map of src/data
+    import os
+    from bvh import PolygonBVH
+    from world import parse_wrl
+
+    def isclose(a, b):
+        return abs(a - b) < 1e-9
+
+    def read_polygons(path, canvasX, canvasY):
+        # Same parsing and scaling MobileRobotSimulator.read_map uses
+        mapX = mapY = 1.0
+        polygons = []
+        for line in open(path):
+            words = line.split()
+            if words and words[0] == '(':
+                if words[1] == 'dimensions':
+                    mapX = float(words[3])
+                    mapY = float(words[4])
+                elif words[1] == 'polygon':
+                    vx = [canvasX * float(x) / mapX for x in words[4:len(words)-1:2]]
+                    vy = [canvasY * float(y) / mapY for y in words[5:len(words)-1:2]]
+                    polygons.append(list(zip(vx, vy)))
+        for p in polygons:
+            p.append(p[0])
+        return polygons, mapX, mapY
+
+    def per_segment_sensors(polygons, x, y, theta, origin, sensor_range,
+                            num_sensors, value):
+        values = []
+        f = theta + origin
+        step = sensor_range / (num_sensors - 1)
+        for _ in range(num_sensors):
+            p2 = [value * math.cos(f) + x, value * math.sin(f) + y]
+            best = value
+            for polygon in polygons:
+                for m in range(len(polygon) - 1):
+                    best = min(best, line_intersection([x, y], p2, polygon[m],
+                                                       polygon[m + 1], value))
+            values.append(best)
+            f = f + step
+        return values
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'data')
+    canvasX, canvasY = 400, 500
+    checked = 0
+
+    assert RayCaster().cast(0, 0, [0.0, 1.0], 5.0).tolist() == [5.0, 5.0]
+
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name, name + '.wrl')
+        if not os.path.isfile(path):
+            continue
+
+        polygons, mapX, mapY = read_polygons(path, canvasX, canvasY)
+        casters = (RayCaster(polygons), RayCaster(polygons, index=None),
+                   RayCaster(polygons, index=PolygonBVH(polygons)))
+        metric = parse_wrl(path).ray_caster
+        to_meters = (mapX / canvasX, mapY / canvasY)
+
+        for value_m in (0.05, 0.3, 2.0):
+            value = value_m * canvasX / mapX
+            for x in np.linspace(0, canvasX, 6)[1:-1]:
+                for y in np.linspace(0, canvasY, 6)[1:-1]:
+                    for theta in (0.0, 0.7, 2.5, 4.1):
+                        num = 20
+                        angles = theta - 1.5707 + 3.1415 / (num - 1) * np.arange(num)
+                        slow = per_segment_sensors(polygons, x, y, theta,
+                                                   -1.5707, 3.1415, num, value)
+                        results = [caster.cast(x, y, angles, value)
+                                   for caster in casters]
+                        results.append(metric.cast(x, y, angles, value,
+                                                   scale=to_meters))
+                        for fast in results:
+                            for a, b in zip(fast, slow):
+                                assert isclose(a, b), (name, x, y, theta, a, b)
+                        checked += 1
+
+    print('RayCaster matches the per-segment code on', checked, 'poses')
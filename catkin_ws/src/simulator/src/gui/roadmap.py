@@ -0,0 +1,224 @@
+from __future__ import division, print_function
+import numpy as np
+from raycasting import intersect_pairs
+from bvh import PolygonBVH
+
+# Segments tested for visibility in each call to the BVH, bounds the size of
+# the (segment, edge) pair arrays
+BATCH_SEGMENTS = 20000
+
+
+def _open_ring(polygon):
+    # Vertexes of a closed polygon without the repeated last one and without
+    # consecutive duplicates, in counterclockwise order
+    points = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    if points.shape[0] > 1 and (points[0] == points[-1]).all():
+        points = points[:-1]
+    keep = (points != np.roll(points, 1, axis=0)).any(axis=1)
+    points = points[keep]
+
+    x, y = points[:, 0], points[:, 1]
+    if (x * np.roll(y, -1) - np.roll(x, -1) * y).sum() < 0:
+        points = points[::-1]
+    return points
+
+
+def inflate_polygon(polygon, radius, max_miter=2.0):
+    """
+    Offsets a polygon outwards by radius, so a robot of that radius whose
+    center stays outside the result doesn't touch the polygon. Each vertex
+    moves along the bisector of its edges (miter join), at most
+    max_miter * radius for very sharp corners.
+
+    Returns:
+        Tuple (closed polygon k x 2, boolean array k - 1 telling which
+        vertexes are convex)
+    """
+    points = _open_ring(polygon)
+    if points.shape[0] < 3:
+        return np.vstack((points, points[:1])), np.ones(points.shape[0], dtype=bool)
+
+    incoming = points - np.roll(points, 1, axis=0)
+    outgoing = np.roll(points, -1, axis=0) - points
+    incoming /= np.hypot(incoming[:, 0], incoming[:, 1])[:, None]
+    outgoing /= np.hypot(outgoing[:, 0], outgoing[:, 1])[:, None]
+
+    # Outward normals of counterclockwise edges
+    n1 = np.column_stack((incoming[:, 1], -incoming[:, 0]))
+    n2 = np.column_stack((outgoing[:, 1], -outgoing[:, 0]))
+    miter = n1 + n2
+    scale = 1.0 + (n1 * n2).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        miter = miter / scale[:, None]
+    length = np.hypot(miter[:, 0], miter[:, 1])
+    too_long = ~(length <= max_miter)
+    miter[too_long] *= (max_miter / length[too_long])[:, None]
+    miter[~np.isfinite(miter).all(axis=1)] = n1[~np.isfinite(miter).all(axis=1)] * max_miter
+
+    inflated = points + radius * miter
+    convex = incoming[:, 0] * outgoing[:, 1] - incoming[:, 1] * outgoing[:, 0] > 0
+    return np.vstack((inflated, inflated[:1])), convex
+
+
+def visible(obstacles, segments):
+    """
+    Boolean array telling which segments (array m x 4) don't cross any edge
+    of the PolygonBVH obstacles.
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+    result = np.ones(segments.shape[0], dtype=bool)
+    for start in range(0, segments.shape[0], BATCH_SEGMENTS):
+        batch = segments[start:start + BATCH_SEGMENTS]
+        seg_ids, edge_ids = obstacles.candidate_pairs(batch)
+        t = intersect_pairs(batch, obstacles.edges, seg_ids, edge_ids)
+        result[start:start + BATCH_SEGMENTS] = t >= 1.0
+    return result
+
+
+def build_roadmap(width, height, polygons, radius, neighbors=16, margin=0.1,
+                  spacing=None):
+    """
+    Builds a visibility roadmap for a robot of the given radius. The nodes
+    are the convex corners of the obstacles inflated by radius * (1 + margin)
+    that are inside the map and outside every obstacle inflated by radius,
+    an edge joins two nodes that see each other over the obstacles inflated
+    by radius.
+
+    Args:
+        neighbors -> Only the nearest neighbors of each node are tested for
+                     visibility, 0 tests every pair (full visibility graph)
+        spacing   -> Also samples the free space with a grid of this step
+                     (PRM like), so open areas and maps with no obstacles
+                     besides the walls get nodes too
+
+    Returns:
+        Tuple (nodes n x 2, connections e x 2, costs e), every connection is
+        listed in both directions and costs are the lengths of the edges
+    """
+    obstacles = PolygonBVH([inflate_polygon(p, radius)[0] for p in polygons])
+
+    corners = []
+    for polygon in polygons:
+        inflated, convex = inflate_polygon(polygon, radius * (1 + margin))
+        corners.append(inflated[:-1][convex])
+    if spacing:
+        xs, ys = np.meshgrid(np.arange(spacing / 2, width, spacing),
+                             np.arange(spacing / 2, height, spacing))
+        corners.append(np.column_stack((xs.ravel(), ys.ravel())))
+    nodes = np.concatenate(corners) if corners else np.zeros((0, 2))
+
+    inside = ((nodes[:, 0] >= radius) & (nodes[:, 0] <= width - radius) &
+              (nodes[:, 1] >= radius) & (nodes[:, 1] <= height - radius))
+    nodes = nodes[inside]
+    nodes = nodes[[obstacles.contains_point(x, y) < 0 for x, y in nodes.tolist()]]
+
+    # Corners of touching obstacles can end up on the same spot
+    if nodes.shape[0]:
+        _, first = np.unique(np.round(nodes / (radius * margin)), axis=0, return_index=True)
+        nodes = nodes[np.sort(first)]
+
+    n = nodes.shape[0]
+    empty = (nodes, np.zeros((0, 2), dtype=np.int64), np.zeros(0))
+    if n < 2:
+        return empty
+
+    if neighbors and neighbors < n - 1:
+        nearest = np.empty((n, neighbors), dtype=np.int64)
+        rows = max(1, (1 << 20) // n)
+        for start in range(0, n, rows):
+            block = nodes[start:start + rows]
+            distances = np.hypot(block[:, None, 0] - nodes[None, :, 0],
+                                 block[:, None, 1] - nodes[None, :, 1])
+            distances[np.arange(block.shape[0]), np.arange(start, start + block.shape[0])] = np.inf
+            nearest[start:start + rows] = np.argpartition(distances, neighbors - 1, axis=1)[:, :neighbors]
+        pairs = np.column_stack((np.repeat(np.arange(n), neighbors), nearest.ravel()))
+        pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+    else:
+        pairs = np.column_stack(np.triu_indices(n, 1))
+
+    segments = np.hstack((nodes[pairs[:, 0]], nodes[pairs[:, 1]]))
+    pairs = pairs[visible(obstacles, segments)]
+    if not pairs.shape[0]:
+        return empty
+
+    costs = np.hypot(*(nodes[pairs[:, 0]] - nodes[pairs[:, 1]]).T)
+    connections = np.vstack((pairs, pairs[:, ::-1]))
+    order = np.lexsort((connections[:, 1], connections[:, 0]))
+    return nodes, connections[order], np.concatenate((costs, costs))[order]
+
+
+def write_top(path, nodes, connections, costs):
+    """
+    Writes a topological map in the format of the .top files of src/data.
+    """
+    ids = ' '.join(str(i) for i in range(len(nodes)))
+    with open(path, 'w') as top:
+        top.write('( num nodes {} )\n'.format(len(nodes)))
+        top.write('( name nodes {} )\n'.format(ids))
+        for i, (x, y) in enumerate(np.asarray(nodes).tolist()):
+            top.write('( node {} {:g} {:g} )\n'.format(i, x, y))
+        for (a, b), cost in zip(np.asarray(connections).tolist(), np.asarray(costs).tolist()):
+            top.write('( connection {} {} {:g} )\n'.format(a, b, cost))
+
+
+if __name__ == '__main__':
+    # Builds the roadmap of every map (or the given ones) and of a synthetic
+    # world with hundreds of obstacles, writing the .top files with --write
+    import argparse
+    import os
+    import time
+    import world
+
+    parser = argparse.ArgumentParser(
+        description='Generates the .top topological maps from the .wrl worlds')
+    parser.add_argument('names', nargs='*', help='maps to process, all by default')
+    parser.add_argument('--data-dir', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+    parser.add_argument('-r', '--radius', type=float, default=0.05,
+                        help='robot radius in meters')
+    parser.add_argument('-k', '--neighbors', type=int, default=16,
+                        help='nearest nodes tested for visibility, 0 for all')
+    parser.add_argument('-s', '--spacing', type=float, default=0.5,
+                        help='step of the grid of free space samples, 0 for none')
+    parser.add_argument('-w', '--write', action='store_true',
+                        help='overwrite src/data/<map>/<map>.top')
+    args = parser.parse_args()
+
+    names = args.names or sorted(n for n in os.listdir(args.data_dir)
+                                 if os.path.isfile(world.wrl_path(args.data_dir, n)))
+
+    def check(nodes, connections, obstacles):
+        # Every edge has to keep radius away from the obstacles
+        for a, b in connections.tolist():
+            for t in np.linspace(0, 1, 20):
+                x, y = nodes[a] + t * (nodes[b] - nodes[a])
+                assert obstacles.nearest_obstacle(x, y)[1] >= args.radius * 0.99
+
+    for name in names:
+        width, height, polygons = world.read_wrl(world.wrl_path(args.data_dir, name))
+        start = time.time()
+        nodes, connections, costs = build_roadmap(width, height, polygons, args.radius,
+                                                  args.neighbors, spacing=args.spacing)
+        elapsed = time.time() - start
+        check(nodes, connections, PolygonBVH(polygons))
+        if args.write:
+            write_top(world.top_path(args.data_dir, name), nodes, connections, costs)
+        print('{:14s} {:4d} polygons {:5d} nodes {:6d} connections {:8.1f} ms'.format(
+            name, len(polygons), len(nodes), len(connections), elapsed * 1e3))
+
+    if not args.names:
+        rng = np.random.RandomState(0)
+        size = 20.0
+        polygons = []
+        for cx, cy in rng.uniform(0.5, size - 0.5, (400, 2)).tolist():
+            angles = np.sort(rng.uniform(0, 2 * np.pi, 6))
+            radii = rng.uniform(0.1, 0.3, 6)
+            pentagon = np.column_stack((cx + radii * np.cos(angles), cy + radii * np.sin(angles)))
+            polygons.append(np.vstack((pentagon, pentagon[:1])))
+
+        start = time.time()
+        nodes, connections, costs = build_roadmap(size, size, polygons, args.radius, args.neighbors,
+                                                  spacing=args.spacing)
+        elapsed = time.time() - start
+        print('{:14s} {:4d} polygons {:5d} nodes {:6d} connections {:8.1f} ms'.format(
+            'synthetic', len(polygons), len(nodes), len(connections), elapsed * 1e3))
@@ -0,0 +1,291 @@
+from __future__ import division, print_function
+import math
+
+
+def rotate_point(theta, ox, oy, x, y):
+    # It rotates a point (x,y) from another point (ox,oy), theta is
+    # counterclockwise on the screen (canvas y axis points down)
+    rotate = -theta
+    nx = (x - ox) * math.cos(rotate) - (y - oy) * math.sin(rotate) + ox
+    ny = (x - ox) * math.sin(rotate) + (y - oy) * math.cos(rotate) + oy
+    return nx, ny
+
+
+def robot_shape(x, y, angle, radio):
+    """
+    Canvas coordinates of the parts of the robot centered at (x, y), heading
+    angle and with radius radio (pixels). Every value is a flat list ready
+    for Canvas.coords:
+
+        body, hokuyo            -> Bounding boxes of the ovals
+        wheel_left, wheel_right -> 4 vertexes each
+        arrow                   -> 3 vertexes
+    """
+    wheel1x1 = x - (radio / 2)
+    wheel1y1 = y - (5 * radio / 6)
+    wheel1x2 = x + radio / 2
+    wheel1y2 = y - (3 * radio / 6)
+    wheel2y1 = y + (3 * radio / 6)
+    wheel2y2 = y + (5 * radio / 6)
+
+    def rotated(*points):
+        coords = []
+        for px, py in points:
+            coords.extend(rotate_point(angle, x, y, px, py))
+        return coords
+
+    return {
+        'body': [x - radio, y - radio, x + radio, y + radio],
+        'hokuyo': [x - radio / 5, y - radio / 5, x + radio / 5, y + radio / 5],
+        'wheel_left': rotated((wheel1x1, wheel1y1), (wheel1x2, wheel1y1),
+                              (wheel1x2, wheel1y2), (wheel1x1, wheel1y2)),
+        'wheel_right': rotated((wheel1x1, wheel2y1), (wheel1x2, wheel2y1),
+                               (wheel1x2, wheel2y2), (wheel1x1, wheel2y2)),
+        'arrow': rotated((x + (2 * radio / 3), y - (radio / 3)),
+                         (x + (2 * radio / 3), y + (radio / 3)),
+                         (x + (5 * radio / 6), y)),
+    }
+
+
+class RobotSprite(object):
+    """
+    Canvas items of the robot (body, hokuyo, wheels, heading arrow and the
+    grasped object). They are created on the first draw and afterwards only
+    moved with Canvas.coords, so animating the robot doesn't create or delete
+    any item.
+
+    Every item has the tag 'robot', so the whole sprite can be raised above
+    items created after it.
+    """
+
+    PARTS = ('body', 'hokuyo', 'wheel_left', 'wheel_right', 'arrow')
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.items = {}
+        self.colors = {}
+        self.carried = None
+
+    def exists(self):
+        return bool(self.items)
+
+    def _create(self, shape, colors):
+        create = {'body': self.canvas.create_oval,
+                  'hokuyo': self.canvas.create_oval,
+                  'wheel_left': self.canvas.create_polygon,
+                  'wheel_right': self.canvas.create_polygon,
+                  'arrow': self.canvas.create_polygon}
+        for part in self.PARTS:
+            self.items[part] = create[part](shape[part], outline=colors[part],
+                                            fill=colors[part], width=1,
+                                            tags='robot')
+        self.colors = dict(colors)
+
+        self.items['object'] = self.canvas.create_rectangle(
+            0, 0, 0, 0, fill="#9FFF3D", outline="#9FFF3D", state='hidden',
+            tags='robot')
+        self.items['object_name'] = self.canvas.create_text(
+            0, 0, fill="#9E4124", font="Calibri 10 bold", state='hidden',
+            tags='robot')
+        self.carried = None
+
+    def draw(self, x, y, angle, radio, colors, carried=None):
+        """
+        Places the robot at (x, y) with the given heading.
+
+        Args:
+            colors  -> Dictionary from each one of PARTS to its color
+            carried -> Name of the grasped object drawn over the robot, None
+                       when the robot isn't carrying anything
+        """
+        shape = robot_shape(x, y, angle, radio)
+        if not self.items:
+            self._create(shape, colors)
+        else:
+            for part in self.PARTS:
+                self.canvas.coords(self.items[part], *shape[part])
+                if self.colors.get(part) != colors[part]:
+                    self.canvas.itemconfig(self.items[part], outline=colors[part],
+                                           fill=colors[part])
+            self.colors = dict(colors)
+
+        if carried:
+            self.canvas.coords(self.items['object'], x - 10, y - 10, x + 10, y + 10)
+            self.canvas.coords(self.items['object_name'], x, y)
+            if carried != self.carried:
+                self.canvas.itemconfig(self.items['object'], state='normal')
+                self.canvas.itemconfig(self.items['object_name'], text=carried,
+                                       state='normal')
+        elif self.carried:
+            self.canvas.itemconfig(self.items['object'], state='hidden')
+            self.canvas.itemconfig(self.items['object_name'], state='hidden')
+        self.carried = carried
+
+    def delete(self):
+        for item in self.items.values():
+            self.canvas.delete(item)
+        self.items = {}
+        self.carried = None
+
+
+class LaserPool(object):
+    """
+    Pool of canvas items for the sensor rays, one line per ray plus a small
+    oval at the end of the rays that hit something. The items are reused
+    between frames, the ones not needed in a frame are hidden.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.rays = []
+        self.points = []
+        self.shown = []
+        self.color = None
+
+    def draw(self, x, y, ends, hits, color):
+        """
+        Draws one ray from (x, y) to each one of the ends, hits[i] tells if
+        the ray i ended on an obstacle.
+        """
+        canvas = self.canvas
+        grown = False
+        while len(self.rays) < len(ends):
+            self.rays.append(canvas.create_line(0, 0, 0, 0, fill=color,
+                                                state='hidden'))
+            self.points.append(canvas.create_oval(0, 0, 0, 0, fill=color,
+                                                  outline=color, state='hidden'))
+            self.shown.append((False, False))
+            grown = True
+
+        if color != self.color:
+            for ray, point in zip(self.rays, self.points):
+                canvas.itemconfig(ray, fill=color)
+                canvas.itemconfig(point, fill=color, outline=color)
+            self.color = color
+
+        for i, ray in enumerate(self.rays):
+            point = self.points[i]
+            if i < len(ends):
+                q, w = ends[i]
+                canvas.coords(ray, x, y, q, w)
+                shown = (True, bool(hits[i]))
+                if shown[1]:
+                    canvas.coords(point, q - 1, w - 1, q + 1, w + 1)
+            else:
+                shown = (False, False)
+
+            if shown != self.shown[i]:
+                canvas.itemconfig(ray, state='normal' if shown[0] else 'hidden')
+                canvas.itemconfig(point, state='normal' if shown[1] else 'hidden')
+                self.shown[i] = shown
+
+        if grown:
+            canvas.tag_raise('robot')
+
+    def hide(self):
+        for i, shown in enumerate(self.shown):
+            if shown != (False, False):
+                self.canvas.itemconfig(self.rays[i], state='hidden')
+                self.canvas.itemconfig(self.points[i], state='hidden')
+                self.shown[i] = (False, False)
+
+    def delete(self):
+        for item in self.rays + self.points:
+            self.canvas.delete(item)
+        self.rays = []
+        self.points = []
+        self.shown = []
+
+
+if __name__ == '__main__':
+    # Frames per second of a 100 step move_robot run, drawing the robot and
+    # 20 rays per frame the way plot_robot used to (delete and create every
+    # item) and with the persistent sprite. Needs a display, like
+    # xvfb-run -s '-screen 0 1024x768x24' python robot_sprite.py
+    import os
+    import sys
+    import time
+    import numpy as np
+    try:
+        from Tkinter import Tk, Canvas, TclError
+    except ImportError:
+        from tkinter import Tk, Canvas, TclError
+    from world import load_world
+
+    try:
+        root = Tk()
+    except TclError as e:
+        sys.exit('No display to draw on ({}), run it under xvfb-run'.format(e))
+    canvas = Canvas(root, width=400, height=500)
+    canvas.pack()
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'data')
+    world = load_world(data_dir, 'random_1')
+    for polygon in world.to_canvas(400, 500):
+        canvas.create_polygon([(px, 500 - py) for px, py in polygon[:-1]],
+                              fill='#063751')
+
+    colors = dict((part, '#F50000') for part in RobotSprite.PARTS)
+    steps = 100
+    num_sensors = 20
+    value = 0.3 * 400 / world.width
+    to_meters = (world.width / 400, world.height / 500)
+
+    def poses():
+        for i in range(steps):
+            yield 60 + 2.5 * i, 250 + 40 * math.sin(i / 10), i / 20
+
+    def rays(x, y, angle):
+        angles = angle - 1.5707 + 3.1415 / (num_sensors - 1) * np.arange(num_sensors)
+        distances = world.ray_caster.cast(x, 500 - y, angles, value,
+                                          scale=to_meters)
+        ends = [(d * math.cos(f) + x, -d * math.sin(f) + y)
+                for d, f in zip(distances.tolist(), angles.tolist())]
+        return ends, [d < value for d in distances.tolist()]
+
+    def old_run():
+        items = []
+        for x, y, angle in poses():
+            for item in items:
+                canvas.delete(item)
+            items = []
+            ends, hits = rays(x, y, angle)
+            for (q, w), hit in zip(ends, hits):
+                items.append(canvas.create_line(x, y, q, w, fill='#FF0D0D'))
+                if hit:
+                    items.append(canvas.create_oval(q - 1, w - 1, q + 1, w + 1,
+                                                    fill='#FF0D0D'))
+            shape = robot_shape(x, y, angle, 0.16 * 400 / world.width)
+            items.append(canvas.create_oval(shape['body'], fill='#F50000'))
+            items.append(canvas.create_oval(shape['hokuyo'], fill='#F50000'))
+            for part in ('wheel_left', 'wheel_right', 'arrow'):
+                items.append(canvas.create_polygon(shape[part], fill='#F50000'))
+            canvas.update()
+        for item in items:
+            canvas.delete(item)
+
+    def new_run():
+        sprite = RobotSprite(canvas)
+        lasers = LaserPool(canvas)
+        for x, y, angle in poses():
+            ends, hits = rays(x, y, angle)
+            lasers.draw(x, y, ends, hits, '#FF0D0D')
+            sprite.draw(x, y, angle, 0.16 * 400 / world.width, colors)
+            canvas.update()
+        sprite.delete()
+        lasers.delete()
+
+    # Both runs take turns, and the best of five of each is reported so a
+    # busy X server doesn't favour either of them
+    best = {old_run: 0.0, new_run: 0.0}
+    for _ in range(5):
+        for run in (old_run, new_run):
+            start = time.time()
+            run()
+            best[run] = max(best[run], steps / (time.time() - start))
+    print('{} steps of move_robot, best of 5: delete/create {:.1f} frames/s, persistent '
+          '{:.1f} frames/s ({:.1f}x)'.format(steps, best[old_run], best[new_run],
+                                            best[new_run] / best[old_run]))
+
+    root.destroy()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+# Same services and topics as simulator_node.py, served by a SimulationEngine
+# with no Tk window, so simulations can run on machines without a display.
+#
+# Private parameters: ~world, ~steps, ~behavior, ~x, ~y, ~theta, ~light_x,
+# ~light_y, ~gui (also open the GUI as an observer of the engine) and
+# ~heartbeat (seconds between two sends of a message that didn't change).
+# The number of messages sent and skipped is kept in ~publish_counts.
+#
+# ~robots is an optional list of robot names. Every robot gets its own
+# simulator_robot_step, simulator_stop, simulator_laser_serv and
+# simulator_set_light_position services and simulator_parameters_pub,
+# odom_simul and objectsPose topics under its name (e.g.
+# /robot1/simulator_robot_step). Their poses are read from ~<name>/x,
+# ~<name>/y and ~<name>/theta, they share the world and see each other.
+# base_node, light_node and the motion planner of each robot run in its
+# namespace, see launch/simulator_headless_robots.launch.
+
+from engine import SimulationEngine
+from robots import RobotRegistry
+from simulator.srv import *
+from simulator.msg import Parameters
+from simulator.msg import PosesArray
+from nav_msgs.msg import Odometry
+import tf
+import rospy
+from geometry_msgs.msg import Point, Pose, Quaternion, Twist, Vector3
+from change_publisher import ChangePublisher
+
+engine = SimulationEngine(None)
+registry = None
+
+def handle_robot_step(req):
+
+	resp = simulator_robot_stepResponse()
+	resp.robot_x, resp.robot_y, resp.theta = engine.step(req.theta, req.distance)
+	return resp
+
+def handle_simulator_stop(req):
+
+	resp = simulator_stopResponse()
+	engine.stop()
+	return resp
+
+def handle_simulator_set_light_position(req):
+
+	resp = simulator_set_light_positionResponse()
+	for robot in [engine] + (list(registry) if registry else []):
+		robot.light_x = req.light_x
+		robot.light_y = req.light_y
+	return resp
+
+# Handlers of the services of one robot of the registry
+
+def handle_named_robot_step(robot):
+
+	def handle(req):
+		resp = simulator_robot_stepResponse()
+		resp.robot_x, resp.robot_y, resp.theta = robot.step(req.theta, req.distance)
+		return resp
+
+	return handle
+
+def handle_named_simulator_stop(robot):
+
+	def handle(req):
+		robot.stop()
+		return simulator_stopResponse()
+
+	return handle
+
+def handle_named_set_light_position(robot):
+
+	def handle(req):
+		robot.light_x = req.light_x
+		robot.light_y = req.light_y
+		return simulator_set_light_positionResponse()
+
+	return handle
+
+def handle_named_laser(name):
+
+	def handle(req):
+		resp = simulator_laserResponse()
+		values = registry.laser_values()[name].tolist()
+		resp.sensors[:len(values)] = values
+		return resp
+
+	return handle
+
+def fill_parameters(msg_params, parameters):
+	msg_params.robot_x = parameters[0]
+	msg_params.robot_y = parameters[1]
+	msg_params.robot_theta = parameters[2]
+	msg_params.robot_radio = parameters[3]
+	msg_params.robot_max_advance = parameters[4]
+	msg_params.robot_turn_angle = parameters[5]
+	msg_params.laser_num_sensors = parameters[6]
+	msg_params.laser_origin = parameters[7]
+	msg_params.laser_range = parameters[8]
+	msg_params.laser_value = parameters[9]
+	msg_params.world_name = parameters[10]
+	msg_params.noise = parameters[11]
+	msg_params.light_x = parameters[12]
+	msg_params.light_y = parameters[13]
+	msg_params.run = parameters[14]
+	msg_params.behavior = parameters[15]
+	msg_params.steps = engine.max_steps
+	msg_params.useRealRobot = parameters[16]
+	msg_params.useLidar = parameters[17]
+	msg_params.useSArray = parameters[18]
+	msg_params.realLights = [parameters[19], parameters[20], 0, 0, 0, 0]
+
+def ros():
+	global registry
+	rospy.init_node('simulator_headless_node')
+
+	engine.load_world(rospy.get_param('~world', 'arena'))
+	engine.max_steps = rospy.get_param('~steps', 100)
+	engine.behavior = rospy.get_param('~behavior', 4)
+	engine.set_pose(rospy.get_param('~x', 0.5), rospy.get_param('~y', 0.5),
+	                rospy.get_param('~theta', 0.0))
+
+	heartbeat = rospy.get_param('~heartbeat', 1.0)
+	odom_broadcaster = tf.TransformBroadcaster()
+
+	def robot_publishers(robot, prefix, frame):
+		# Publishers of the parameters, odometry and objects of one robot
+		pub_params = rospy.Publisher(prefix + 'simulator_parameters_pub', Parameters, queue_size = 0)
+		odom_pub = rospy.Publisher('/' + prefix + 'odom_simul', Odometry, queue_size=50)
+		objPose_pub = rospy.Publisher('/' + prefix + 'objectsPose', PosesArray, queue_size=5)
+		msg_params = Parameters()
+
+		def publish_parameters(parameters):
+			fill_parameters(msg_params, parameters)
+			msg_params.steps = robot.max_steps
+			pub_params.publish(msg_params)
+
+		def publish_odometry(pose):
+			x, y, th = pose
+			current_time = rospy.Time.now()
+			odom_quat = tf.transformations.quaternion_from_euler(0, 0, th)
+			odom_broadcaster.sendTransform(
+				(x, y, 0.),
+				odom_quat,
+				current_time,
+				frame,
+				"map"
+			)
+
+			odom = Odometry()
+			odom.header.stamp = current_time
+			odom.header.frame_id = "map"
+			odom.pose.pose = Pose(Point(x, y, 0.), Quaternion(*odom_quat))
+			odom.child_frame_id = frame
+			odom.twist.twist = Twist(Vector3(0, 0, 0), Vector3(0, 0, 0))
+			odom_pub.publish(odom)
+
+		publishers = {'parameters': ChangePublisher(publish_parameters, heartbeat),
+		              'odometry': ChangePublisher(publish_odometry, heartbeat),
+		              'objects': ChangePublisher(lambda objects: objPose_pub.publish(PosesArray()), heartbeat)}
+
+		def update():
+			publishers['parameters'].update(robot.parameters())
+			publishers['odometry'].update((robot.x, robot.y, robot.theta))
+			publishers['objects'].update(())
+
+		def stop():
+			msg_params.run = False
+			pub_params.publish(msg_params)
+
+		return publishers, update, stop
+
+	light = (rospy.get_param('~light_x', 0.0), rospy.get_param('~light_y', 0.0))
+	names = rospy.get_param('~robots', [])
+	robots = {}
+	if names:
+		registry = RobotRegistry(engine.world_name, engine.data_dir)
+		for name in names:
+			robot = registry.add(name, rospy.get_param('~%s/x' % name, 0.5), rospy.get_param('~%s/y' % name, 0.5),
+			                     rospy.get_param('~%s/theta' % name, 0.0))
+			robot.max_steps = engine.max_steps
+			robot.behavior = rospy.get_param('~%s/behavior' % name, engine.behavior)
+			rospy.Service(name + '/simulator_robot_step', simulator_robot_step, handle_named_robot_step(robot))
+			rospy.Service(name + '/simulator_stop', simulator_stop, handle_named_simulator_stop(robot))
+			rospy.Service(name + '/simulator_laser_serv', simulator_laser, handle_named_laser(name))
+			rospy.Service(name + '/simulator_set_light_position', simulator_set_light_position,
+			              handle_named_set_light_position(robot))
+			robots[name] = robot_publishers(robot, name + '/', 'base_link_' + name)
+			robot.start(*light)
+	else:
+		a = rospy.Service('simulator_robot_step', simulator_robot_step, handle_robot_step)
+		c = rospy.Service('simulator_stop', simulator_stop, handle_simulator_stop)
+		robots[''] = robot_publishers(engine, '', 'base_link_rob2w')
+		engine.start(*light)
+	d = rospy.Service('simulator_set_light_position', simulator_set_light_position, handle_simulator_set_light_position)
+
+	if rospy.get_param('~gui', False):
+		from MobileRobotSimulator import MobileRobotSimulator
+		gui = MobileRobotSimulator()
+		if registry:
+			gui.follow_registry(registry)
+		else:
+			gui.follow_engine(engine)
+
+	rate = rospy.Rate(100)
+	counts_time = rospy.get_time()
+
+	while not rospy.is_shutdown():
+		for publishers, update, stop in robots.values():
+			update()
+
+		if rospy.get_time() - counts_time > 0.5:
+			counts_time = rospy.get_time()
+			counts = {}
+			for name, (publishers, update, stop) in robots.items():
+				for topic, publisher in publishers.items():
+					counts[(name + '/' if name else '') + topic] = publisher.counts()
+			rospy.set_param('~publish_counts', counts)
+
+		rate.sleep()
+
+	for name, (publishers, update, stop) in robots.items():
+		for topic, publisher in publishers.items():
+			rospy.loginfo('%s%s: %d messages published, %d skipped', name + '/' if name else '', topic,
+			              publisher.count, publisher.skipped)
+
+	for _ in range(20):
+		for publishers, update, stop in robots.values():
+			stop()
+		rate.sleep()
+
+
+if __name__ == "__main__":
+	ros()
@@ -14,6 +14,7 @@ import time
 import rospy
 from geometry_msgs.msg import Point, Pose, Quaternion, Twist, Vector3, PoseStamped
 from std_msgs.msg import Int8MultiArray
+from change_publisher import ChangePublisher
 
 gui=MobileRobotSimulator()
 
@@ -55,16 +56,48 @@ def handle_simulator_object_interaction(req):
 	print(gui.objects_data)
 	return resp
 
+arrayPosesObjs = PosesArray()
+
 def convertArray2Pose(objects_data):
-	arrayPosesObjs = PosesArray();
-	for obj in objects_data:
-		tmp = poseCustom()
+	# The same message and poses are filled every time, publish() serializes
+	# the message before returning so reusing it is safe
+	poses = arrayPosesObjs.posesArray
+	while len(poses) < len(objects_data):
+		poses.append(poseCustom())
+	del poses[len(objects_data):]
+	for tmp, obj in zip(poses, objects_data):
 		tmp.name = obj[0]
 		tmp.x = obj[1]
 		tmp.y = obj[2]
-		arrayPosesObjs.posesArray.append(tmp)
 	return arrayPosesObjs
 
+def objects_key(objects_data):
+	# objects_data is modified in place, so changes are detected on a copy
+	return tuple((obj[0], obj[1], obj[2]) for obj in objects_data)
+
+def fill_parameters(msg_params, parameters):
+	msg_params.robot_x = parameters[0]
+	msg_params.robot_y = parameters[1]
+	msg_params.robot_theta = parameters[2]
+	msg_params.robot_radio = parameters[3]
+	msg_params.robot_max_advance = parameters[4]
+	msg_params.robot_turn_angle = parameters[5]
+	msg_params.laser_num_sensors = parameters[6]
+	msg_params.laser_origin = parameters[7]
+	msg_params.laser_range = parameters[8]
+	msg_params.laser_value = parameters[9]
+	msg_params.world_name = parameters[10]
+	msg_params.noise = parameters[11]
+	msg_params.light_x = parameters[12]
+	msg_params.light_y = parameters[13]
+	msg_params.run = parameters[14]
+	msg_params.behavior = parameters[15]
+	msg_params.steps = parameters[16]
+	msg_params.useRealRobot = parameters[16]
+	msg_params.useLidar = parameters[17]
+	msg_params.useSArray = parameters[18]
+	msg_params.realLights = [parameters[19], parameters[20], 0, 0, 0, 0]
+
 def update_value(msg):
 	gui.handle_hokuyo(msg.ranges)
 	ranges=msg.ranges
@@ -182,16 +215,6 @@ def ros():
 	move_pub   = rospy.Publisher("/cmd_vel", Twist, queue_size=10)
 
 
-	x = 0.0
-	y = 0.0
-	th = 0.0
-
-	vx = 0.1
-	vy = -0.1
-	vth = 0.1
-	current_time = rospy.Time.now()
-	last_time = rospy.Time.now()
-
 	lights_array = [0, 0]
 	last_movement = []
 
@@ -204,47 +227,13 @@ def ros():
 	msg_params = Parameters()
 	rate = rospy.Rate(100)
 
-
-	start = time.time()
-	labelColor = gui.warnLightColor
-
-	robot_selected = 'No selected'
-
-	if rospy.has_param('/robot_selected'):
-		robot_selected = rospy.get_param("/robot_selected")
-
-	gui.labelRobot = Label(gui.rightMenu ,text = "Robot: " + robot_selected, background = gui.backgroundColor, foreground = gui.titlesColor ,font = gui.headLineFont )
-	gui.labelRobot.grid(column = 4 ,row = 0 ,sticky = (N, W) ,padx = (5,5))
-
-	while not gui.stopped:
-		parameters = gui.get_parameters()
-		msg_params.robot_x = parameters[0]
-		msg_params.robot_y = parameters[1]
-		msg_params.robot_theta = parameters[2]
-		msg_params.robot_radio = parameters[3]
-		msg_params.robot_max_advance = parameters[4]
-		msg_params.robot_turn_angle = parameters[5]
-		msg_params.laser_num_sensors = parameters[6]
-		msg_params.laser_origin = parameters[7]
-		msg_params.laser_range = parameters[8]
-		msg_params.laser_value = parameters[9]
-		msg_params.world_name = parameters[10]
-		msg_params.noise = parameters[11]
-		msg_params.light_x = parameters[12]
-		msg_params.light_y = parameters[13]
-		msg_params.run = parameters[14]
-		msg_params.behavior = parameters[15]
-		msg_params.steps = parameters[16]
-		msg_params.useRealRobot = parameters[16]
-		msg_params.useLidar = parameters[17]
-		msg_params.useSArray = parameters[18]
-		msg_params.realLights = [parameters[19], parameters[20], 0, 0, 0, 0]
-
+	def publish_parameters(parameters):
+		fill_parameters(msg_params, parameters)
 		pub_params.publish(msg_params)
 
-		x = parameters[0]
-		y = parameters[1]
-		th = parameters[2]
+	def publish_odometry(pose):
+		x, y, th = pose
+		current_time = rospy.Time.now()
 		odom_quat = tf.transformations.quaternion_from_euler(0, 0, th)
 
 		odom_broadcaster.sendTransform(
@@ -264,8 +253,30 @@ def ros():
 		odom.twist.twist = Twist(Vector3(0, 0, 0), Vector3(0, 0, 0))
 		odom_pub.publish(odom)
 
+	# Each message is sent when it changes and every heartbeat seconds, the
+	# subscribers that join late or only keep the last message still get it
+	heartbeat = rospy.get_param('~heartbeat', 1.0)
+	publishers = {'parameters': ChangePublisher(publish_parameters, heartbeat),
+	              'odometry': ChangePublisher(publish_odometry, heartbeat),
+	              'objects': ChangePublisher(lambda objects: objPose_pub.publish(convertArray2Pose(objects)), heartbeat)}
+
 
-		objPose_pub.publish(convertArray2Pose(gui.objects_data))
+	start = time.time()
+	labelColor = gui.warnLightColor
+
+	robot_selected = 'No selected'
+
+	if rospy.has_param('/robot_selected'):
+		robot_selected = rospy.get_param("/robot_selected")
+
+	gui.labelRobot = Label(gui.rightMenu ,text = "Robot: " + robot_selected, background = gui.backgroundColor, foreground = gui.titlesColor ,font = gui.headLineFont )
+	gui.labelRobot.grid(column = 4 ,row = 0 ,sticky = (N, W) ,padx = (5,5))
+
+	while not gui.stopped:
+		parameters = gui.get_parameters()
+		publishers['parameters'].update(parameters)
+		publishers['odometry'].update(tuple(parameters[0:3]))
+		publishers['objects'].update(gui.objects_data, objects_key(gui.objects_data))
 
 		if lights_array != [parameters[19], parameters[20]]:
 			lights_array = [parameters[19], parameters[20]]
@@ -287,6 +298,7 @@ def ros():
 
 		if(end - start > 0.5):
 			start = time.time()
+			rospy.set_param('~publish_counts', dict((name, publisher.counts()) for name, publisher in publishers.items()))
 			if battery_charging:
 				if labelColor == gui.warnLightColor:
 					labelColor = gui.warnStrongColor
@@ -307,6 +319,9 @@ def ros():
 
 		#print(gui.stopped)
 
+	for name, publisher in publishers.items():
+		rospy.loginfo('%s: %d messages published, %d skipped', name, publisher.count, publisher.skipped)
+
 	for _ in range(20):
 		msg_params.run = False
 		pub_params.publish(msg_params)
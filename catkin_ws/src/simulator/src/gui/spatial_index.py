@@ -0,0 +1,255 @@
+from __future__ import division, print_function
+import math
+import numpy as np
+
+
+class EdgeGrid(object):
+    """
+    Uniform grid over a set of edges. Every cell knows which edges cross it,
+    so a segment query only has to look at the edges stored in the cells the
+    segment goes through, which are visited with a DDA walk (Amanatides & Woo)
+    instead of testing every polygon of the map.
+
+    The cell contents are stored in CSR form:
+
+        cell_edges[cell_start[c]:cell_start[c + 1]]
+
+    are the ids (rows of the edges array) of the edges crossing cell c, where
+    c = iy * nx + ix.
+    """
+
+    def __init__(self, edges, cell_size=None):
+        """
+        Args:
+            edges     -> Array of shape n x 4, one row [x1, y1, x2, y2] per edge
+            cell_size -> Side of the square cells. By default it is chosen so
+                         the grid has about as many cells as edges
+        """
+        self.edges = np.asarray(edges, dtype=np.float64).reshape(-1, 4)
+        n = self.edges.shape[0]
+
+        if n:
+            xs = self.edges[:, (0, 2)]
+            ys = self.edges[:, (1, 3)]
+            min_x, max_x = float(xs.min()), float(xs.max())
+            min_y, max_y = float(ys.min()), float(ys.max())
+        else:
+            min_x = max_x = min_y = max_y = 0.0
+
+        width = max(max_x - min_x, 1e-9)
+        height = max(max_y - min_y, 1e-9)
+
+        if cell_size is None:
+            cell_size = max(width, height) / max(1, int(math.ceil(math.sqrt(n))))
+
+        self.cell_size = float(cell_size)
+        self.origin_x = min_x
+        self.origin_y = min_y
+        self.nx = max(1, int(math.ceil(width / self.cell_size)))
+        self.ny = max(1, int(math.ceil(height / self.cell_size)))
+
+        buckets = [[] for _ in range(self.nx * self.ny)]
+        for i, (x1, y1, x2, y2) in enumerate(self.edges.tolist()):
+            for c in self.cells_on_segment(x1, y1, x2, y2):
+                buckets[c].append(i)
+
+        counts = np.array([len(b) for b in buckets], dtype=np.int64)
+        self.cell_start = np.zeros(len(buckets) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.cell_start[1:])
+        self.cell_edges = np.array([i for b in buckets for i in b],
+                                   dtype=np.int64)
+
+    def _clip(self, x1, y1, x2, y2):
+        # Liang-Barsky clipping of the segment against the grid bounds, it
+        # returns the parameter range [t0, t1] that lies inside the grid
+        t0, t1 = 0.0, 1.0
+        dx = x2 - x1
+        dy = y2 - y1
+        min_x = self.origin_x
+        min_y = self.origin_y
+        max_x = min_x + self.nx * self.cell_size
+        max_y = min_y + self.ny * self.cell_size
+
+        for p, q in ((-dx, x1 - min_x), (dx, max_x - x1),
+                     (-dy, y1 - min_y), (dy, max_y - y1)):
+            if p == 0:
+                if q < 0:
+                    return None
+            else:
+                r = q / p
+                if p < 0:
+                    if r > t1:
+                        return None
+                    t0 = max(t0, r)
+                else:
+                    if r < t0:
+                        return None
+                    t1 = min(t1, r)
+
+        return t0, t1
+
+    def cells_on_segment(self, x1, y1, x2, y2):
+        """
+        Returns the list of cell ids the segment goes through, in the order
+        they are visited from (x1, y1) to (x2, y2).
+
+        When the segment goes exactly through a cell corner both neighbours
+        of the corner are included too, so an edge and a ray that cross on a
+        corner always share at least one cell.
+        """
+        clipped = self._clip(x1, y1, x2, y2)
+        if clipped is None:
+            return []
+
+        t0, t1 = clipped
+        dx = x2 - x1
+        dy = y2 - y1
+        cs = self.cell_size
+        nx = self.nx
+        ny = self.ny
+
+        sx = x1 + t0 * dx - self.origin_x
+        sy = y1 + t0 * dy - self.origin_y
+        ix = min(max(int(math.floor(sx / cs)), 0), nx - 1)
+        iy = min(max(int(math.floor(sy / cs)), 0), ny - 1)
+
+        if dx > 0:
+            step_x = 1
+            t_max_x = ((ix + 1) * cs - (x1 - self.origin_x)) / dx
+            t_delta_x = cs / dx
+        elif dx < 0:
+            step_x = -1
+            t_max_x = (ix * cs - (x1 - self.origin_x)) / dx
+            t_delta_x = -cs / dx
+        else:
+            step_x = 0
+            t_max_x = t_delta_x = float('inf')
+
+        if dy > 0:
+            step_y = 1
+            t_max_y = ((iy + 1) * cs - (y1 - self.origin_y)) / dy
+            t_delta_y = cs / dy
+        elif dy < 0:
+            step_y = -1
+            t_max_y = (iy * cs - (y1 - self.origin_y)) / dy
+            t_delta_y = -cs / dy
+        else:
+            step_y = 0
+            t_max_y = t_delta_y = float('inf')
+
+        cells = [iy * nx + ix]
+        while True:
+            if abs(t_max_x - t_max_y) < 1e-12:
+                if t_max_x > t1:
+                    break
+                # Corner crossing, visit both cells around the corner as well
+                if 0 <= ix + step_x < nx:
+                    cells.append(iy * nx + ix + step_x)
+                if 0 <= iy + step_y < ny:
+                    cells.append((iy + step_y) * nx + ix)
+                ix += step_x
+                iy += step_y
+                t_max_x += t_delta_x
+                t_max_y += t_delta_y
+            elif t_max_x < t_max_y:
+                if t_max_x > t1:
+                    break
+                ix += step_x
+                t_max_x += t_delta_x
+            else:
+                if t_max_y > t1:
+                    break
+                iy += step_y
+                t_max_y += t_delta_y
+
+            if not (0 <= ix < nx and 0 <= iy < ny):
+                break
+            cells.append(iy * nx + ix)
+
+        return cells
+
+    def segment_candidates(self, x1, y1, x2, y2):
+        """
+        Returns the ids of the edges stored in the cells the segment crosses.
+        """
+        cells = self.cells_on_segment(x1, y1, x2, y2)
+        if not cells:
+            return np.zeros(0, dtype=np.int64)
+
+        return np.unique(np.concatenate(
+            [self.cell_edges[self.cell_start[c]:self.cell_start[c + 1]]
+             for c in cells]))
+
+    def candidate_pairs(self, segments):
+        """
+        Builds the (segment, edge) pairs worth testing for a batch of
+        segments. Only the DDA walk is done per segment, the expansion from
+        cells to edges is vectorized.
+
+        Returns:
+            Two arrays of the same length, segment ids and edge ids. An edge
+            may appear more than once for the same segment.
+        """
+        seg_of_cell = []
+        cells = []
+        for i, (x1, y1, x2, y2) in enumerate(segments.tolist()):
+            crossed = self.cells_on_segment(x1, y1, x2, y2)
+            cells.extend(crossed)
+            seg_of_cell.extend([i] * len(crossed))
+
+        cells = np.array(cells, dtype=np.int64)
+        starts = self.cell_start[cells]
+        counts = self.cell_start[cells + 1] - starts
+        total = int(counts.sum())
+
+        seg_ids = np.repeat(np.array(seg_of_cell, dtype=np.int64), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        edge_ids = self.cell_edges[np.repeat(starts, counts) + offsets]
+
+        return seg_ids, edge_ids
+
+
+if __name__ == '__main__':
+    import time
+    from raycasting import RayCaster
+
+    # A single edge must be found by every segment crossing it, including
+    # segments that go exactly through grid corners or start outside the grid
+    grid = EdgeGrid(np.array([[0.0, 0.0, 4.0, 4.0],
+                              [0.0, 4.0, 4.0, 0.0],
+                              [2.0, 0.0, 2.0, 4.0]]), cell_size=1.0)
+    assert grid.nx == 4 and grid.ny == 4
+    assert set(grid.segment_candidates(-1.0, 2.0, 5.0, 2.0)) == set([0, 1, 2])
+    assert set(grid.segment_candidates(0.5, 3.5, 0.9, 3.1)) == set([1])
+    assert list(grid.segment_candidates(5.0, 5.0, 6.0, 6.0)) == []
+    assert 0 in grid.segment_candidates(1.0, 3.0, 3.0, 1.0)
+
+    # Cost per ray must follow the cells crossed, not the polygon count:
+    # scale a synthetic world of small squares and cast short rays
+    rng = np.random.RandomState(0)
+    for count in (100, 1000, 10000):
+        side = math.sqrt(count)
+        polygons = []
+        for cx, cy in rng.uniform(0, side, (count, 2)):
+            square = [(cx, cy), (cx + .3, cy), (cx + .3, cy + .3), (cx, cy + .3)]
+            polygons.append(square + square[:1])
+
+        brute = RayCaster(polygons, index=None)
+        indexed = RayCaster(polygons)
+
+        origins = rng.uniform(0, side, (200, 2))
+        angles = rng.uniform(0, 2 * math.pi, 200)
+        segments = np.column_stack((origins, origins + 2 * np.column_stack(
+            (np.cos(angles), np.sin(angles)))))
+
+        start = time.time()
+        t_indexed = indexed.cast_segments(segments)
+        indexed_time = time.time() - start
+
+        start = time.time()
+        t_brute = brute.cast_segments(segments)
+        brute_time = time.time() - start
+
+        assert np.allclose(t_indexed, t_brute)
+        print('{:6d} polygons: grid {:8.2f} us/ray, brute force {:8.2f} us/ray'
+              .format(count, indexed_time * 1e6 / 200, brute_time * 1e6 / 200))
@@ -0,0 +1,124 @@
+from __future__ import division, print_function
+
+
+class StripPlot(object):
+    """
+    Line plot of values that arrive one sample at a time on a square canvas
+    of size pixels. Every append only creates the new segment of each line:
+    when a value falls outside the vertical range, or there are more samples
+    than expected, the items already drawn are rescaled in place with
+    Canvas.scale and Canvas.move instead of being redrawn.
+
+    The X axis (value 0) is always shown, and the vertical range grows with
+    some margin so a noisy signal doesn't rescale the plot on every sample.
+    """
+
+    def __init__(self, canvas, colors, samples=100, size=300, pad=0.01):
+        self.canvas = canvas
+        self.colors = colors
+        self.size = size
+        self.pad = pad
+        self.reset(samples)
+
+    def reset(self, samples=None):
+        if samples is not None:
+            self.samples = max(int(samples), 2)
+        self.canvas.delete('all')
+        self.count = 0
+        self.last = None
+        self.low = -self.pad
+        self.high = self.pad
+        self.axis = self.canvas.create_line(0, self._y(0.0), self.size, self._y(0.0),
+                                            tags=('plot',))
+
+    def _x(self, i):
+        return i * self.size / (self.samples - 1)
+
+    def _y(self, value):
+        return self.size - (value - self.low) * self.size / (self.high - self.low)
+
+    def _fit(self, values):
+        # Grows the vertical range to include values and moves the items
+        # already drawn to the new scale
+        low = min(values + [self.low])
+        high = max(values + [self.high])
+        if low >= self.low and high <= self.high:
+            return
+        margin = max((high - low) * 0.1, self.pad)
+        if low < self.low:
+            low = low - margin
+        if high > self.high:
+            high = high + margin
+
+        ratio = (self.high - self.low) / (high - low)
+        offset = (low - self.low) * self.size / (high - low)
+        self.canvas.scale('plot', 0, self.size, 1, ratio)
+        self.canvas.move('plot', 0, offset)
+        self.low = low
+        self.high = high
+
+    def append(self, *values):
+        """
+        Adds one sample of every line, values in the order of colors.
+        """
+        values = [float(v) for v in values]
+        self._fit(values)
+
+        if self.count == self.samples:
+            # Squeezes what is drawn so twice as many samples fit
+            self.canvas.scale('segment', 0, 0, (self.samples - 1) / (2 * self.samples - 1), 1)
+            self.samples = 2 * self.samples
+
+        if self.last is not None:
+            x1 = self._x(self.count - 1)
+            x2 = self._x(self.count)
+            for previous, value, color in zip(self.last, values, self.colors):
+                self.canvas.create_line(x1, self._y(previous), x2, self._y(value),
+                                        fill=color, tags=('plot', 'segment'))
+        self.last = values
+        self.count = self.count + 1
+
+
+if __name__ == '__main__':
+    # Checks that the rescaled items end where a full redraw would put them
+    # with a fake canvas that keeps the coordinates of the lines
+    import math
+
+    class FakeCanvas(object):
+        def __init__(self):
+            self.items = {}
+
+        def delete(self, tag):
+            self.items = {}
+
+        def create_line(self, *coords, **options):
+            self.items[len(self.items)] = (list(coords), options.get('tags', ()))
+            return len(self.items) - 1
+
+        def scale(self, tag, x0, y0, sx, sy):
+            for coords, tags in self.items.values():
+                if tag in tags:
+                    coords[0::2] = [x0 + sx * (x - x0) for x in coords[0::2]]
+                    coords[1::2] = [y0 + sy * (y - y0) for y in coords[1::2]]
+
+        def move(self, tag, dx, dy):
+            for coords, tags in self.items.values():
+                if tag in tags:
+                    coords[0::2] = [x + dx for x in coords[0::2]]
+                    coords[1::2] = [y + dy for y in coords[1::2]]
+
+    canvas = FakeCanvas()
+    plot = StripPlot(canvas, ('red', 'blue'), samples=50)
+    values = [(math.sin(i / 7.0) * i, i * 0.01) for i in range(120)]
+    for a, b in values:
+        plot.append(a, b)
+
+    segments = [coords for coords, tags in canvas.items.values() if 'segment' in tags]
+    assert len(segments) == 2 * (len(values) - 1)
+    for i, coords in enumerate(segments):
+        sample = i // 2 + 1
+        expected = [plot._x(sample - 1), plot._y(values[sample - 1][i % 2]),
+                    plot._x(sample), plot._y(values[sample][i % 2])]
+        assert all(abs(c - e) < 1e-6 for c, e in zip(coords, expected)), (i, coords, expected)
+    assert abs(canvas.items[plot.axis][0][1] - plot._y(0.0)) < 1e-6
+    print('{} samples, {} segments at their final position'.format(len(values), len(segments)))
@@ -0,0 +1,112 @@
+from __future__ import division, print_function
+import numpy as np
+
+
+class TopologicalGraph(object):
+    """
+    Topological map as a directed graph in compressed sparse row form. Nodes
+    are numbered by their position in the .top file, which is what the
+    connections and the paths of motion_planner_node refer to:
+
+        node_ids -> Array n with the id written for each node
+        coords   -> Array n x 2 with the node positions in meters
+        indptr   -> Array n + 1, the edges leaving node i are the ones in
+                    indptr[i]:indptr[i + 1]
+        indices  -> Array e with the node each edge arrives to
+        costs    -> Array e with the cost of each edge
+
+    A connection is an edge only in the direction it is written, the .top
+    files list both directions of each one.
+    """
+
+    def __init__(self, node_ids=(), coords=(), connections=(), costs=()):
+        self.node_ids = np.asarray(node_ids, dtype=np.int64).reshape(-1)
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        connections = np.asarray(connections, dtype=np.int64).reshape(-1, 2)
+        costs = np.asarray(costs, dtype=np.float64).reshape(-1)
+
+        n = self.coords.shape[0]
+        if connections.size and (connections.min() < 0 or connections.max() >= n):
+            raise ValueError('connection to a node out of the {} of the map'.format(n))
+
+        order = np.argsort(connections[:, 0], kind='mergesort')
+        self.indices = connections[order, 1]
+        self.costs = costs[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(connections[:, 0], minlength=n), out=self.indptr[1:])
+
+    @classmethod
+    def from_topology(cls, topology):
+        return cls(topology.node_ids, topology.nodes, topology.connections,
+                   topology.costs)
+
+    def __len__(self):
+        return self.coords.shape[0]
+
+    @property
+    def num_edges(self):
+        return self.indices.shape[0]
+
+    def neighbors(self, node):
+        """
+        Returns the arrays (nodes, costs) of the edges leaving node.
+        """
+        start, end = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:end], self.costs[start:end]
+
+    def edges(self):
+        """
+        Array e x 2 with the (from, to) nodes of every edge, in CSR order.
+        """
+        sources = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        return np.column_stack((sources, self.indices))
+
+    def nearest_node(self, x, y):
+        """
+        Node closest to (x, y) meters, the first one on ties like the C++
+        planners. Returns -1 for a graph without nodes.
+        """
+        if not len(self):
+            return -1
+        distances = ((self.coords - (x, y)) ** 2).sum(axis=1)
+        return int(np.argmin(distances))
+
+
+if __name__ == '__main__':
+    # Checks the adjacency of every map against its connection list and
+    # compares parsing random_1.top on each use with the cached graph
+    import os
+    import time
+    import world
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+    names = sorted(n for n in os.listdir(data_dir)
+                   if os.path.isfile(world.top_path(data_dir, n)))
+
+    for name in names:
+        topology = world.read_top(world.top_path(data_dir, name))
+        graph = TopologicalGraph.from_topology(topology)
+        expected = sorted(zip(map(tuple, topology.connections.tolist()), topology.costs.tolist()))
+        found = sorted(zip(map(tuple, graph.edges().tolist()), graph.costs.tolist()))
+        assert expected == found, name
+        for node in range(len(graph)):
+            neighbors, costs = graph.neighbors(node)
+            assert (graph.edges()[graph.indptr[node]:graph.indptr[node + 1], 1] == neighbors).all()
+
+    path = world.top_path(data_dir, 'random_1')
+    repeat = 100
+    start = time.time()
+    for _ in range(repeat):
+        TopologicalGraph.from_topology(world.read_top(path))
+    parsed_ms = (time.time() - start) * 1e3 / repeat
+
+    world.clear_cache()
+    start = time.time()
+    for _ in range(repeat):
+        graph = world.load_graph(data_dir, 'random_1')
+    cached_ms = (time.time() - start) * 1e3 / repeat
+    assert graph is world.load_graph(data_dir, 'random_1')
+
+    print('{} maps checked, random_1 ({} nodes, {} edges): parsed {:.2f} ms, '
+          'cached {:.3f} ms'.format(len(names), len(graph), graph.num_edges,
+                                    parsed_ms, cached_ms))
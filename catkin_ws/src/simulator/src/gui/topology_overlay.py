@@ -0,0 +1,148 @@
+from __future__ import division, print_function
+import base64
+import io
+from collections import OrderedDict
+from PIL import Image
+from PIL import ImageDraw
+
+NODE_COLOR = '#9C4FDB'
+TEXT_COLOR = 'darkblue'
+
+
+def render_topology(coords, node_ids, connections, size):
+    """
+    Transparent image of size (width, height) with every node and connection
+    of a topological map. coords are the node positions in canvas pixels,
+    connections index them.
+    """
+    image = Image.new('RGBA', size)
+    draw = ImageDraw.Draw(image)
+    for (x, y), node_id in zip(coords, node_ids):
+        draw.ellipse((x - 3, y - 3, x + 3, y + 3), outline=NODE_COLOR, fill=NODE_COLOR)
+        draw.text((x, y + 2), fill=TEXT_COLOR, text=str(node_id))
+    for c1, c2 in connections:
+        draw.line((coords[c1][0], coords[c1][1], coords[c2][0], coords[c2][1]), fill=NODE_COLOR)
+    return image
+
+
+def render_path(coords, path, size):
+    """
+    Transparent image of size (width, height) with the nodes of path joined
+    in order and numbered by their position in it.
+    """
+    image = Image.new('RGBA', size)
+    draw = ImageDraw.Draw(image)
+    previous = None
+    for sequence, node in enumerate(path):
+        x, y = coords[node]
+        draw.ellipse((x - 3, y - 3, x + 3, y + 3), outline=NODE_COLOR, fill=NODE_COLOR)
+        draw.text((x, y + 2), fill=TEXT_COLOR, text=str(sequence))
+        if previous is not None:
+            draw.line(previous + (x, y), fill=NODE_COLOR)
+        previous = (x, y)
+    return image
+
+
+def photo_data(image):
+    """
+    Encodes an image as the base64 PNG that Tk's PhotoImage(data=...) reads,
+    without going through a file.
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue())
+
+
+class OverlayCache(object):
+    """
+    Least recently used cache of encoded overlays. Keys are anything hashable
+    describing what was drawn (map, canvas size, highlighted path...), values
+    the data returned by photo_data. Entries are evicted once the data held
+    goes over max_bytes.
+    """
+
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, render):
+        """
+        Returns the data of key, calling render() to get the image when it
+        isn't cached.
+        """
+        data = self.entries.pop(key, None)
+        if data is not None:
+            self.hits = self.hits + 1
+            self.entries[key] = data
+            return data
+
+        self.misses = self.misses + 1
+        data = photo_data(render())
+        self.entries[key] = data
+        self.size = self.size + len(data)
+        # The newest entry is kept even if it alone is over the bound
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size = self.size - len(evicted)
+        return data
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+if __name__ == '__main__':
+    # Compares the display of the random_1 topological map through a PNG file,
+    # the way the GUI did it, with the cache
+    import os
+    import tempfile
+    import time
+    from world import load_topology
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+    topology = load_topology(data_dir, 'random_1')
+    size = (400, 500)
+    coords = [(x * 400, 500 - y * 500) for x, y in topology.nodes.tolist()]
+    node_ids = topology.node_ids.tolist()
+    connections = topology.connections.tolist()
+    repeat = 50
+
+    path = os.path.join(tempfile.mkdtemp(), 'nodes.png')
+    start = time.time()
+    for _ in range(repeat):
+        render_topology(coords, node_ids, connections, size).save(path)
+        with open(path, 'rb') as png:
+            file_data = base64.b64encode(png.read())
+    file_ms = (time.time() - start) * 1e3 / repeat
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+    cache = OverlayCache()
+    key = ('random_1', size, None)
+    start = time.time()
+    for _ in range(repeat):
+        data = cache.get(key, lambda: render_topology(coords, node_ids, connections, size))
+    cached_ms = (time.time() - start) * 1e3 / repeat
+
+    assert data == file_data
+    assert (cache.hits, cache.misses) == (repeat - 1, 1)
+
+    # Paths are evicted oldest first once the bound is reached
+    cache = OverlayCache(max_bytes=3 * len(cache.get(('random_1', size, (0, 1, 2)),
+                                                  lambda: render_path(coords, (0, 1, 2), size))))
+    for i in range(10):
+        cache.get(('random_1', size, (i, i + 1)), lambda: render_path(coords, (i, i + 1), size))
+    assert len(cache) <= 3 and cache.size <= cache.max_bytes
+    assert ('random_1', size, (9, 10)) in cache and ('random_1', size, (0, 1)) not in cache
+
+    print('random_1 overlay: through a file {:.2f} ms, cached {:.3f} ms, {} bytes'
+          .format(file_ms, cached_ms, len(data)))
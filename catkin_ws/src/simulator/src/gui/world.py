@@ -0,0 +1,320 @@
+from __future__ import division, print_function
+import os
+import numpy as np
+from raycasting import RayCaster
+from bvh import PolygonBVH
+from topological_graph import TopologicalGraph
+from occupancy_grid import OccupancyGrid
+from world_binary import read_binary, write_binary
+
+# Parsed maps, map name -> ((source file, modification time), World or Topology)
+_worlds = {}
+_topologies = {}
+# Graphs, map name -> (Topology they were built from, TopologicalGraph)
+_graphs = {}
+
+
+class World(object):
+    """
+    Geometry of a map in meters, independent of the canvas size:
+
+        width, height -> Dimensions of the map
+        polygons      -> List of arrays k x 2 with the vertexes of each
+                         obstacle, the last vertex repeats the first one
+        boxes         -> Array n x 4, [min_x, min_y, max_x, max_y] of each
+                         polygon
+        obstacles     -> PolygonBVH over the polygons
+        ray_caster    -> RayCaster using the same BVH as index
+        grids         -> OccupancyGrids built by grid(), by resolution
+
+    Drawing on the canvas only needs the scaling done by to_canvas, so one
+    World can be shared by every canvas size and every map switch.
+    """
+
+    def __init__(self, width=1.0, height=1.0, polygons=()):
+        self.width = float(width)
+        self.height = float(height)
+        self.obstacles = PolygonBVH(polygons)
+        self.polygons = self.obstacles.polygons
+        self.boxes = self.obstacles.polygon_boxes
+        self.ray_caster = RayCaster(self.polygons, index=self.obstacles)
+        self.grids = {}
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def grid(self, resolution=0.01):
+        """
+        Returns the OccupancyGrid (with its distance field) of the map at the
+        given resolution in meters, rasterized only the first time.
+        """
+        grid = self.grids.get(resolution)
+        if grid is None:
+            grid = OccupancyGrid(self.width, self.height, self.polygons, resolution)
+            self.grids[resolution] = grid
+        return grid
+
+    def scale(self, canvasX, canvasY):
+        """
+        Factors from meters to canvas pixels along x and y.
+        """
+        return canvasX / self.width, canvasY / self.height
+
+    def to_canvas(self, canvasX, canvasY):
+        """
+        Returns the polygons in canvas pixels with y pointing up, the frame
+        MobileRobotSimulator does its geometry in. Canvas drawing coordinates
+        are (x, canvasY - y).
+        """
+        scale = np.array(self.scale(canvasX, canvasY))
+        return [p * scale for p in self.polygons]
+
+
+class Topology(object):
+    """
+    Nodes and connections of the topological map (.top file) of a map:
+
+        node_ids    -> Array n with the id of each node
+        nodes       -> Array n x 2 with the node positions in meters
+        connections -> Array c x 2 with the node ids of each connection
+        costs       -> Array c with the cost of each connection
+    """
+
+    def __init__(self, node_ids=(), nodes=(), connections=(), costs=()):
+        self.node_ids = np.asarray(node_ids, dtype=np.int64).reshape(-1)
+        self.nodes = np.asarray(nodes, dtype=np.float64).reshape(-1, 2)
+        self.connections = np.asarray(connections, dtype=np.int64).reshape(-1, 2)
+        self.costs = np.asarray(costs, dtype=np.float64).reshape(-1)
+
+    def __len__(self):
+        return self.nodes.shape[0]
+
+
+def read_wrl(path):
+    """
+    Reads a .wrl file and returns its width, height and list of polygons.
+
+    Lines that matter have the form
+
+        ( dimensions name width height )
+        ( polygon type name x1 y1 x2 y2 ... xn yn )
+
+    everything else is treated as a comment.
+    """
+    width = height = 1.0
+    polygons = []
+    with open(path, 'r') as map_file:
+        for line in map_file:
+            words = line.split()
+            if words and words[0] == "(":
+                if words[1] == "dimensions":
+                    width = float(words[3])
+                    height = float(words[4])
+                elif words[1] == "polygon":
+                    vertexes = np.array(words[4:len(words) - 1], dtype=np.float64)
+                    vertexes = vertexes[:vertexes.shape[0] // 2 * 2].reshape(-1, 2)
+                    polygons.append(np.vstack((vertexes, vertexes[:1])))
+
+    return width, height, polygons
+
+
+def read_top(path):
+    """
+    Reads a .top file, made of lines
+
+        ( node id x y )
+        ( connection id1 id2 cost )
+    """
+    node_ids = []
+    nodes = []
+    connections = []
+    costs = []
+    with open(path, 'r') as top_file:
+        for line in top_file:
+            words = line.split()
+            if words and words[0] == "(":
+                if words[1] == "node":
+                    node_ids.append(int(words[2]))
+                    nodes.append((float(words[3]), float(words[4])))
+                elif words[1] == "connection":
+                    connections.append((int(words[2]), int(words[3])))
+                    costs.append(float(words[4]) if len(words) > 5 else 0.0)
+
+    return Topology(node_ids, nodes, connections, costs)
+
+
+def parse_wrl(path):
+    """
+    Reads a .wrl file and returns its World.
+    """
+    return World(*read_wrl(path))
+
+
+def wrl_path(data_dir, name):
+    return os.path.join(data_dir, name, name + '.wrl')
+
+
+def top_path(data_dir, name):
+    return os.path.join(data_dir, name, name + '.top')
+
+
+def binary_path(data_dir, name):
+    return os.path.join(data_dir, name, name + '.bin')
+
+
+def read_text_map(data_dir, name):
+    """
+    Returns (width, height, polygons, topology) read from the text files of
+    the map, topology is None when the map has no .top file.
+    """
+    width, height, polygons = read_wrl(wrl_path(data_dir, name))
+    path = top_path(data_dir, name)
+    topology = read_top(path) if os.path.isfile(path) else None
+    return width, height, polygons, topology
+
+
+def read_binary_map(path):
+    """
+    Same as read_text_map but from a file written by convert_map.
+    """
+    data = read_binary(path)
+    polygons = []
+    if data['num_polygons']:
+        vertexes = data['vertexes'].astype(np.float64)
+        polygons = np.split(vertexes, data['polygon_start'][1:-1].astype(np.int64))
+
+    topology = None
+    if data['has_topology']:
+        topology = Topology(data['node_ids'], data['nodes'],
+                            data['connections'], data['costs'])
+
+    return data['width'], data['height'], polygons, topology
+
+
+def convert_map(data_dir, name):
+    """
+    Writes src/data/<name>/<name>.bin from the text files of the map and
+    returns its path.
+    """
+    width, height, polygons, topology = read_text_map(data_dir, name)
+    if topology is not None:
+        topology = (topology.node_ids, topology.nodes, topology.connections,
+                    topology.costs)
+
+    path = binary_path(data_dir, name)
+    write_binary(path, width, height, polygons, topology)
+    return path
+
+
+def _source(data_dir, name, text):
+    # The binary file is used when it is at least as new as the text one,
+    # returns the file to read and its modification time
+    text_mtime = os.path.getmtime(text)
+    binary = binary_path(data_dir, name)
+    try:
+        binary_mtime = os.path.getmtime(binary)
+    except OSError:
+        return text, text_mtime
+
+    if binary_mtime >= text_mtime:
+        return binary, binary_mtime
+    return text, text_mtime
+
+
+def load_world(data_dir, name, resolution=None):
+    """
+    Returns the World of the map src/data/<name>/<name>.wrl, read from
+    <name>.bin instead when that file is up to date. When resolution is
+    given its occupancy grid is built too, see World.grid.
+
+    Worlds are cached by map name, a map already loaded is only read again
+    when its file was modified since then, so switching between known maps
+    costs a couple of os.stat calls. Raises IOError or OSError when the map
+    doesn't exist.
+    """
+    key = _source(data_dir, name, wrl_path(data_dir, name))
+
+    cached = _worlds.get(name)
+    if cached is not None and cached[0] == key:
+        world = cached[1]
+    else:
+        if key[0].endswith('.bin'):
+            world = World(*read_binary_map(key[0])[0:3])
+        else:
+            world = parse_wrl(key[0])
+        _worlds[name] = (key, world)
+
+    if resolution is not None:
+        world.grid(resolution)
+    return world
+
+
+def load_topology(data_dir, name):
+    """
+    Returns the Topology of the map src/data/<name>/<name>.top, cached and
+    read from <name>.bin the same way as load_world.
+    """
+    key = _source(data_dir, name, top_path(data_dir, name))
+
+    cached = _topologies.get(name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    topology = None
+    if key[0].endswith('.bin'):
+        topology = read_binary_map(key[0])[3]
+    if topology is None:
+        topology = read_top(top_path(data_dir, name))
+    _topologies[name] = (key, topology)
+    return topology
+
+
+def load_graph(data_dir, name):
+    """
+    Returns the TopologicalGraph of the map, built once from the Topology
+    given by load_topology and built again only when that one changes.
+    """
+    topology = load_topology(data_dir, name)
+
+    cached = _graphs.get(name)
+    if cached is not None and cached[0] is topology:
+        return cached[1]
+
+    graph = TopologicalGraph.from_topology(topology)
+    _graphs[name] = (topology, graph)
+    return graph
+
+
+def clear_cache():
+    _worlds.clear()
+    _topologies.clear()
+    _graphs.clear()
+
+
+if __name__ == '__main__':
+    import time
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'data')
+    names = sorted(n for n in os.listdir(data_dir)
+                   if os.path.isfile(wrl_path(data_dir, n)))
+
+    start = time.time()
+    for name in names:
+        load_world(data_dir, name)
+    first = time.time() - start
+
+    start = time.time()
+    for name in names:
+        load_world(data_dir, name)
+    cached = time.time() - start
+
+    for name in names:
+        world = load_world(data_dir, name)
+        assert world is _worlds[name][1]
+        for polygon, box in zip(world.polygons, world.boxes):
+            assert (polygon[0] == polygon[-1]).all()
+            assert (polygon.min(axis=0) == box[0:2]).all()
+
+    print('{} worlds: read in {:.1f} ms, from the cache in {:.3f} ms'
+          .format(len(names), first * 1e3, cached * 1e3))
@@ -0,0 +1,199 @@
+"""
+Binary companion of the .wrl and .top text files of a map, written next to
+them as src/data/<map>/<map>.bin. All the values are little endian and every
+section starts at a multiple of 8 bytes, so the file can be memory-mapped and
+each section used as an array without copying.
+
+    header           see HEADER below
+    polygon_start    uint32  [num_polygons + 1]   first vertex of each polygon
+    edge_start       uint32  [num_polygons + 1]   first edge of each polygon
+    vertexes         float32 [num_vertexes, 2]    x, y in meters, every
+                                                  polygon is closed (its last
+                                                  vertex repeats the first)
+    node_ids         int32   [num_nodes]          ids of the .top nodes
+    nodes            float32 [num_nodes, 2]       x, y in meters
+    connections      int32   [num_connections, 2] node ids of each connection
+    costs            float32 [num_connections]
+
+The edges of polygon i are the consecutive pairs of its vertexes, edge
+ids are the same ones raycasting.polygons_to_edges gives.
+"""
+from __future__ import division, print_function
+import numpy as np
+
+MAGIC = b'MRSW'
+VERSION = 1
+
+HEADER = np.dtype([('magic', 'S4'),
+                   ('version', '<u4'),
+                   ('width', '<f8'),
+                   ('height', '<f8'),
+                   ('num_polygons', '<u4'),
+                   ('num_vertexes', '<u4'),
+                   ('num_nodes', '<u4'),
+                   ('num_connections', '<u4'),
+                   ('has_topology', '<u4'),
+                   ('reserved', '<u4')])
+
+# Name, dtype and number of columns of each section, in file order
+SECTIONS = (('polygon_start', '<u4', 1),
+            ('edge_start', '<u4', 1),
+            ('vertexes', '<f4', 2),
+            ('node_ids', '<i4', 1),
+            ('nodes', '<f4', 2),
+            ('connections', '<i4', 2),
+            ('costs', '<f4', 1))
+
+
+class WorldFormatError(ValueError):
+    pass
+
+
+def _section_rows(header):
+    return {'polygon_start': int(header['num_polygons']) + 1,
+            'edge_start': int(header['num_polygons']) + 1,
+            'vertexes': int(header['num_vertexes']),
+            'node_ids': int(header['num_nodes']),
+            'nodes': int(header['num_nodes']),
+            'connections': int(header['num_connections']),
+            'costs': int(header['num_connections'])}
+
+
+def _aligned(offset):
+    return (offset + 7) // 8 * 8
+
+
+def write_binary(path, width, height, polygons, topology=None):
+    """
+    Writes a map to path.
+
+    Args:
+        width, height -> Dimensions of the map in meters
+        polygons      -> List of closed polygons, arrays k x 2 in meters
+        topology      -> Optional (node_ids, nodes, connections, costs) of
+                         the .top file of the map
+    """
+    counts = [len(p) for p in polygons]
+    polygon_start = np.zeros(len(polygons) + 1, dtype='<u4')
+    np.cumsum(counts, out=polygon_start[1:])
+    edge_start = np.zeros(len(polygons) + 1, dtype='<u4')
+    np.cumsum([max(c - 1, 0) for c in counts], out=edge_start[1:])
+
+    if polygons:
+        vertexes = np.concatenate([np.asarray(p).reshape(-1, 2) for p in polygons])
+    else:
+        vertexes = np.zeros((0, 2))
+
+    if topology is None:
+        node_ids, nodes, connections, costs = [], [], [], []
+    else:
+        node_ids, nodes, connections, costs = topology
+
+    arrays = {'polygon_start': polygon_start,
+              'edge_start': edge_start,
+              'vertexes': vertexes,
+              'node_ids': node_ids,
+              'nodes': np.reshape(nodes, (-1, 2)),
+              'connections': np.reshape(connections, (-1, 2)),
+              'costs': costs}
+
+    header = np.zeros(1, dtype=HEADER)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['width'] = width
+    header['height'] = height
+    header['num_polygons'] = len(polygons)
+    header['num_vertexes'] = vertexes.shape[0]
+    header['num_nodes'] = len(node_ids)
+    header['num_connections'] = len(costs)
+    header['has_topology'] = topology is not None
+
+    with open(path, 'wb') as out:
+        offset = HEADER.itemsize
+        out.write(header.tobytes())
+        for name, dtype, _ in SECTIONS:
+            padding = _aligned(offset) - offset
+            out.write(b'\0' * padding)
+            data = np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+            out.write(data)
+            offset += padding + len(data)
+
+
+def read_binary(path):
+    """
+    Memory-maps a file written by write_binary.
+
+    Returns:
+        Dictionary with the header fields (width, height, has_topology...)
+        and one read-only array per section
+    """
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    if data.shape[0] < HEADER.itemsize:
+        raise WorldFormatError(path + ' is too short to be a world file')
+
+    header = data[:HEADER.itemsize].view(HEADER)[0]
+    if header['magic'] != MAGIC:
+        raise WorldFormatError(path + ' is not a world file')
+    if header['version'] != VERSION:
+        raise WorldFormatError('{} has version {}, expected {}'.format(
+            path, header['version'], VERSION))
+
+    result = dict((name, header[name].item()) for name in HEADER.names)
+    result['has_topology'] = bool(result['has_topology'])
+
+    rows = _section_rows(header)
+    offset = HEADER.itemsize
+    for name, dtype, columns in SECTIONS:
+        offset = _aligned(offset)
+        size = rows[name] * columns * np.dtype(dtype).itemsize
+        if offset + size > data.shape[0]:
+            raise WorldFormatError(path + ' is truncated')
+        array = data[offset:offset + size].view(dtype)
+        result[name] = array.reshape(-1, 2) if columns == 2 else array
+        offset += size
+
+    return result
+
+
+if __name__ == '__main__':
+    # Converts every map under src/data (or the given directory) to the
+    # binary format and compares the load times of both formats
+    import argparse
+    import os
+    import time
+    import world
+
+    parser = argparse.ArgumentParser(
+        description='Converts the .wrl and .top maps to the binary format')
+    parser.add_argument('data_dir', nargs='?', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+    parser.add_argument('-n', '--repeat', type=int, default=20,
+                        help='loads used to time each format')
+    args = parser.parse_args()
+
+    def timed(function, *arguments):
+        start = time.time()
+        for _ in range(args.repeat):
+            function(*arguments)
+        return (time.time() - start) * 1e3 / args.repeat
+
+    for name in sorted(os.listdir(args.data_dir)):
+        if not os.path.isfile(world.wrl_path(args.data_dir, name)):
+            continue
+
+        path = world.convert_map(args.data_dir, name)
+        text_ms = timed(world.read_text_map, args.data_dir, name)
+        binary_ms = timed(world.read_binary_map, path)
+
+        # Both formats must describe the same map, up to float32 precision
+        text = world.read_text_map(args.data_dir, name)
+        binary = world.read_binary_map(path)
+        assert text[0:2] == binary[0:2]
+        for a, b in zip(text[2], binary[2]):
+            assert np.allclose(a, b, atol=1e-5)
+        if text[3] is not None:
+            assert np.allclose(text[3].nodes, binary[3].nodes, atol=1e-5)
+            assert (text[3].connections == binary[3].connections).all()
+
+        print('{:12s} text {:8.3f} ms  binary {:8.3f} ms  {:6.1f}x'.format(
+            name, text_ms, binary_ms, text_ms / binary_ms))
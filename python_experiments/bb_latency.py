@@ -0,0 +1,143 @@
+'''
+Round trip time of pyRobotics.BB.SendAndWait against a local stand-in of the
+blackboard, which answers every command right away with a successful response,
+time to get the responses of many commands in flight at once with SendAsync
+(when the module has it), and of a fan-out of ParallelSenders like the one of
+rules that send many commands.
+
+    python bb_latency.py [-n COMMANDS] [--inflight COMMANDS] [--senders COMMANDS]
+                         [--path PYROBOTICS_DIR]
+
+--path selects the pyRobotics package to measure (the one of clips_node by
+default), e.g. an older checkout to compare against.
+'''
+from __future__ import division, print_function
+import argparse
+import os
+import re
+import socket
+import sys
+import threading
+import time
+
+COMMAND = re.compile(r'^(?P<cmd>[A-Za-z_]+)(\s+"(?P<params>(\\.|[^"])*)")?(\s+@(?P<id>\d+))?$')
+
+
+def blackboard(port, stop):
+    # Connects to the module like the blackboard does and echoes every command
+    # back as a response with the same parameters and id, except 'ignore'
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    buffered = b''
+    while not stop.is_set():
+        data = sock.recv(4096)
+        if not data:
+            break
+        buffered += data
+        while b'\0' in buffered:
+            message, buffered = buffered.split(b'\0', 1)
+            m = COMMAND.match(message.decode().strip())
+            if not m or m.group('cmd') == 'ignore':
+                continue
+            response = '{} "{}" 1'.format(m.group('cmd'), m.group('params') or '')
+            if m.group('id'):
+                response += ' @' + m.group('id')
+            sock.sendall(response.encode() + b'\0')
+    sock.close()
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--commands', type=int, default=20)
+    parser.add_argument('--inflight', type=int, default=5000)
+    parser.add_argument('--senders', type=int, default=1000)
+    parser.add_argument('--path', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                                       'catkin_ws', 'src', 'clips_ros', 'clips_node', 'pyRobotics'))
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.path))
+    import BB
+    from Messages import Command
+
+    port = free_port()
+    stop = threading.Event()
+    BB.Initialize(port)
+    server = threading.Timer(0.2, blackboard, (port, stop))
+    server.daemon = True
+    server.start()
+    BB.Start()
+
+    times = []
+    for i in range(args.commands):
+        start = time.time()
+        response = BB.SendAndWait(Command('bench', 'command {}'.format(i)), 5000)
+        times.append((time.time() - start) * 1e3)
+        assert response is not None and response.successful and response.params == 'command {}'.format(i)
+
+    # Commands in flight at once, each one completed by a callback
+    inflight = None
+    if hasattr(BB, 'SendAsync'):
+        completed = []
+        threads = threading.active_count()
+        start = time.time()
+        pending = [BB.SendAsync(Command('bench', 'async {}'.format(i)), 5000, 1, completed.append)
+                   for i in range(args.inflight)]
+        peak_threads = threading.active_count()
+        responses = [p.Wait() for p in pending]
+        inflight = (time.time() - start) * 1e3
+        assert all(r is not None and r.params == 'async {}'.format(i) for i, r in enumerate(responses))
+        assert len(completed) == args.inflight and peak_threads == threads
+
+    # Commands without id (write_var) share the same key, each one gets the
+    # response sent for it, in order
+    if hasattr(BB, 'SendAsync'):
+        writes = [BB.SendAsync(Command('write_var', 'int var {}'.format(i)), 2000) for i in range(50)]
+        responses = [p.Wait() for p in writes]
+        assert all(r is not None and r.params == 'int var {}'.format(i) for i, r in enumerate(responses)), \
+            [r and r.params for r in responses]
+
+    # Fan-out of ParallelSenders, polled like their callers do when there is no WaitAll
+    threads = threading.active_count()
+    start = time.time()
+    senders = [BB.ParallelSender(Command('bench', 'sender {}'.format(i)), 5000) for i in range(args.senders)]
+    peak_threads = threading.active_count()
+    if hasattr(BB, 'WaitAll'):
+        responses = BB.WaitAll(senders, 10)
+    else:
+        while any(s.sending for s in senders):
+            peak_threads = max(peak_threads, threading.active_count())
+            time.sleep(0.001)
+        responses = [s.response for s in senders]
+    fan_out = (time.time() - start) * 1e3
+    assert all(r is not None and r.params == 'sender {}'.format(i) for i, r in enumerate(responses))
+    if hasattr(BB, 'AsCompleted'):
+        senders = [BB.ParallelSender(Command('bench', 'sender {}'.format(i)), 5000) for i in range(100)]
+        assert len(list(BB.AsCompleted(senders, 10))) == len(senders)
+
+    # A command without response waits the timeout of every attempt
+    start = time.time()
+    assert BB.SendAndWait(Command('ignore'), 200, 2) is None
+    timeout_ms = (time.time() - start) * 1e3
+    stop.set()
+
+    times.sort()
+    print('{} round trips: median {:.3f} ms, 90th percentile {:.3f} ms, max {:.3f} ms'.format(
+        len(times), times[len(times) // 2], times[len(times) * 9 // 10], times[-1]))
+    if inflight is not None:
+        print('{} commands in flight with SendAsync: all responses in {:.0f} ms, no extra threads'.format(
+            args.inflight, inflight))
+    print('{} ParallelSenders: all responses in {:.0f} ms, {} extra threads'.format(
+        args.senders, fan_out, peak_threads - threads))
+    print('2 attempts of 200 ms without response: {:.0f} ms'.format(timeout_ms))
+
+    # The daemon threads of pyRobotics don't stop, leave without waiting for them
+    sys.stdout.flush()
+    os._exit(0)
@@ -0,0 +1,114 @@
+'''
+Checks pyRobotics.ConnectionManager.FrameDecoder against streams of blackboard
+messages cut at random byte boundaries, and compares its throughput with the
+splitting the receiving thread did before, which had no carry-over buffer.
+
+    python frame_decoder_fuzz.py [-n ROUNDS] [--seed SEED] [--path PYROBOTICS_DIR]
+'''
+from __future__ import division, print_function
+import argparse
+import os
+import random
+import sys
+import time
+
+
+def old_split(data):
+    # Splitting of ConnectionManager.__receivingThread before FrameDecoder,
+    # every recv on its own
+    items = []
+    while data:
+        pos = data.find(b'\0')
+        if pos == -1:
+            pos = len(data)
+        items.append(data[:pos].strip())
+        data = data[pos+1:]
+    return items
+
+
+def random_message(rng):
+    # Shared variable notifications and responses like the ones the
+    # blackboard sends, with the quotes and spaces the parser cares about
+    kind = rng.randint(0, 2)
+    if kind == 0:
+        content = ' '.join(str(rng.randint(-1000, 1000)) for _ in range(rng.randint(0, 40)))
+        return 'read_var "int[] var{} {} % content % writeothers % MODULE" 1'.format(
+            rng.randint(0, 99), content)
+    if kind == 1:
+        return 'command{} "{}" {} @{}'.format(rng.randint(0, 9), 'x' * rng.randint(0, 300),
+                                              rng.randint(0, 1), rng.randint(1, 10 ** 6))
+    return '  spaced "\\"quoted\\" params"  '
+
+
+def chunks(data, rng, largest):
+    pos = 0
+    while pos < len(data):
+        size = rng.randint(1, largest)
+        yield data[pos:pos + size]
+        pos += size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--rounds', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--path', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                                       'catkin_ws', 'src', 'clips_ros', 'clips_node', 'pyRobotics'))
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.path))
+    import BB  # ConnectionManager is imported through BB, like the modules do
+    from ConnectionManager import FrameDecoder
+
+    rng = random.Random(args.seed)
+
+    # Every message arrives whole and in order however the stream is cut
+    broken = 0
+    for _ in range(args.rounds):
+        messages = [random_message(rng) for _ in range(rng.randint(1, 50))]
+        stream = b''.join(m.encode() + b'\0' for m in messages)
+        expected = [m.strip().encode() for m in messages]
+        largest = rng.choice((1, 2, 7, 64, 4096))
+        decoder = FrameDecoder()
+        received = []
+        old = []
+        for data in chunks(stream, rng, largest):
+            received.extend(decoder.Feed(data))
+            old.extend(item for item in old_split(data) if item)
+        assert received == expected, (received, expected)
+        broken += sum(1 for item in old if item not in expected)
+
+    # A message longer than the limit is dropped up to its NUL, whether it
+    # arrives in one piece or in many, and the ones around it are kept
+    for largest in (1, 5, 100, 10000):
+        decoder = FrameDecoder(maxFrameSize=64)
+        stream = b'before\0' + b'y' * 1000 + b'\0after\0' + b'z' * 65 + b'\0last\0'
+        received = []
+        for data in chunks(stream, rng, largest):
+            received.extend(decoder.Feed(data))
+        assert received == [b'before', b'after', b'last'], (largest, received)
+        assert decoder.droppedFrames == 2, (largest, decoder.droppedFrames)
+
+    # Throughput on a burst of notifications received in recv(4096) pieces
+    messages = [random_message(rng) for _ in range(20000)]
+    stream = b''.join(m.encode() + b'\0' for m in messages)
+    pieces = [stream[i:i + 4096] for i in range(0, len(stream), 4096)]
+
+    start = time.time()
+    decoder = FrameDecoder()
+    count = 0
+    for data in pieces:
+        count += len(decoder.Feed(data))
+    decoder_s = time.time() - start
+    assert count == len(messages)
+
+    start = time.time()
+    for data in pieces:
+        old_split(data)
+    old_s = time.time() - start
+
+    print('{} rounds: every message whole with FrameDecoder, {} broken fragments with the old '
+          'splitting'.format(args.rounds, broken))
+    print('{} messages ({:.1f} MB) in recv(4096) pieces: FrameDecoder {:.0f} messages/s, '
+          'old splitting {:.0f} messages/s'.format(len(messages), len(stream) / 1e6,
+                                                   len(messages) / decoder_s, len(messages) / old_s))
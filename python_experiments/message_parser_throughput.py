@@ -0,0 +1,139 @@
+'''
+Messages per second parsed by the CommandParser of pyRobotics: the single scan of
+Messages.ParseMessage against the previous chain of regular expressions
+(SharedVar.Parse, Response.Parse again, then Command.Parse). Both give the same
+result for every frame of the corpus and for random mutations of them.
+
+    python message_parser_throughput.py [--corpus FRAMES] [-n FRAMES] [--path PYROBOTICS_DIR]
+
+FRAMES is a capture of what the blackboard sent, messages separated by NUL
+characters; without it a corpus with the usual mix of shared variable
+notifications, responses and commands is generated.
+'''
+from __future__ import division, print_function
+import argparse
+import os
+import random
+import sys
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def generate_corpus(rng, count):
+    frames = []
+    for i in range(count):
+        kind = rng.random()
+        words = [rng.choice(('go', 'to', 'the', 'kitchen', 'robot', 'table'))
+                 for _ in range(rng.randint(1, 12))]
+        text = ' '.join(words)
+        if kind < 0.5:
+            frames.append('read_var "{{ string var{} \\"{}\\" }} % content % writeothers % MODULE{}" 1'.format(
+                rng.randint(0, 20), text, rng.randint(0, 9)))
+        elif kind < 0.6:
+            frames.append('read_var "{{ var pose{} {{ {} {} {} }} }}" 1 @{}'.format(
+                rng.randint(0, 5), rng.random(), rng.random(), rng.random(), i))
+        elif kind < 0.85:
+            # Quotes in params are escaped
+            text = ' '.join(words[:-1] + ['\\"' + words[-1] + '\\"'])
+            frames.append('{} "{}" {} @{}'.format(rng.choice(('say', 'mp_getclose', 'create_var', 'write_var')),
+                                                  text, rng.randint(0, 1), i))
+        elif kind < 0.95:
+            frames.append('{} "{}" @{}'.format(rng.choice(('run_file', 'assert', 'reset')), text, i))
+        else:
+            frames.append(rng.choice(('alive', 'ready 1', 'busy 0 @{}'.format(i), 'BLK alive')))
+    return frames
+
+
+def mutate(frame, rng):
+    chars = list(frame)
+    for _ in range(rng.randint(1, 3)):
+        pos = rng.randint(0, len(chars))
+        if chars and rng.random() < 0.5:
+            del chars[min(pos, len(chars) - 1)]
+        else:
+            chars.insert(pos, rng.choice(' "\\@10aZ_-{}%\t'))
+    return ''.join(chars)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus')
+    parser.add_argument('-n', '--frames', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--path', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                                       'catkin_ws', 'src', 'clips_ros', 'clips_node', 'pyRobotics'))
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.path))
+    import BB  # The modules are imported through BB, like the package does
+    from Messages import Command, Response, MessageTypes, ParseMessage
+    from SharedVariables import SharedVar
+
+    def chain_parse(data):
+        # What CommandParser did before ParseMessage
+        el = SharedVar.Parse(data)
+        if el and el.isNotification:
+            return el
+        if not el:
+            el = Response.Parse(data)
+        if el:
+            return el
+        return Command.Parse(data)
+
+    def scan_parse(data):
+        # What CommandParser does now
+        el = ParseMessage(data)
+        if el and el.type != MessageTypes.COMMAND and el.name == 'read_var':
+            el = SharedVar.FromResponse(el) or el
+        return el
+
+    def describe(el):
+        if el is None:
+            return None
+        fields = ('type', 'name', 'params', 'successful', '_id', 'isNotification', 'svType', 'size',
+                  'varName', 'data', 'report', 'subscription', 'writer')
+        return (type(el).__name__,) + tuple(getattr(el, f, None) for f in fields)
+
+    rng = random.Random(args.seed)
+    if args.corpus:
+        with open(args.corpus, 'rb') as f:
+            frames = [frame.strip().decode() for frame in f.read().split(b'\0') if frame.strip()]
+    else:
+        frames = generate_corpus(rng, args.frames)
+
+    # Failed shared variables are reported with prints, silenced while checking
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        for frame in frames:
+            assert describe(scan_parse(frame)) == describe(chain_parse(frame)), frame
+        mutations = 0
+        for _ in range(20):
+            for frame in frames[:2000]:
+                frame = mutate(frame, rng)
+                assert describe(scan_parse(frame)) == describe(chain_parse(frame)), frame
+                mutations += 1
+    finally:
+        sys.stdout = stdout
+
+    def throughput(parse, frames):
+        start = time.time()
+        for frame in frames:
+            parse(frame)
+        return len(frames) / max(time.time() - start, 1e-9)
+
+    kinds = {}
+    for frame in frames:
+        el = scan_parse(frame)
+        kind = 'invalid' if el is None else type(el).__name__
+        kinds.setdefault(kind, []).append(frame)
+
+    print('{} frames and {} mutations parsed the same way'.format(len(frames), mutations))
+    print('messages/s        chain of regular expressions   single scan')
+    for kind, group in [('all', frames)] + sorted(kinds.items()):
+        print('{:8} {:6}   {:28.0f}   {:11.0f}'.format(kind, len(group), throughput(chain_parse, group),
+                                                     throughput(scan_parse, group)))